@@ -0,0 +1,35 @@
+"""per-sheet checksums for incremental turbo ingestion
+
+Revision ID: 007_sheet_checksums
+Revises: 006_errors_fingerprint_pgcrypto
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "007_sheet_checksums"
+down_revision = "006_errors_fingerprint_pgcrypto"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Last successfully merged content per sheet.
+    # part_sha256 / shared_strings_sha256 hash the raw XLSX parts (cheap, pre-extract);
+    # content_sha256 is the extractor's normalized row checksum.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_sheet_checksums (
+            sheet_name VARCHAR(100) PRIMARY KEY,
+            part_sha256 VARCHAR(64) NOT NULL,
+            shared_strings_sha256 VARCHAR(64) NULL,
+            content_sha256 VARCHAR(64) NOT NULL,
+            row_count BIGINT NOT NULL DEFAULT 0,
+            run_id INTEGER NULL REFERENCES ingestion_runs(run_id),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS ingestion_sheet_checksums;")
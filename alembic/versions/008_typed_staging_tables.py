@@ -0,0 +1,50 @@
+"""typed staging tables for binary COPY loads
+
+Revision ID: 008_typed_staging
+Revises: 007_sheet_checksums
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "008_typed_staging"
+down_revision = "007_sheet_checksums"
+branch_labels = None
+depends_on = None
+
+
+# Column types match SHEET_TO_STAGING_TYPED in app/ingestion/load.py.
+# Numerics are float8 (Excel stores doubles); timestamps are naive and
+# converted to timestamptz by the merge, as the CSV text path does.
+TYPED_STAGING_TABLES = {
+    "ordens_fabrico_typed": [
+        "of_id TEXT", "of_data_criacao TIMESTAMP", "of_data_acabamento TIMESTAMP",
+        "of_produto_id BIGINT", "of_fase_id BIGINT", "of_data_transporte TIMESTAMP",
+    ],
+    "fases_ordem_fabrico_typed": [
+        "faseof_id TEXT", "faseof_of_id TEXT", "faseof_inicio TIMESTAMP", "faseof_fim TIMESTAMP",
+        "faseof_data_prevista DATE", "faseof_coeficiente DOUBLE PRECISION",
+        "faseof_coeficiente_x DOUBLE PRECISION", "faseof_fase_id BIGINT", "faseof_turno BIGINT",
+        "faseof_retorno BIGINT", "faseof_peso DOUBLE PRECISION", "faseof_sequencia BIGINT",
+    ],
+    "funcionarios_fase_ordem_fabrico_typed": [
+        "funcionariofaseof_faseof_id TEXT", "funcionariofaseof_funcionario_id BIGINT",
+        "funcionariofaseof_chefe BIGINT",
+    ],
+}
+
+
+def upgrade():
+    op.execute("CREATE SCHEMA IF NOT EXISTS staging")
+    for table_name, columns in TYPED_STAGING_TABLES.items():
+        op.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS staging.{table_name} (
+                {', '.join(columns)}
+            );
+        """)
+
+
+def downgrade():
+    for table_name in TYPED_STAGING_TABLES:
+        op.execute(f"DROP TABLE IF EXISTS staging.{table_name};")
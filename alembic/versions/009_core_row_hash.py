@@ -0,0 +1,39 @@
+"""row content hash on core tables for change-only merges
+
+Revision ID: 009_core_row_hash
+Revises: 008_typed_staging
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "009_core_row_hash"
+down_revision = "008_typed_staging"
+branch_labels = None
+depends_on = None
+
+# Tables merged by CoreMerger's standard path (errors use ofch_fingerprint)
+CORE_TABLES = [
+    "fases_catalogo",
+    "modelos",
+    "funcionarios",
+    "funcionarios_fases_aptos",
+    "fases_standard_modelos",
+    "ordens_fabrico",
+    "fases_ordem_fabrico",
+    "funcionarios_fase_ordem_fabrico",
+]
+
+
+def upgrade():
+    # md5 of the merged source values; NULL until a row is next written by the merge.
+    # Adding a nullable column without default is catalog-only (no rewrite),
+    # and on partitioned parents it propagates to every partition.
+    for table in CORE_TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS row_hash text;")
+
+
+def downgrade():
+    for table in CORE_TABLES:
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS row_hash;")
@@ -0,0 +1,44 @@
+"""derived phase columns written by the merge: one-time alignment of existing rows
+
+Revision ID: 010_faseof_derived_at_write
+Revises: 009_core_row_hash
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "010_faseof_derived_at_write"
+down_revision = "009_core_row_hash"
+branch_labels = None
+depends_on = None
+
+# Same expressions as app.ingestion.merge.FASEOF_DERIVED_COLUMNS (kept inline: migrations are frozen)
+DERIVED = {
+    "faseof_event_time": "COALESCE(faseof_fim, faseof_inicio, faseof_data_prevista)",
+    "faseof_duration_seconds": (
+        "CASE WHEN faseof_fim IS NOT NULL AND faseof_inicio IS NOT NULL "
+        "THEN LEAST(EXTRACT(EPOCH FROM (faseof_fim - faseof_inicio))::numeric, 99999999.99) END"
+    ),
+    "faseof_is_open": "(faseof_inicio IS NOT NULL AND faseof_fim IS NULL)",
+    "faseof_is_done": "(faseof_fim IS NOT NULL)",
+}
+
+
+def upgrade():
+    # From now on the merge writes these columns in the same INSERT/UPSERT as the row,
+    # so the post-merge UPDATE is gone. Rows written before that (or by the uncapped
+    # backfill job) are aligned once here; rows that already match are not touched.
+    cols = ", ".join(DERIVED)
+    exprs = ", ".join(DERIVED.values())
+    assignments = ", ".join(f"{col} = {expr}" for col, expr in DERIVED.items())
+    op.execute(f"""
+        UPDATE fases_ordem_fabrico
+        SET {assignments}
+        WHERE ({cols}) IS DISTINCT FROM ({exprs});
+    """)
+
+
+def downgrade():
+    # Data-only migration: values stay valid under the previous revision
+    pass
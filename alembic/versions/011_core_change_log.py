@@ -0,0 +1,37 @@
+"""change feed: business keys written per ingestion run
+
+Revision ID: 011_core_change_log
+Revises: 010_faseof_derived_at_write
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "011_core_change_log"
+down_revision = "010_faseof_derived_at_write"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One row per business key the merge inserted (I) or updated (U) in a run;
+    # unchanged rows are not logged. 'D' is reserved for writers that delete.
+    # of_id / faseof_id carry the affected order / phase so consumers need no joins.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS core_change_log (
+          run_id integer NOT NULL,
+          table_name text NOT NULL,
+          op char(1) NOT NULL CHECK (op IN ('I', 'U', 'D')),
+          business_key text[] NOT NULL,
+          of_id text,
+          faseof_id text,
+          logged_at timestamptz NOT NULL DEFAULT now()
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_change_log_run_table ON core_change_log (run_id, table_name);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_change_log_run_of ON core_change_log (run_id, of_id) WHERE of_id IS NOT NULL;")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS core_change_log;")
@@ -0,0 +1,67 @@
+"""agg_wip_current: time-invariant start-time moments + open-phase membership
+
+Revision ID: 012_wip_moments
+Revises: 011_core_change_log
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "012_wip_moments"
+down_revision = "011_core_change_log"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ages (NOW() - inicio) go stale as soon as they are written; moments of the
+    # start epoch do not. Readers derive mean/variance/min/max age from them at
+    # query time. NUMERIC keeps the sums of squared epochs exact.
+    op.execute("""
+        ALTER TABLE agg_wip_current
+          DROP COLUMN IF EXISTS sum_age_seconds,
+          DROP COLUMN IF EXISTS sum_age_sq,
+          DROP COLUMN IF EXISTS min_age_seconds,
+          DROP COLUMN IF EXISTS max_age_seconds,
+          ADD COLUMN IF NOT EXISTS sum_start_epoch numeric NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS sum_start_epoch_sq numeric NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS newest_event_time timestamptz;
+    """)
+    op.execute("""
+        COMMENT ON COLUMN agg_wip_current.oldest_event_time IS 'MIN(faseof_inicio) of the open phases in the group';
+    """)
+
+    # Open phases currently counted in agg_wip_current. Lets the change feed
+    # apply exact deltas (old contribution out, new one in) and re-derive
+    # min/max start per group through the index instead of a full GROUP BY.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS agg_wip_members (
+          faseof_id text NOT NULL,
+          fase_id integer NOT NULL,
+          produto_id integer NOT NULL,
+          start_time timestamptz NOT NULL
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_wip_members_faseof ON agg_wip_members (faseof_id);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_wip_members_group_start ON agg_wip_members (fase_id, produto_id, start_time);")
+
+    # Contents are rebuilt on the next compute (no change-feed cursor yet)
+    op.execute("DELETE FROM agg_wip_current;")
+    op.execute("DELETE FROM analytics_watermarks WHERE mv_name = 'change_feed.agg_wip_current';")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS agg_wip_members;")
+    op.execute("DELETE FROM analytics_watermarks WHERE mv_name = 'change_feed.agg_wip_current';")
+    op.execute("DELETE FROM agg_wip_current;")
+    op.execute("""
+        ALTER TABLE agg_wip_current
+          DROP COLUMN IF EXISTS sum_start_epoch,
+          DROP COLUMN IF EXISTS sum_start_epoch_sq,
+          DROP COLUMN IF EXISTS newest_event_time,
+          ADD COLUMN IF NOT EXISTS sum_age_seconds NUMERIC(15,2) NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS sum_age_sq NUMERIC(20,2) NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS min_age_seconds NUMERIC(10,2),
+          ADD COLUMN IF NOT EXISTS max_age_seconds NUMERIC(10,2);
+    """)
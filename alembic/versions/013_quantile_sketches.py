@@ -0,0 +1,97 @@
+"""quantile sketches: daily log-bucket counts of phase durations and order lead times
+
+Revision ID: 013_quantile_sketches
+Revises: 012_wip_moments
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "013_quantile_sketches"
+down_revision = "012_wip_moments"
+branch_labels = None
+depends_on = None
+
+# Bucket index with the 1% relative accuracy of app.analytics.quantile_sketch
+# (gamma = 1.01 / 0.99, values below 1 s in the lowest bucket)
+GAMMA = 1.01 / 0.99
+
+
+def bucket_sql(value_expr):
+    return f"CEIL(LN(GREATEST({value_expr}, 1.0)) / LN({GAMMA!r}))::integer"
+
+
+def upgrade():
+    # One row per non-empty bucket (see app.analytics.quantile_sketch). Merging
+    # days/products/phases is SUM(n) GROUP BY bucket; updates are additive like
+    # the agg_*_daily moments written in the same statement.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS agg_phase_duration_sketch_daily (
+          snapshot_date date NOT NULL,
+          produto_id integer NOT NULL,
+          fase_id integer NOT NULL,
+          bucket integer NOT NULL,
+          n bigint NOT NULL,
+          PRIMARY KEY (snapshot_date, produto_id, fase_id, bucket)
+        );
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS agg_order_leadtime_sketch_daily (
+          snapshot_date date NOT NULL,
+          produto_id integer NOT NULL,
+          bucket integer NOT NULL,
+          n bigint NOT NULL,
+          PRIMARY KEY (snapshot_date, produto_id, bucket)
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_phase_sketch_produto_fase ON agg_phase_duration_sketch_daily (produto_id, fase_id, snapshot_date);")
+
+    # Backfill exactly the rows the daily moments already hold: same filters,
+    # up to their watermark, and only (day, keys) with a daily stats row (the
+    # jobs may not have covered all history). Later runs add both together.
+    op.execute(f"""
+        INSERT INTO agg_phase_duration_sketch_daily (snapshot_date, produto_id, fase_id, bucket, n)
+        SELECT (fof.faseof_event_time)::date, of.of_produto_id, fof.faseof_fase_id,
+               {bucket_sql("fof.faseof_duration_seconds")}, COUNT(*)
+        FROM fases_ordem_fabrico fof
+        JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
+        WHERE fof.faseof_event_time <= (
+                SELECT last_ts FROM analytics_watermarks WHERE mv_name = 'fases_ordem_fabrico.faseof_event_time'
+              )
+          AND fof.faseof_duration_seconds > 0
+          AND of.of_produto_id IS NOT NULL
+          AND fof.faseof_fase_id IS NOT NULL
+          AND EXISTS (
+                SELECT 1 FROM agg_phase_stats_daily d
+                WHERE d.snapshot_date = (fof.faseof_event_time)::date
+                  AND d.produto_id = of.of_produto_id
+                  AND d.fase_id = fof.faseof_fase_id
+              )
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT DO NOTHING;
+    """)
+    op.execute(f"""
+        INSERT INTO agg_order_leadtime_sketch_daily (snapshot_date, produto_id, bucket, n)
+        SELECT (of.of_data_acabamento)::date, of.of_produto_id,
+               {bucket_sql("EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))")}, COUNT(*)
+        FROM ordens_fabrico of
+        WHERE of.of_data_acabamento <= (
+                SELECT last_ts FROM analytics_watermarks WHERE mv_name = 'ordens_fabrico.of_data_acabamento'
+              )
+          AND of.of_data_criacao IS NOT NULL
+          AND of.of_data_acabamento >= of.of_data_criacao
+          AND of.of_produto_id IS NOT NULL
+          AND EXISTS (
+                SELECT 1 FROM agg_order_stats_daily d
+                WHERE d.snapshot_date = (of.of_data_acabamento)::date
+                  AND d.produto_id = of.of_produto_id
+              )
+        GROUP BY 1, 2, 3
+        ON CONFLICT DO NOTHING;
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS agg_order_leadtime_sketch_daily;")
+    op.execute("DROP TABLE IF EXISTS agg_phase_duration_sketch_daily;")
@@ -0,0 +1,65 @@
+"""distinct affected orders: HyperLogLog registers per agg_quality_daily row
+
+Revision ID: 014_quality_orders_hll
+Revises: 013_quantile_sketches
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "014_quality_orders_hll"
+down_revision = "013_quantile_sketches"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sparse HLL (app.analytics.distinct_sketch): one row per non-empty register
+    # (2^12 registers, 64-bit hashtextextended of ofch_of_id). Unions across
+    # batches/days/products are MAX(rho) GROUP BY register.
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS agg_quality_orders_hll_daily (
+          snapshot_date date NOT NULL,
+          produto_id integer NOT NULL,
+          fase_avaliacao_id integer NOT NULL,
+          faseof_culpada_str varchar(100) NOT NULL,
+          register integer NOT NULL,
+          rho smallint NOT NULL,
+          PRIMARY KEY (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str, register)
+        );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_quality_hll_produto ON agg_quality_orders_hll_daily (produto_id, snapshot_date);")
+
+    # Backfill the error rows agg_quality_daily already counts: up to its
+    # watermark and only (day, keys) with a daily row, so error_count and
+    # affected_orders are built from the same rows from the start
+    op.execute("""
+        INSERT INTO agg_quality_orders_hll_daily
+          (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str, register, rho)
+        SELECT (e.ofch_event_time)::date, of.of_produto_id, e.ofch_fase_avaliacao, e.ofch_faseof_culpada,
+               (hh.h & 4095)::integer,
+               MAX(COALESCE(NULLIF(POSITION('1' IN REVERSE(((hh.h >> 12)::bit(52))::text)), 0), 53)::smallint)
+        FROM erros_ordem_fabrico e
+        JOIN ordens_fabrico of ON e.ofch_of_id = of.of_id
+        CROSS JOIN LATERAL (SELECT hashtextextended((e.ofch_of_id)::text, 0) AS h) hh
+        WHERE e.ofch_event_time <= (
+                SELECT last_ts FROM analytics_watermarks WHERE mv_name = 'erros_ordem_fabrico.ofch_event_time'
+              )
+          AND e.ofch_fase_avaliacao IS NOT NULL
+          AND of.of_produto_id IS NOT NULL
+          AND e.ofch_faseof_culpada IS NOT NULL
+          AND EXISTS (
+                SELECT 1 FROM agg_quality_daily d
+                WHERE d.snapshot_date = (e.ofch_event_time)::date
+                  AND d.produto_id = of.of_produto_id
+                  AND d.fase_avaliacao_id = e.ofch_fase_avaliacao
+                  AND d.faseof_culpada_str = e.ofch_faseof_culpada
+              )
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT DO NOTHING;
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS agg_quality_orders_hll_daily;")
@@ -0,0 +1,82 @@
+"""weekly/monthly rollup tiers of the daily aggregates and their sketches
+
+Revision ID: 015_kpi_rollup_tiers
+Revises: 014_quality_orders_hll
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "015_kpi_rollup_tiers"
+down_revision = "014_quality_orders_hll"
+branch_labels = None
+depends_on = None
+
+# Rollup table -> (key columns DDL, measure columns DDL); period_start is the
+# Monday of the week or the first day of the month
+ROLLUP_TABLES = {
+    "agg_phase_stats_rollup": (
+        "produto_id integer NOT NULL, fase_id integer NOT NULL",
+        """n bigint NOT NULL DEFAULT 0,
+           sum_duration_seconds numeric NOT NULL DEFAULT 0,
+           sum_duration_sq numeric NOT NULL DEFAULT 0,
+           min_duration_seconds numeric,
+           max_duration_seconds numeric""",
+    ),
+    "agg_order_stats_rollup": (
+        "produto_id integer NOT NULL",
+        """n bigint NOT NULL DEFAULT 0,
+           sum_leadtime_seconds numeric NOT NULL DEFAULT 0,
+           sum_leadtime_sq numeric NOT NULL DEFAULT 0,
+           on_time_count bigint NOT NULL DEFAULT 0,
+           late_count bigint NOT NULL DEFAULT 0""",
+    ),
+    "agg_quality_rollup": (
+        "produto_id integer NOT NULL, fase_avaliacao_id integer NOT NULL, faseof_culpada_str varchar(100) NOT NULL",
+        """n_errors bigint NOT NULL DEFAULT 0,
+           sum_gravidade numeric NOT NULL DEFAULT 0""",
+    ),
+    "agg_phase_duration_sketch_rollup": (
+        "produto_id integer NOT NULL, fase_id integer NOT NULL, bucket integer NOT NULL",
+        "n bigint NOT NULL",
+    ),
+    "agg_order_leadtime_sketch_rollup": (
+        "produto_id integer NOT NULL, bucket integer NOT NULL",
+        "n bigint NOT NULL",
+    ),
+    "agg_quality_orders_hll_rollup": (
+        "produto_id integer NOT NULL, fase_avaliacao_id integer NOT NULL, "
+        "faseof_culpada_str varchar(100) NOT NULL, register integer NOT NULL",
+        "rho smallint NOT NULL",
+    ),
+}
+
+
+def upgrade():
+    for table, (keys_ddl, measures_ddl) in ROLLUP_TABLES.items():
+        key_names = ", ".join(col.split()[0] for col in keys_ddl.split(", "))
+        op.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+              period text NOT NULL CHECK (period IN ('week', 'month')),
+              period_start date NOT NULL,
+              {keys_ddl},
+              {measures_ddl},
+              PRIMARY KEY (period, period_start, {key_names})
+            );
+        """)
+    # The first KpiRollups.refresh() (no rollup watermark yet) rolls up every day
+
+    # Daily tier is read by updated_at to find the rewritten days
+    op.execute("CREATE INDEX IF NOT EXISTS idx_agg_phase_updated ON agg_phase_stats_daily (updated_at);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_agg_order_updated ON agg_order_stats_daily (updated_at);")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_agg_quality_updated ON agg_quality_daily (updated_at);")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_agg_quality_updated;")
+    op.execute("DROP INDEX IF EXISTS idx_agg_order_updated;")
+    op.execute("DROP INDEX IF EXISTS idx_agg_phase_updated;")
+    for table in reversed(list(ROLLUP_TABLES)):
+        op.execute(f"DROP TABLE IF EXISTS {table};")
+    op.execute("DELETE FROM analytics_watermarks WHERE mv_name LIKE 'rollup.%';")
@@ -0,0 +1,35 @@
+"""materialized views: refresh state (inputs reflected, duration, staleness)
+
+Revision ID: 016_mv_refresh_state
+Revises: 015_kpi_rollup_tiers
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "016_mv_refresh_state"
+down_revision = "015_kpi_rollup_tiers"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # last_run_id / source_marker: change-feed run and pg_stat modification
+    # counter of the source tables the MV contents reflect
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS mv_refresh_state (
+          mv_name text PRIMARY KEY,
+          last_run_id integer,
+          source_marker bigint,
+          refreshed_at timestamptz,
+          refresh_duration_ms numeric(12,2),
+          last_checked_at timestamptz,
+          last_status text,
+          last_error text
+        );
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS mv_refresh_state;")
@@ -0,0 +1,199 @@
+"""
+Mergeable distinct-count sketches (HyperLogLog) for the daily aggregates.
+
+Each order id is hashed to 64 bits (hashtextextended in SQL): the low
+PRECISION bits pick one of M registers, and the register keeps the largest
+rho seen (1 + trailing zeros of the remaining bits). Registers are stored
+sparsely, one row per non-empty register of each aggregate row, and merging
+batches, days, products or phases is MAX(rho) GROUP BY register - so
+re-applying a batch never double counts.
+"""
+import hashlib
+import math
+from datetime import date
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# 2^12 registers: ~1.6% relative standard error
+PRECISION = 12
+M = 1 << PRECISION
+HASH_BITS = 64
+RELATIVE_STD_ERROR = 1.04 / math.sqrt(M)
+
+# Bounds returned with every estimate: +/- this many standard errors (~95%)
+BOUND_STD_ERRORS = 2
+
+# Dimensions of agg_quality_orders_hll_daily that rollups can group or filter by
+QUALITY_DIMENSIONS = ("snapshot_date", "produto_id", "fase_avaliacao_id", "faseof_culpada_str")
+
+
+def register_sql(hash_expr: str) -> str:
+    """SQL expression of the register index of a 64-bit hash."""
+    return f"({hash_expr} & {M - 1})::integer"
+
+
+def rho_sql(hash_expr: str) -> str:
+    """SQL expression of rho: 1 + trailing zeros of the bits above the register index."""
+    bits = HASH_BITS - PRECISION
+    return (
+        f"COALESCE(NULLIF(POSITION('1' IN REVERSE((({hash_expr} >> {PRECISION})::bit({bits}))::text)), 0), "
+        f"{bits + 1})::smallint"
+    )
+
+
+def hash_sql(value_expr: str) -> str:
+    """SQL expression of the 64-bit hash of a value."""
+    return f"hashtextextended(({value_expr})::text, 0)"
+
+
+def estimate(registers: int, inverse_sum: float) -> float:
+    """
+    HyperLogLog estimate from merged registers.
+
+    Args:
+        registers: Number of non-empty registers
+        inverse_sum: Sum of 2^-rho over the non-empty registers
+
+    Returns:
+        Estimated distinct count (linear counting while registers are sparse)
+    """
+    empty = M - registers
+    alpha = 0.7213 / (1 + 1.079 / M)
+    raw = alpha * M * M / (empty + inverse_sum)
+    if raw <= 2.5 * M and empty > 0:
+        return M * math.log(M / empty)
+    return raw
+
+
+def estimate_sql(registers_expr: str, inverse_sum_expr: str) -> str:
+    """SQL expression of estimate() over merged registers (e.g. COUNT(*), SUM(POWER(2, -rho)))."""
+    alpha = 0.7213 / (1 + 1.079 / M)
+    raw = f"({alpha!r} * {M * M} / ({M} - ({registers_expr}) + ({inverse_sum_expr})))"
+    return (
+        f"CASE WHEN {raw} <= {2.5 * M} AND ({registers_expr}) < {M} "
+        f"THEN {M} * LN({M}::float8 / ({M} - ({registers_expr}))) ELSE {raw} END"
+    )
+
+
+def bounds(registers: int, value: float) -> Tuple[float, float]:
+    """Approximate confidence bounds of an estimate (never below the non-empty registers)."""
+    margin = BOUND_STD_ERRORS * RELATIVE_STD_ERROR * value
+    return max(float(registers), value - margin), value + margin
+
+
+class DistinctSketch:
+    """HyperLogLog registers of one group; merge by taking the max per register."""
+
+    def __init__(self, registers: Optional[Dict[int, int]] = None):
+        self.registers: Dict[int, int] = dict(registers or {})
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int]]) -> "DistinctSketch":
+        """Build from (register, rho) rows, e.g. read from the sketch table."""
+        sketch = cls()
+        for register, rho in rows:
+            sketch.registers[register] = max(sketch.registers.get(register, 0), int(rho))
+        return sketch
+
+    def add_hash(self, hash_value: int) -> None:
+        """Add a 64-bit hash (same bit layout as register_sql / rho_sql)."""
+        hash_value &= (1 << HASH_BITS) - 1
+        register = hash_value & (M - 1)
+        rest = hash_value >> PRECISION
+        rho = (rest & -rest).bit_length() if rest else HASH_BITS - PRECISION + 1
+        self.registers[register] = max(self.registers.get(register, 0), rho)
+
+    def add(self, value: Any) -> None:
+        """Add a value, hashed in Python (not comparable with SQL-built registers)."""
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        self.add_hash(int.from_bytes(digest, "little"))
+
+    def merge(self, other: "DistinctSketch") -> "DistinctSketch":
+        for register, rho in other.registers.items():
+            self.registers[register] = max(self.registers.get(register, 0), rho)
+        return self
+
+    def estimate(self) -> float:
+        return estimate(len(self.registers), sum(2.0 ** -rho for rho in self.registers.values()))
+
+
+def quality_orders_rollup_sql(group_by: Sequence[str] = (), where_clause: str = "TRUE") -> str:
+    """
+    SELECT of merged registers per group of agg_quality_orders_hll_daily.
+
+    Output columns: group_by columns, non-empty registers, sum of 2^-rho.
+    """
+    unknown = set(group_by) - set(QUALITY_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+    groups = "".join(f"{col}, " for col in group_by)
+    final_group = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+    return f"""
+        WITH merged AS (
+            SELECT {groups}register, MAX(rho) AS rho
+            FROM agg_quality_orders_hll_daily
+            WHERE {where_clause}
+            GROUP BY {groups}register
+        )
+        SELECT {groups}COUNT(*) AS registers, SUM(POWER(2::float8, -rho)) AS inverse_sum
+        FROM merged
+        {final_group}
+    """
+
+
+def distinct_affected_orders(
+    engine: Engine,
+    start_date: date,
+    end_date: date,
+    group_by: Sequence[str] = (),
+    produto_id: Optional[int] = None,
+    fase_avaliacao_id: Optional[int] = None,
+    faseof_culpada_str: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Estimated distinct orders with errors over [start_date, end_date].
+
+    Args:
+        engine: SQLAlchemy engine
+        start_date: First day (inclusive)
+        end_date: Last day (inclusive)
+        group_by: Dimensions to roll up to (empty = one overall row)
+        produto_id: Filter by product
+        fase_avaliacao_id: Filter by evaluation phase
+        faseof_culpada_str: Filter by culprit phase
+
+    Returns:
+        One dict per group: group columns, distinct_orders (estimate),
+        distinct_orders_low / distinct_orders_high and relative_std_error
+    """
+    where_clause = "snapshot_date >= :start_date AND snapshot_date <= :end_date"
+    params: Dict[str, Any] = {"start_date": start_date, "end_date": end_date}
+    for col, value in (
+        ("produto_id", produto_id),
+        ("fase_avaliacao_id", fase_avaliacao_id),
+        ("faseof_culpada_str", faseof_culpada_str),
+    ):
+        if value is not None:
+            where_clause += f" AND {col} = :{col}"
+            params[col] = value
+
+    query = text(quality_orders_rollup_sql(group_by, where_clause))
+    with engine.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    out = []
+    for row in rows:
+        registers, inverse_sum = int(row[len(group_by)]), float(row[len(group_by) + 1] or 0)
+        if registers == 0:
+            continue
+        value = estimate(registers, inverse_sum)
+        low, high = bounds(registers, value)
+        out.append({
+            **dict(zip(group_by, row)),
+            "distinct_orders": round(value),
+            "distinct_orders_low": math.floor(low),
+            "distinct_orders_high": math.ceil(high),
+            "relative_std_error": RELATIVE_STD_ERROR,
+        })
+    return out
@@ -2,15 +2,143 @@
 Incremental aggregates computation with watermarks.
 Performance-first: only compute new data since last watermark.
 """
-from typing import Dict, Any, Optional, List
-from datetime import datetime, date
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime, date, time, timedelta
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 import structlog
 
+from app.analytics.distinct_sketch import estimate_sql, hash_sql, register_sql, rho_sql
+from app.analytics.quantile_sketch import bucket_sql
+from app.ingestion.change_feed import CHANGE_LOG_TABLE, ChangeFeed
+
 logger = structlog.get_logger()
 
 
+# Daily aggregates computed by compute_range_incremental:
+# results key -> (SQL builder, source table, alias, event-time column = watermark)
+RANGE_AGGREGATES = {
+    "phase_stats": ("_phase_stats_sql", "fases_ordem_fabrico", "fof", "faseof_event_time"),
+    "order_stats": ("_order_stats_sql", "ordens_fabrico", "of", "of_data_acabamento"),
+    "quality_stats": ("_quality_sql", "erros_ordem_fabrico", "e", "ofch_event_time"),
+}
+
+# Quantile sketches written in the same statement (same rows) as a daily aggregate
+RANGE_SKETCHES = {
+    "phase_stats": "_phase_duration_sketch_sql",
+    "order_stats": "_order_leadtime_sketch_sql",
+    "quality_stats": "_quality_orders_sketch_sql",
+}
+
+# Columns derived from the sketches, refreshed in the same transaction:
+# results key -> SQL builder over the days touched
+RANGE_DERIVED = {
+    "quality_stats": "_quality_affected_orders_sql",
+}
+
+
+# Change-feed consumer that maintains agg_wip_current
+WIP_FEED_CONSUMER = "agg_wip_current"
+
+# Open phases counted in agg_wip_current (groups need a phase and a product: both are the PK)
+WIP_MEMBERS_SELECT = """
+    SELECT fof.faseof_id, fof.faseof_fase_id, of.of_produto_id, fof.faseof_inicio
+    FROM fases_ordem_fabrico fof
+    JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
+    WHERE fof.faseof_is_open = true
+      AND fof.faseof_fase_id IS NOT NULL
+      AND of.of_produto_id IS NOT NULL
+"""
+
+# Phases touched by the pending runs (directly, or through a changed order) lose
+# their old membership rows and get their current ones; the signed difference
+# is added to the group moments. Re-applying a run is a no-op.
+WIP_DELTA_SQL = f"""
+    WITH affected AS (
+        SELECT l.faseof_id
+        FROM {CHANGE_LOG_TABLE} l
+        WHERE l.run_id = ANY(:run_ids) AND l.faseof_id IS NOT NULL
+        UNION
+        SELECT fof.faseof_id
+        FROM {CHANGE_LOG_TABLE} l
+        JOIN fases_ordem_fabrico fof ON fof.faseof_of_id = l.of_id
+        WHERE l.run_id = ANY(:run_ids) AND l.table_name = 'ordens_fabrico'
+    ),
+    removed AS (
+        DELETE FROM agg_wip_members m
+        USING affected a
+        WHERE m.faseof_id = a.faseof_id
+        RETURNING m.fase_id, m.produto_id, m.start_time, -1 AS sign
+    ),
+    added AS (
+        INSERT INTO agg_wip_members (faseof_id, fase_id, produto_id, start_time)
+        SELECT cur.* FROM ({WIP_MEMBERS_SELECT}) cur
+        JOIN affected a ON a.faseof_id = cur.faseof_id
+        RETURNING fase_id, produto_id, start_time, 1 AS sign
+    ),
+    delta AS (
+        SELECT 
+            fase_id,
+            produto_id,
+            SUM(sign) AS n,
+            SUM(sign * EXTRACT(EPOCH FROM start_time)) AS s1,
+            SUM(sign * EXTRACT(EPOCH FROM start_time) * EXTRACT(EPOCH FROM start_time)) AS s2
+        FROM (SELECT * FROM removed UNION ALL SELECT * FROM added) d
+        GROUP BY fase_id, produto_id
+    )
+    INSERT INTO agg_wip_current AS w (fase_id, produto_id, wip_count, sum_start_epoch, sum_start_epoch_sq)
+    SELECT fase_id, produto_id, n, s1, s2 FROM delta
+    ON CONFLICT (fase_id, produto_id)
+    DO UPDATE SET
+        wip_count = w.wip_count + EXCLUDED.wip_count,
+        sum_start_epoch = w.sum_start_epoch + EXCLUDED.sum_start_epoch,
+        sum_start_epoch_sq = w.sum_start_epoch_sq + EXCLUDED.sum_start_epoch_sq,
+        updated_at = now()
+    RETURNING fase_id, produto_id
+"""
+
+# Min/max start are not invertible: re-read them for the touched groups (index on members)
+WIP_EXTREMES_SQL = """
+    UPDATE agg_wip_current w
+    SET 
+        oldest_event_time = (
+            SELECT MIN(m.start_time) FROM agg_wip_members m
+            WHERE m.fase_id = w.fase_id AND m.produto_id = w.produto_id
+        ),
+        newest_event_time = (
+            SELECT MAX(m.start_time) FROM agg_wip_members m
+            WHERE m.fase_id = w.fase_id AND m.produto_id = w.produto_id
+        )
+    FROM unnest(CAST(:fase_ids AS integer[]), CAST(:produto_ids AS integer[])) AS t(fase_id, produto_id)
+    WHERE w.fase_id = t.fase_id AND w.produto_id = t.produto_id
+"""
+
+# Read-time WIP ages from the moments, over any grouping of agg_wip_current rows.
+# With n open phases, start epochs s_i and now T: mean age = T - sum(s)/n,
+# variance of age = variance of start, min age = T - max start, max age = T - min start.
+WIP_AGE_COLUMNS_SQL = """
+    SUM(wip_count) AS wip_count,
+    (SUM(wip_count) * EXTRACT(EPOCH FROM NOW()) - SUM(sum_start_epoch))
+        / NULLIF(SUM(wip_count), 0) / 3600.0 AS avg_age_hours,
+    EXTRACT(EPOCH FROM (NOW() - MAX(newest_event_time))) / 3600.0 AS min_age_hours,
+    EXTRACT(EPOCH FROM (NOW() - MIN(oldest_event_time))) / 3600.0 AS max_age_hours,
+    SQRT(GREATEST(
+        (SUM(sum_start_epoch_sq) - SUM(sum_start_epoch) * SUM(sum_start_epoch) / NULLIF(SUM(wip_count), 0))
+            / NULLIF(SUM(wip_count), 0),
+        0)) / 3600.0 AS std_age_hours
+"""
+
+
+def day_range(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+    """
+    Half-open timestamp range [start_date 00:00, end_date + 1 day 00:00).
+    
+    `col >= start AND col < end` selects the same rows as
+    `DATE(col) BETWEEN start_date AND end_date` but can use an index on col.
+    """
+    return datetime.combine(start_date, time.min), datetime.combine(end_date + timedelta(days=1), time.min)
+
+
 class IncrementalAggregates:
     """Compute incremental aggregates using watermarks."""
     
@@ -106,47 +234,24 @@ class IncrementalAggregates:
         logger.info("computing_agg_phase_stats_daily", date=snapshot_date, since=since_watermark)
         
         # Build WHERE clause for incremental
+        day_start, day_end = day_range(snapshot_date, snapshot_date)
         where_clause = """
-            DATE(fof.faseof_event_time) = :snapshot_date
-            AND fof.faseof_duration_seconds IS NOT NULL
-            AND fof.faseof_duration_seconds > 0
+            fof.faseof_event_time >= :day_start
+            AND fof.faseof_event_time < :day_end
         """
-        params = {"snapshot_date": snapshot_date}
+        params = {"snapshot_date": snapshot_date, "day_start": day_start, "day_end": day_end}
         
         if since_watermark:
             where_clause += " AND fof.faseof_event_time >= :since_watermark"
             params["since_watermark"] = since_watermark
         
-        query = text(f"""
-            INSERT INTO agg_phase_stats_daily 
-            (snapshot_date, produto_id, fase_id, n, sum_duration_seconds, sum_duration_sq, 
-             min_duration_seconds, max_duration_seconds)
-            SELECT 
-                :snapshot_date,
-                of.of_produto_id,
-                fof.faseof_fase_id,
-                COUNT(*) as n,
-                SUM(fof.faseof_duration_seconds) as sum_duration_seconds,
-                SUM(fof.faseof_duration_seconds * fof.faseof_duration_seconds) as sum_duration_sq,
-                MIN(fof.faseof_duration_seconds) as min_duration_seconds,
-                MAX(fof.faseof_duration_seconds) as max_duration_seconds
-            FROM fases_ordem_fabrico fof
-            JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
-            WHERE {where_clause}
-            GROUP BY of.of_produto_id, fof.faseof_fase_id
-            ON CONFLICT (snapshot_date, produto_id, fase_id)
-            DO UPDATE SET
-                n = agg_phase_stats_daily.n + EXCLUDED.n,
-                sum_duration_seconds = agg_phase_stats_daily.sum_duration_seconds + EXCLUDED.sum_duration_seconds,
-                sum_duration_sq = agg_phase_stats_daily.sum_duration_sq + EXCLUDED.sum_duration_sq,
-                min_duration_seconds = LEAST(agg_phase_stats_daily.min_duration_seconds, EXCLUDED.min_duration_seconds),
-                max_duration_seconds = GREATEST(agg_phase_stats_daily.max_duration_seconds, EXCLUDED.max_duration_seconds),
-                updated_at = now()
-        """)
+        query = text(self._phase_stats_sql(":snapshot_date", where_clause))
+        sketch_query = text(self._phase_duration_sketch_sql(":snapshot_date", where_clause))
         
         with self.engine.connect() as conn:
             result = conn.execute(query, params)
             rowcount = result.rowcount
+            conn.execute(sketch_query, params)
             conn.commit()
         
         logger.info("agg_phase_stats_daily_computed", date=snapshot_date, rows=rowcount)
@@ -169,51 +274,24 @@ class IncrementalAggregates:
         """
         logger.info("computing_agg_order_stats_daily", date=snapshot_date, since=since_watermark)
         
+        day_start, day_end = day_range(snapshot_date, snapshot_date)
         where_clause = """
-            DATE(of.of_data_acabamento) = :snapshot_date
-            AND of.of_data_criacao IS NOT NULL
-            AND of.of_data_acabamento IS NOT NULL
-            AND of.of_data_acabamento >= of.of_data_criacao
+            of.of_data_acabamento >= :day_start
+            AND of.of_data_acabamento < :day_end
         """
-        params = {"snapshot_date": snapshot_date}
+        params = {"snapshot_date": snapshot_date, "day_start": day_start, "day_end": day_end}
         
         if since_watermark:
             where_clause += " AND of.of_data_acabamento >= :since_watermark"
             params["since_watermark"] = since_watermark
         
-        query = text(f"""
-            INSERT INTO agg_order_stats_daily
-            (snapshot_date, produto_id, n, sum_leadtime_seconds, sum_leadtime_sq,
-             on_time_count, late_count)
-            SELECT 
-                :snapshot_date,
-                of.of_produto_id,
-                COUNT(*) as n,
-                SUM(EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))) as sum_leadtime_seconds,
-                SUM(EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao)) * 
-                    EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))) as sum_leadtime_sq,
-                COUNT(CASE WHEN of.of_data_transporte IS NOT NULL 
-                          AND of.of_data_acabamento <= of.of_data_transporte 
-                     THEN 1 END) as on_time_count,
-                COUNT(CASE WHEN of.of_data_transporte IS NOT NULL 
-                          AND of.of_data_acabamento > of.of_data_transporte 
-                     THEN 1 END) as late_count
-            FROM ordens_fabrico of
-            WHERE {where_clause}
-            GROUP BY of.of_produto_id
-            ON CONFLICT (snapshot_date, produto_id)
-            DO UPDATE SET
-                n = agg_order_stats_daily.n + EXCLUDED.n,
-                sum_leadtime_seconds = agg_order_stats_daily.sum_leadtime_seconds + EXCLUDED.sum_leadtime_seconds,
-                sum_leadtime_sq = agg_order_stats_daily.sum_leadtime_sq + EXCLUDED.sum_leadtime_sq,
-                on_time_count = agg_order_stats_daily.on_time_count + EXCLUDED.on_time_count,
-                late_count = agg_order_stats_daily.late_count + EXCLUDED.late_count,
-                updated_at = now()
-        """)
+        query = text(self._order_stats_sql(":snapshot_date", where_clause))
+        sketch_query = text(self._order_leadtime_sketch_sql(":snapshot_date", where_clause))
         
         with self.engine.connect() as conn:
             result = conn.execute(query, params)
             rowcount = result.rowcount
+            conn.execute(sketch_query, params)
             conn.commit()
         
         logger.info("agg_order_stats_daily_computed", date=snapshot_date, rows=rowcount)
@@ -236,92 +314,293 @@ class IncrementalAggregates:
         """
         logger.info("computing_agg_quality_daily", date=snapshot_date, since=since_watermark)
         
+        day_start, day_end = day_range(snapshot_date, snapshot_date)
         where_clause = """
-            DATE(e.ofch_event_time) = :snapshot_date
+            e.ofch_event_time >= :day_start
+            AND e.ofch_event_time < :day_end
         """
-        params = {"snapshot_date": snapshot_date}
+        params = {"snapshot_date": snapshot_date, "day_start": day_start, "day_end": day_end}
         
         if since_watermark:
             where_clause += " AND e.ofch_event_time >= :since_watermark"
             params["since_watermark"] = since_watermark
         
-        query = text(f"""
+        query = text(self._quality_sql(":snapshot_date", where_clause))
+        sketch_query = text(self._quality_orders_sketch_sql(":snapshot_date", where_clause))
+        derived_query = text(self._quality_affected_orders_sql("snapshot_date = :snapshot_date"))
+        
+        with self.engine.connect() as conn:
+            result = conn.execute(query, params)
+            rowcount = result.rowcount
+            conn.execute(sketch_query, params)
+            conn.execute(derived_query, params)
+            conn.commit()
+        
+        logger.info("agg_quality_daily_computed", date=snapshot_date, rows=rowcount)
+        return rowcount
+    
+    @staticmethod
+    def _phase_stats_sql(day_expr: str, where_clause: str) -> str:
+        """Upsert of agg_phase_stats_daily grouped by day_expr (a parameter or a per-row day)."""
+        return f"""
+            INSERT INTO agg_phase_stats_daily 
+            (snapshot_date, produto_id, fase_id, n, sum_duration_seconds, sum_duration_sq, 
+             min_duration_seconds, max_duration_seconds)
+            SELECT 
+                {day_expr},
+                of.of_produto_id,
+                fof.faseof_fase_id,
+                COUNT(*) as n,
+                SUM(fof.faseof_duration_seconds) as sum_duration_seconds,
+                SUM(fof.faseof_duration_seconds * fof.faseof_duration_seconds) as sum_duration_sq,
+                MIN(fof.faseof_duration_seconds) as min_duration_seconds,
+                MAX(fof.faseof_duration_seconds) as max_duration_seconds
+            FROM fases_ordem_fabrico fof
+            JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
+            WHERE {where_clause}
+              AND fof.faseof_duration_seconds IS NOT NULL
+              AND fof.faseof_duration_seconds > 0
+            GROUP BY 1, 2, 3
+            ON CONFLICT (snapshot_date, produto_id, fase_id)
+            DO UPDATE SET
+                n = agg_phase_stats_daily.n + EXCLUDED.n,
+                sum_duration_seconds = agg_phase_stats_daily.sum_duration_seconds + EXCLUDED.sum_duration_seconds,
+                sum_duration_sq = agg_phase_stats_daily.sum_duration_sq + EXCLUDED.sum_duration_sq,
+                min_duration_seconds = LEAST(agg_phase_stats_daily.min_duration_seconds, EXCLUDED.min_duration_seconds),
+                max_duration_seconds = GREATEST(agg_phase_stats_daily.max_duration_seconds, EXCLUDED.max_duration_seconds),
+                updated_at = now()
+        """
+    
+    @staticmethod
+    def _order_stats_sql(day_expr: str, where_clause: str) -> str:
+        """Upsert of agg_order_stats_daily grouped by day_expr."""
+        return f"""
+            INSERT INTO agg_order_stats_daily
+            (snapshot_date, produto_id, n, sum_leadtime_seconds, sum_leadtime_sq,
+             on_time_count, late_count)
+            SELECT 
+                {day_expr},
+                of.of_produto_id,
+                COUNT(*) as n,
+                SUM(EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))) as sum_leadtime_seconds,
+                SUM(EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao)) * 
+                    EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))) as sum_leadtime_sq,
+                COUNT(CASE WHEN of.of_data_transporte IS NOT NULL 
+                          AND of.of_data_acabamento <= of.of_data_transporte 
+                     THEN 1 END) as on_time_count,
+                COUNT(CASE WHEN of.of_data_transporte IS NOT NULL 
+                          AND of.of_data_acabamento > of.of_data_transporte 
+                     THEN 1 END) as late_count
+            FROM ordens_fabrico of
+            WHERE {where_clause}
+              AND of.of_data_criacao IS NOT NULL
+              AND of.of_data_acabamento IS NOT NULL
+              AND of.of_data_acabamento >= of.of_data_criacao
+            GROUP BY 1, 2
+            ON CONFLICT (snapshot_date, produto_id)
+            DO UPDATE SET
+                n = agg_order_stats_daily.n + EXCLUDED.n,
+                sum_leadtime_seconds = agg_order_stats_daily.sum_leadtime_seconds + EXCLUDED.sum_leadtime_seconds,
+                sum_leadtime_sq = agg_order_stats_daily.sum_leadtime_sq + EXCLUDED.sum_leadtime_sq,
+                on_time_count = agg_order_stats_daily.on_time_count + EXCLUDED.on_time_count,
+                late_count = agg_order_stats_daily.late_count + EXCLUDED.late_count,
+                updated_at = now()
+        """
+    
+    @staticmethod
+    def _quality_sql(day_expr: str, where_clause: str) -> str:
+        """
+        Upsert of agg_quality_daily grouped by day_expr.
+
+        affected_orders_count is not written here: a distinct count cannot be
+        merged across batches, so it is set from the HLL registers by
+        _quality_affected_orders_sql once the sketch is upserted.
+        """
+        return f"""
             INSERT INTO agg_quality_daily
             (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str,
-             n_errors, sum_gravidade, affected_orders_count)
+             n_errors, sum_gravidade)
             SELECT 
-                :snapshot_date,
+                {day_expr},
                 of.of_produto_id,
                 e.ofch_fase_avaliacao,
                 e.ofch_faseof_culpada,  -- String, não FK
                 COUNT(*) as n_errors,
-                SUM(e.ofch_gravidade) as sum_gravidade,
-                COUNT(DISTINCT e.ofch_of_id) as affected_orders_count
+                SUM(e.ofch_gravidade) as sum_gravidade
             FROM erros_ordem_fabrico e
             JOIN ordens_fabrico of ON e.ofch_of_id = of.of_id
             WHERE {where_clause}
               AND e.ofch_fase_avaliacao IS NOT NULL
-            GROUP BY of.of_produto_id, e.ofch_fase_avaliacao, e.ofch_faseof_culpada
+            GROUP BY 1, 2, 3, 4
             ON CONFLICT (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str)
             DO UPDATE SET
                 n_errors = agg_quality_daily.n_errors + EXCLUDED.n_errors,
                 sum_gravidade = agg_quality_daily.sum_gravidade + EXCLUDED.sum_gravidade,
-                affected_orders_count = GREATEST(agg_quality_daily.affected_orders_count, EXCLUDED.affected_orders_count),
                 updated_at = now()
-        """)
-        
-        with self.engine.connect() as conn:
-            result = conn.execute(query, params)
-            rowcount = result.rowcount
-            conn.commit()
-        
-        logger.info("agg_quality_daily_computed", date=snapshot_date, rows=rowcount)
-        return rowcount
+        """
+    
+    @staticmethod
+    def _phase_duration_sketch_sql(day_expr: str, where_clause: str) -> str:
+        """Upsert of phase-duration sketch buckets (same rows as _phase_stats_sql)."""
+        return f"""
+            INSERT INTO agg_phase_duration_sketch_daily
+            (snapshot_date, produto_id, fase_id, bucket, n)
+            SELECT 
+                {day_expr},
+                of.of_produto_id,
+                fof.faseof_fase_id,
+                {bucket_sql("fof.faseof_duration_seconds")},
+                COUNT(*)
+            FROM fases_ordem_fabrico fof
+            JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
+            WHERE {where_clause}
+              AND fof.faseof_duration_seconds IS NOT NULL
+              AND fof.faseof_duration_seconds > 0
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (snapshot_date, produto_id, fase_id, bucket)
+            DO UPDATE SET n = agg_phase_duration_sketch_daily.n + EXCLUDED.n
+        """
+    
+    @staticmethod
+    def _order_leadtime_sketch_sql(day_expr: str, where_clause: str) -> str:
+        """Upsert of order lead-time sketch buckets (same rows as _order_stats_sql)."""
+        return f"""
+            INSERT INTO agg_order_leadtime_sketch_daily
+            (snapshot_date, produto_id, bucket, n)
+            SELECT 
+                {day_expr},
+                of.of_produto_id,
+                {bucket_sql("EXTRACT(EPOCH FROM (of.of_data_acabamento - of.of_data_criacao))")},
+                COUNT(*)
+            FROM ordens_fabrico of
+            WHERE {where_clause}
+              AND of.of_data_criacao IS NOT NULL
+              AND of.of_data_acabamento IS NOT NULL
+              AND of.of_data_acabamento >= of.of_data_criacao
+            GROUP BY 1, 2, 3
+            ON CONFLICT (snapshot_date, produto_id, bucket)
+            DO UPDATE SET n = agg_order_leadtime_sketch_daily.n + EXCLUDED.n
+        """
+    
+    @staticmethod
+    def _quality_orders_sketch_sql(day_expr: str, where_clause: str) -> str:
+        """Upsert of affected-order HLL registers (same rows as _quality_sql); merge is MAX."""
+        return f"""
+            INSERT INTO agg_quality_orders_hll_daily
+            (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str, register, rho)
+            SELECT 
+                {day_expr},
+                of.of_produto_id,
+                e.ofch_fase_avaliacao,
+                e.ofch_faseof_culpada,
+                {register_sql("hh.h")},
+                MAX({rho_sql("hh.h")})
+            FROM erros_ordem_fabrico e
+            JOIN ordens_fabrico of ON e.ofch_of_id = of.of_id
+            CROSS JOIN LATERAL (SELECT {hash_sql("e.ofch_of_id")} AS h) hh
+            WHERE {where_clause}
+              AND e.ofch_fase_avaliacao IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+            ON CONFLICT (snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str, register)
+            DO UPDATE SET rho = GREATEST(agg_quality_orders_hll_daily.rho, EXCLUDED.rho)
+        """
+    
+    @staticmethod
+    def _quality_affected_orders_sql(day_where: str) -> str:
+        """Set affected_orders_count of the days in day_where from the merged HLL registers."""
+        return f"""
+            UPDATE agg_quality_daily q
+            SET affected_orders_count = h.estimate
+            FROM (
+                SELECT snapshot_date, produto_id, fase_avaliacao_id, faseof_culpada_str,
+                       ROUND({estimate_sql("COUNT(*)", "SUM(POWER(2::float8, -rho))")})::integer AS estimate
+                FROM agg_quality_orders_hll_daily
+                WHERE {day_where}
+                GROUP BY 1, 2, 3, 4
+            ) h
+            WHERE q.snapshot_date = h.snapshot_date
+              AND q.produto_id = h.produto_id
+              AND q.fase_avaliacao_id = h.fase_avaliacao_id
+              AND q.faseof_culpada_str = h.faseof_culpada_str
+              AND q.affected_orders_count IS DISTINCT FROM h.estimate
+        """
     
     def compute_agg_wip_current(self) -> int:
         """
-        Compute current WIP aggregate (incremental).
+        Bring the current WIP aggregate up to date (incremental).
+        
+        agg_wip_current stores time-invariant moments of the open phases'
+        start times, so it only changes when phases open or close, never
+        with the clock. Runs not yet applied are read from the change feed
+        and only the phases they touched are re-evaluated; the first call
+        (no cursor yet) does a full rebuild.
         
         Returns:
-            Number of rows inserted/updated
+            Number of (fase, produto) groups inserted/updated
         """
         logger.info("computing_agg_wip_current")
         
-        query = text("""
-            INSERT INTO agg_wip_current
-            (fase_id, produto_id, wip_count, sum_age_seconds, sum_age_sq,
-             min_age_seconds, max_age_seconds, oldest_event_time)
-            SELECT 
-                fof.faseof_fase_id,
-                of.of_produto_id,
-                COUNT(*) as wip_count,
-                SUM(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio))) as sum_age_seconds,
-                SUM(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio)) * 
-                    EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio))) as sum_age_sq,
-                MIN(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio))) as min_age_seconds,
-                MAX(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio))) as max_age_seconds,
-                MIN(fof.faseof_inicio) as oldest_event_time
-            FROM fases_ordem_fabrico fof
-            JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
-            WHERE fof.faseof_is_open = true
-            GROUP BY fof.faseof_fase_id, of.of_produto_id
-            ON CONFLICT (fase_id, produto_id)
-            DO UPDATE SET
-                wip_count = EXCLUDED.wip_count,
-                sum_age_seconds = EXCLUDED.sum_age_seconds,
-                sum_age_sq = EXCLUDED.sum_age_sq,
-                min_age_seconds = EXCLUDED.min_age_seconds,
-                max_age_seconds = EXCLUDED.max_age_seconds,
-                oldest_event_time = EXCLUDED.oldest_event_time,
-                updated_at = now()
-        """)
+        feed = ChangeFeed(engine=self.engine)
+        if feed.last_consumed(WIP_FEED_CONSUMER) is None:
+            return self.rebuild_agg_wip_current()
+        
+        run_ids = feed.pending_runs(WIP_FEED_CONSUMER)
+        if not run_ids:
+            logger.info("agg_wip_current_computed", rows=0, runs=0)
+            return 0
         
         with self.engine.connect() as conn:
-            result = conn.execute(query)
+            touched = conn.execute(text(WIP_DELTA_SQL), {"run_ids": run_ids}).fetchall()
+            if touched:
+                conn.execute(text(WIP_EXTREMES_SQL), {
+                    "fase_ids": [row[0] for row in touched],
+                    "produto_ids": [row[1] for row in touched],
+                })
+                conn.execute(text("DELETE FROM agg_wip_current WHERE wip_count <= 0"))
+            conn.commit()
+        feed.mark_consumed(WIP_FEED_CONSUMER, run_ids[-1])
+        
+        logger.info("agg_wip_current_computed", rows=len(touched), runs=len(run_ids))
+        return len(touched)
+    
+    def rebuild_agg_wip_current(self) -> int:
+        """
+        Rebuild the current WIP aggregate and its membership from scratch.
+        
+        Also resets the change-feed cursor to the latest logged run. Use after
+        writes that bypass the change feed.
+        
+        Returns:
+            Number of (fase, produto) groups written
+        """
+        with self.engine.connect() as conn:
+            last_run_id = conn.execute(text(f"SELECT MAX(run_id) FROM {CHANGE_LOG_TABLE}")).scalar()
+            conn.execute(text("TRUNCATE agg_wip_members"))
+            conn.execute(text(f"""
+                INSERT INTO agg_wip_members (faseof_id, fase_id, produto_id, start_time)
+                {WIP_MEMBERS_SELECT}
+            """))
+            conn.execute(text("DELETE FROM agg_wip_current"))
+            result = conn.execute(text("""
+                INSERT INTO agg_wip_current
+                (fase_id, produto_id, wip_count, sum_start_epoch, sum_start_epoch_sq,
+                 oldest_event_time, newest_event_time)
+                SELECT 
+                    fase_id,
+                    produto_id,
+                    COUNT(*),
+                    SUM(EXTRACT(EPOCH FROM start_time)),
+                    SUM(EXTRACT(EPOCH FROM start_time) * EXTRACT(EPOCH FROM start_time)),
+                    MIN(start_time),
+                    MAX(start_time)
+                FROM agg_wip_members
+                GROUP BY fase_id, produto_id
+            """))
             rowcount = result.rowcount
             conn.commit()
+        ChangeFeed(engine=self.engine).mark_consumed(WIP_FEED_CONSUMER, last_run_id or 0)
         
-        logger.info("agg_wip_current_computed", rows=rowcount)
+        logger.info("agg_wip_current_rebuilt", rows=rowcount)
         return rowcount
     
     def compute_all_incremental(
@@ -372,6 +651,122 @@ class IncrementalAggregates:
         
         return results
     
+    def compute_range_incremental(
+        self,
+        start_date: date,
+        end_date: date,
+        run_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Compute all aggregates for every day in [start_date, end_date].
+        
+        One statement per daily aggregate covers the whole window: it reads the
+        half-open event-time range (index range scan), groups by day, upserts,
+        and advances the source watermark in the same statement. Only rows
+        after the current watermark are aggregated, and the watermark never
+        moves backwards, so re-running a window does not double count.
+        
+        Args:
+            start_date: First day (inclusive)
+            end_date: Last day (inclusive)
+            run_id: Optional run ID
+        
+        Returns:
+            Rows inserted/updated per aggregate
+        """
+        range_start, range_end = day_range(start_date, end_date)
+        results = {}
+        
+        for key, (builder, table, alias, column) in RANGE_AGGREGATES.items():
+            sketch_builder = RANGE_SKETCHES.get(key)
+            derived_builder = RANGE_DERIVED.get(key)
+            rowcount, watermark = self._compute_range(
+                getattr(self, builder), table, alias, column, range_start, range_end, run_id,
+                getattr(self, sketch_builder) if sketch_builder else None,
+                getattr(self, derived_builder) if derived_builder else None
+            )
+            results[key] = rowcount
+            logger.info(
+                "agg_range_computed",
+                aggregate=key,
+                start=start_date,
+                end=end_date,
+                rows=rowcount,
+                watermark=watermark
+            )
+        
+        results["wip_current"] = self.compute_agg_wip_current()
+        return results
+    
+    def _compute_range(
+        self,
+        build_sql,
+        table: str,
+        alias: str,
+        column: str,
+        range_start: datetime,
+        range_end: datetime,
+        run_id: Optional[int],
+        build_sketch_sql=None,
+        build_derived_sql=None
+    ) -> Tuple[int, Optional[datetime]]:
+        """Run one range aggregate (+ its sketch and derived columns) + watermark update; returns (rows upserted, watermark)."""
+        mv_name = f"{table}.{column}"
+        event_col = f"{alias}.{column}"
+        where_clause = f"""
+            {event_col} >= :range_start
+            AND {event_col} < :range_end
+            AND {event_col} > COALESCE(
+                (SELECT last_ts FROM analytics_watermarks WHERE mv_name = :mv_name), '-infinity'
+            )
+        """
+        day_expr = f"({event_col})::date"
+        sketched = f"""
+            sketched AS (
+                {build_sketch_sql(day_expr, where_clause)}
+                RETURNING 1
+            ),""" if build_sketch_sql else ""
+        # Data-modifying CTEs share one snapshot: the watermark is the max
+        # event time of exactly the range the upsert (and sketch) read
+        query = text(f"""
+            WITH upserted AS (
+                {build_sql(day_expr, where_clause)}
+                RETURNING 1
+            ),{sketched}
+            seen AS (
+                SELECT MAX({column}) AS last_ts
+                FROM {table}
+                WHERE {column} >= :range_start AND {column} < :range_end
+            ),
+            watermark AS (
+                INSERT INTO analytics_watermarks (mv_name, last_ts, last_run_id)
+                SELECT :mv_name, last_ts, :run_id FROM seen WHERE last_ts IS NOT NULL
+                ON CONFLICT (mv_name)
+                DO UPDATE SET
+                    last_ts = GREATEST(analytics_watermarks.last_ts, EXCLUDED.last_ts),
+                    last_run_id = COALESCE(EXCLUDED.last_run_id, analytics_watermarks.last_run_id),
+                    updated_at = now()
+                RETURNING last_ts
+            )
+            SELECT (SELECT COUNT(*) FROM upserted), (SELECT last_ts FROM watermark)
+        """)
+        
+        with self.engine.connect() as conn:
+            row = conn.execute(query, {
+                "range_start": range_start,
+                "range_end": range_end,
+                "mv_name": mv_name,
+                "run_id": run_id,
+            }).fetchone()
+            if build_derived_sql:
+                # A separate statement (CTEs do not see each other's writes),
+                # committed together with the upsert
+                conn.execute(text(build_derived_sql(
+                    "snapshot_date >= CAST(:range_start AS date) AND snapshot_date < CAST(:range_end AS date)"
+                )), {"range_start": range_start, "range_end": range_end})
+            conn.commit()
+        return int(row[0]), row[1]
+    
     def _get_max_timestamp(
         self,
         table: str,
@@ -379,14 +774,15 @@ class IncrementalAggregates:
         snapshot_date: date
     ) -> Optional[datetime]:
         """Get max timestamp for a date."""
+        day_start, day_end = day_range(snapshot_date, snapshot_date)
         query = text(f"""
             SELECT MAX({column})
             FROM {table}
-            WHERE DATE({column}) = :snapshot_date
+            WHERE {column} >= :day_start AND {column} < :day_end
         """)
         
         with self.engine.connect() as conn:
-            result = conn.execute(query, {"snapshot_date": snapshot_date})
+            result = conn.execute(query, {"day_start": day_start, "day_end": day_end})
             row = result.fetchone()
             return row[0] if row and row[0] else None
 
@@ -0,0 +1,253 @@
+"""
+Change-aware, parallel refresh of the materialized views.
+
+Each MV records in mv_refresh_state the last ingestion run and the
+source-table change marker it reflects. A refresh is skipped when no run
+since then touched its sources (change feed) and the marker is unchanged
+(catches writers that bypass the feed); the others run concurrently, each
+on its own connection. Durations and staleness are kept for the API.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Sequence
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+import structlog
+
+from app.ingestion.change_feed import CHANGE_LOG_TABLE
+
+logger = structlog.get_logger()
+
+
+# MV -> (source tables, max seconds between refreshes even without changes)
+# mv_wip_by_phase_current computes ages with NOW(), so it ages on its own.
+MATERIALIZED_VIEWS = {
+    "mv_phase_durations_by_model": (("fases_ordem_fabrico", "ordens_fabrico", "modelos"), None),
+    "mv_order_leadtime_by_model": (("ordens_fabrico", "fases_ordem_fabrico", "modelos"), None),
+    "mv_quality_by_phase": (("erros_ordem_fabrico",), None),
+    "mv_wip_by_phase_current": (("fases_ordem_fabrico",), 900),
+}
+
+DEFAULT_MAX_WORKERS = 4
+
+# Rows inserted/updated/deleted in a table and its partitions since the stats
+# were last reset (not transactional; a decrease means a reset)
+SOURCE_MARKER_SQL = """
+    SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)
+    FROM pg_stat_user_tables s
+    WHERE s.relid = CAST(:table_name AS regclass)
+       OR s.relid IN (
+            SELECT i.inhrelid FROM pg_inherits i
+            WHERE i.inhparent = CAST(:table_name AS regclass)
+       )
+"""
+
+
+class MaterializedViewRefresher:
+    """Refresh only the MVs whose inputs changed, in parallel."""
+
+    def __init__(self, db_url: Optional[str] = None, engine: Optional[Engine] = None):
+        """
+        Initialize refresher.
+
+        Args:
+            db_url: Database URL (ignored when engine is given)
+            engine: Existing SQLAlchemy engine to reuse
+        """
+        self.engine = engine if engine is not None else create_engine(db_url)
+
+    def plan(self, views: Optional[Sequence[str]] = None, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Decide which MVs need a refresh.
+
+        Args:
+            views: MVs to consider (default: all)
+            force: Refresh regardless of changes
+
+        Returns:
+            {mv_name: {'refresh': bool, 'reason': str, 'run_id': int, 'marker': int}}
+        """
+        views = list(views or MATERIALIZED_VIEWS)
+        with self.engine.connect() as conn:
+            latest_run = conn.execute(text(f"SELECT MAX(run_id) FROM {CHANGE_LOG_TABLE}")).scalar()
+            markers = {
+                table: int(conn.execute(text(SOURCE_MARKER_SQL), {"table_name": table}).scalar() or 0)
+                for table in {t for mv in views for t in MATERIALIZED_VIEWS[mv][0]}
+            }
+            states = {
+                row[0]: row[1:]
+                for row in conn.execute(text("""
+                    SELECT mv_name, last_run_id, source_marker, EXTRACT(EPOCH FROM (now() - refreshed_at))
+                    FROM mv_refresh_state
+                    WHERE mv_name = ANY(:views)
+                """), {"views": views})
+            }
+            plan = {}
+            for mv in views:
+                sources, max_age = MATERIALIZED_VIEWS[mv]
+                marker = sum(markers[t] for t in sources)
+                last_run_id, last_marker, age = states.get(mv, (None, None, None))
+                reason = None
+                if force:
+                    reason = "forced"
+                elif mv not in states or age is None:
+                    reason = "never_refreshed"
+                elif self._runs_touching(conn, last_run_id, sources):
+                    reason = "ingestion_runs"
+                elif marker != last_marker:
+                    reason = "source_changed"
+                elif max_age is not None and float(age) >= max_age:
+                    reason = "max_age"
+                plan[mv] = {
+                    "refresh": reason is not None,
+                    "reason": reason or "unchanged",
+                    "run_id": latest_run,
+                    "marker": marker,
+                }
+        return plan
+
+    @staticmethod
+    def _runs_touching(conn, last_run_id: Optional[int], sources: Sequence[str]) -> bool:
+        return conn.execute(text(f"""
+            SELECT EXISTS (
+                SELECT 1 FROM {CHANGE_LOG_TABLE}
+                WHERE run_id > :last_run_id AND table_name = ANY(:sources)
+            )
+        """), {"last_run_id": last_run_id or 0, "sources": list(sources)}).scalar()
+
+    def refresh(
+        self,
+        views: Optional[Sequence[str]] = None,
+        force: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Refresh the MVs whose inputs changed, in parallel; record the outcome.
+
+        Args:
+            views: MVs to consider (default: all)
+            force: Refresh regardless of changes
+            max_workers: Concurrent refreshes (one connection each)
+
+        Returns:
+            {mv_name: {'status': 'refreshed'|'skipped'|'error', 'reason': str, 'duration_ms': float}}
+        """
+        plan = self.plan(views, force)
+        todo = [mv for mv, p in plan.items() if p["refresh"]]
+        results = {
+            mv: {"status": "skipped", "reason": p["reason"], "duration_ms": 0.0}
+            for mv, p in plan.items() if not p["refresh"]
+        }
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as pool:
+                for mv, outcome in zip(todo, pool.map(self._refresh_one, todo)):
+                    results[mv] = {"reason": plan[mv]["reason"], **outcome}
+
+        with self.engine.connect() as conn:
+            for mv, result in results.items():
+                self._record(conn, mv, plan[mv], result)
+            conn.commit()
+
+        logger.info(
+            "mvs_refreshed",
+            refreshed=[mv for mv, r in results.items() if r["status"] == "refreshed"],
+            skipped=[mv for mv, r in results.items() if r["status"] == "skipped"],
+            errors=[mv for mv, r in results.items() if r["status"] == "error"],
+        )
+        return results
+
+    def _refresh_one(self, mv: str) -> Dict[str, Any]:
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {mv}"))
+                conn.commit()
+        except Exception as e:
+            logger.error("mv_refresh_error", mv=mv, error=str(e))
+            return {"status": "error", "error": str(e), "duration_ms": (time.perf_counter() - start) * 1000}
+        return {"status": "refreshed", "started_at": started_at, "duration_ms": (time.perf_counter() - start) * 1000}
+
+    @staticmethod
+    def _record(conn, mv: str, plan: Dict[str, Any], result: Dict[str, Any]) -> None:
+        if result["status"] == "refreshed":
+            # run_id / marker were read before the refresh started: never ahead of the data
+            conn.execute(text("""
+                INSERT INTO mv_refresh_state
+                (mv_name, last_run_id, source_marker, refreshed_at, refresh_duration_ms,
+                 last_checked_at, last_status, last_error)
+                VALUES (:mv_name, :run_id, :marker, :refreshed_at, :duration_ms, now(), 'refreshed', NULL)
+                ON CONFLICT (mv_name)
+                DO UPDATE SET
+                    last_run_id = EXCLUDED.last_run_id,
+                    source_marker = EXCLUDED.source_marker,
+                    refreshed_at = EXCLUDED.refreshed_at,
+                    refresh_duration_ms = EXCLUDED.refresh_duration_ms,
+                    last_checked_at = now(),
+                    last_status = 'refreshed',
+                    last_error = NULL
+            """), {
+                "mv_name": mv,
+                "run_id": plan["run_id"],
+                "marker": plan["marker"],
+                "refreshed_at": result["started_at"],
+                "duration_ms": round(result["duration_ms"], 2),
+            })
+        elif result["status"] == "skipped":
+            # Nothing relevant changed: later runs up to now are reflected too
+            conn.execute(text("""
+                UPDATE mv_refresh_state
+                SET last_run_id = GREATEST(last_run_id, :run_id),
+                    last_checked_at = now(),
+                    last_status = 'skipped'
+                WHERE mv_name = :mv_name
+            """), {"mv_name": mv, "run_id": plan["run_id"]})
+        else:
+            conn.execute(text("""
+                INSERT INTO mv_refresh_state (mv_name, last_checked_at, last_status, last_error)
+                VALUES (:mv_name, now(), 'error', :error)
+                ON CONFLICT (mv_name)
+                DO UPDATE SET last_checked_at = now(), last_status = 'error', last_error = EXCLUDED.last_error
+            """), {"mv_name": mv, "error": result.get("error")})
+
+    def freshness(self) -> List[Dict[str, Any]]:
+        """
+        Data freshness of every MV.
+
+        Returns:
+            Per MV: last refresh time, its duration, staleness in seconds, the
+            ingestion runs logged after the run it reflects, last status
+        """
+        query = text(f"""
+            SELECT
+                v.mv_name,
+                s.refreshed_at,
+                s.refresh_duration_ms,
+                EXTRACT(EPOCH FROM (now() - s.refreshed_at)) AS staleness_seconds,
+                s.last_run_id,
+                (SELECT COUNT(DISTINCT l.run_id) FROM {CHANGE_LOG_TABLE} l
+                 WHERE l.run_id > COALESCE(s.last_run_id, 0)) AS runs_behind,
+                s.last_checked_at,
+                s.last_status,
+                s.last_error
+            FROM unnest(CAST(:views AS text[])) AS v(mv_name)
+            LEFT JOIN mv_refresh_state s ON s.mv_name = v.mv_name
+        """)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query, {"views": list(MATERIALIZED_VIEWS)}).fetchall()
+        return [
+            {
+                "mv_name": row[0],
+                "refreshed_at": row[1].isoformat() if row[1] else None,
+                "refresh_duration_ms": float(row[2]) if row[2] is not None else None,
+                "staleness_seconds": float(row[3]) if row[3] is not None else None,
+                "last_run_id": row[4],
+                "runs_behind": int(row[5] or 0),
+                "last_checked_at": row[6].isoformat() if row[6] else None,
+                "last_status": row[7],
+                "last_error": row[8],
+            }
+            for row in rows
+        ]
@@ -0,0 +1,196 @@
+"""
+Mergeable quantile sketches for the daily aggregates.
+
+Durations are stored as log-spaced bucket counts (DDSketch): a value x > 0
+falls in bucket ceil(log_gamma(x)), and every value in a bucket is within
+RELATIVE_ACCURACY of the bucket's representative value. Counts per bucket
+are plain integers, so merging sketches (days, products, phases) is a SUM
+grouped by bucket - in SQL on the agg_*_sketch_daily tables or in Python
+with QuantileSketch - and quantiles over any date window read O(days x
+buckets) rows instead of the raw events.
+"""
+import math
+from datetime import date
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Relative error of every quantile (1%): gamma = (1 + a) / (1 - a)
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+# Values below one second share the lowest bucket (durations are in seconds)
+MIN_VALUE = 1.0
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95)
+
+# Sketch tables: metric -> (table, group columns)
+SKETCH_TABLES = {
+    "phase_duration": ("agg_phase_duration_sketch_daily", ("produto_id", "fase_id")),
+    "order_leadtime": ("agg_order_leadtime_sketch_daily", ("produto_id",)),
+}
+
+
+def bucket_sql(value_expr: str) -> str:
+    """SQL expression of the bucket index of value_expr (seconds)."""
+    return f"CEIL(LN(GREATEST({value_expr}, {MIN_VALUE})) / LN({GAMMA!r}))::integer"
+
+
+def bucket_value_sql(bucket_expr: str) -> str:
+    """SQL expression of the representative value of a bucket."""
+    return f"(2 * POWER({GAMMA!r}, {bucket_expr}) / ({GAMMA!r} + 1))"
+
+
+def bucket_of(value: float) -> int:
+    """Bucket index of a value (same as bucket_sql)."""
+    return math.ceil(math.log(max(value, MIN_VALUE)) / math.log(GAMMA))
+
+
+def bucket_value(bucket: int) -> float:
+    """Representative value of a bucket (within RELATIVE_ACCURACY of every value in it)."""
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def _quantile_column(q: float) -> str:
+    return f"p{round(q * 100):d}_seconds"
+
+
+class QuantileSketch:
+    """Bucket counts of one group; merge by adding counts."""
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int]]) -> "QuantileSketch":
+        """Build from (bucket, n) rows, e.g. read from a sketch table over several days."""
+        sketch = cls()
+        for bucket, n in rows:
+            sketch.counts[bucket] = sketch.counts.get(bucket, 0) + int(n)
+        return sketch
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, value: float, n: int = 1) -> None:
+        bucket = bucket_of(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + n
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        for bucket, n in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + n
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Approximate q-quantile (0 <= q <= 1).
+
+        Returns the value at rank q * (n - 1), within RELATIVE_ACCURACY of
+        the exact order statistic; None when the sketch is empty.
+        """
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen > rank:
+                return bucket_value(bucket)
+        return bucket_value(max(self.counts))
+
+
+def window_quantiles_sql(
+    metric: str,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    where_clause: str = "TRUE",
+) -> str:
+    """
+    SELECT merging a sketch table over the rows matching where_clause.
+
+    Output columns: the metric's group columns, n, then one
+    p<NN>_seconds column per quantile (same rank rule as
+    QuantileSketch.quantile).
+    """
+    table, group_cols = SKETCH_TABLES[metric]
+    groups = ", ".join(group_cols)
+    quantile_cols = ",\n".join(
+        f"{bucket_value_sql(f'MIN(bucket) FILTER (WHERE cum_n > {q!r} * (total_n - 1))')} AS {_quantile_column(q)}"
+        for q in quantiles
+    )
+    return f"""
+        WITH merged AS (
+            SELECT {groups}, bucket, SUM(n) AS n
+            FROM {table}
+            WHERE {where_clause}
+            GROUP BY {groups}, bucket
+        ),
+        ranked AS (
+            SELECT
+                {groups},
+                bucket,
+                SUM(n) OVER (PARTITION BY {groups} ORDER BY bucket) AS cum_n,
+                SUM(n) OVER (PARTITION BY {groups}) AS total_n
+            FROM merged
+        )
+        SELECT
+            {groups},
+            MAX(total_n) AS n,
+            {quantile_cols}
+        FROM ranked
+        GROUP BY {groups}
+    """
+
+
+def window_quantiles(
+    engine: Engine,
+    metric: str,
+    start_date: date,
+    end_date: date,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    produto_id: Optional[int] = None,
+    fase_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Approximate quantiles per group over the days [start_date, end_date].
+
+    Args:
+        engine: SQLAlchemy engine
+        metric: 'phase_duration' or 'order_leadtime'
+        start_date: First day (inclusive)
+        end_date: Last day (inclusive)
+        quantiles: Quantiles to return
+        produto_id: Filter by product
+        fase_id: Filter by phase (phase_duration only)
+
+    Returns:
+        One dict per group: group columns, n and p<NN>_seconds
+    """
+    _, group_cols = SKETCH_TABLES[metric]
+    where_clause = "snapshot_date >= :start_date AND snapshot_date <= :end_date"
+    params: Dict[str, Any] = {"start_date": start_date, "end_date": end_date}
+    if produto_id is not None:
+        where_clause += " AND produto_id = :produto_id"
+        params["produto_id"] = produto_id
+    if fase_id is not None:
+        if "fase_id" not in group_cols:
+            raise ValueError(f"{metric} has no fase_id")
+        where_clause += " AND fase_id = :fase_id"
+        params["fase_id"] = fase_id
+
+    query = text(window_quantiles_sql(metric, quantiles, where_clause))
+    columns = list(group_cols) + ["n"] + [_quantile_column(q) for q in quantiles]
+    with engine.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [
+        {
+            **dict(zip(group_cols, row)),
+            "n": int(row[len(group_cols)]),
+            **{
+                col: float(value) if value is not None else None
+                for col, value in zip(columns[len(group_cols) + 1:], row[len(group_cols) + 1:])
+            },
+        }
+        for row in rows
+    ]
@@ -0,0 +1,285 @@
+"""
+Weekly and monthly rollup tiers of the daily aggregates.
+
+Every daily aggregate (moments and sketches) has a rollup table holding the
+same mergeable measures per (period, period_start, keys), for period 'week'
+(ISO, starting Monday) and 'month'. Both tiers are rolled up from the daily
+tier - weeks straddle months, so months cannot be built from weeks. Only
+the periods containing days the daily tier rewrote since the last refresh
+are re-rolled (delete + re-aggregate, so re-running is harmless).
+
+plan_window() splits a [from, to) window into whole months, whole weeks at
+the edges and single days at the very edges; window_sql() reads each piece
+from its tier and merges the measures.
+"""
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+import structlog
+
+logger = structlog.get_logger()
+
+
+PERIODS = ("week", "month")
+
+# Rollup name -> (daily table, rollup table, key columns, {measure: merge function})
+ROLLUPS = {
+    "phase_stats": (
+        "agg_phase_stats_daily", "agg_phase_stats_rollup", ("produto_id", "fase_id"),
+        {"n": "SUM", "sum_duration_seconds": "SUM", "sum_duration_sq": "SUM",
+         "min_duration_seconds": "MIN", "max_duration_seconds": "MAX"},
+    ),
+    "order_stats": (
+        "agg_order_stats_daily", "agg_order_stats_rollup", ("produto_id",),
+        {"n": "SUM", "sum_leadtime_seconds": "SUM", "sum_leadtime_sq": "SUM",
+         "on_time_count": "SUM", "late_count": "SUM"},
+    ),
+    # affected_orders_count is not mergeable: distinct orders come from the HLL tier
+    "quality_stats": (
+        "agg_quality_daily", "agg_quality_rollup", ("produto_id", "fase_avaliacao_id", "faseof_culpada_str"),
+        {"n_errors": "SUM", "sum_gravidade": "SUM"},
+    ),
+    "phase_duration_sketch": (
+        "agg_phase_duration_sketch_daily", "agg_phase_duration_sketch_rollup", ("produto_id", "fase_id", "bucket"),
+        {"n": "SUM"},
+    ),
+    "order_leadtime_sketch": (
+        "agg_order_leadtime_sketch_daily", "agg_order_leadtime_sketch_rollup", ("produto_id", "bucket"),
+        {"n": "SUM"},
+    ),
+    "quality_orders_hll": (
+        "agg_quality_orders_hll_daily", "agg_quality_orders_hll_rollup",
+        ("produto_id", "fase_avaliacao_id", "faseof_culpada_str", "register"),
+        {"rho": "MAX"},
+    ),
+}
+
+# The daily tier stamps updated_at with now() (transaction start), so an
+# upsert can commit after a refresh read a later updated_at. The stored
+# watermark stays this far behind so such rows are read again next time
+# (re-rolling a period is idempotent); longer-running aggregate
+# transactions than this are not expected.
+WATERMARK_MARGIN = timedelta(minutes=10)
+
+# Rollups that change together: the daily stats table (with updated_at) tells
+# which days were rewritten; its sketches are written by the same statement
+FAMILIES = {
+    "phase": ("agg_phase_stats_daily", ("phase_stats", "phase_duration_sketch")),
+    "order": ("agg_order_stats_daily", ("order_stats", "order_leadtime_sketch")),
+    "quality": ("agg_quality_daily", ("quality_stats", "quality_orders_hll")),
+}
+
+
+def period_start(day: date, period: str) -> date:
+    """First day of the week (Monday) or month containing day."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def next_period(start: date, period: str) -> date:
+    """First day of the following week/month."""
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def _whole_periods(start: date, end: date, period: str) -> Tuple[date, date]:
+    """Largest [first, last) inside [start, end) made of whole periods (first == last if none)."""
+    first = period_start(start, period)
+    if first < start:
+        first = next_period(first, period)
+    last = first
+    while next_period(last, period) <= end:
+        last = next_period(last, period)
+    return (first, last) if last > first else (start, start)
+
+
+def plan_window(start: date, end: date) -> List[Tuple[str, date, date]]:
+    """
+    Cover [start, end) with the coarsest tiers.
+
+    Args:
+        start: First day (inclusive)
+        end: Day after the last one (exclusive)
+
+    Returns:
+        (tier, from, to) segments in date order; tier is 'month', 'week'
+        or 'day', and [from, to) is made of whole periods of that tier
+    """
+    if end <= start:
+        return []
+    first, last = _whole_periods(start, end, "month")
+    if first == last:
+        return _plan_edge(start, end)
+    return _plan_edge(start, first) + [("month", first, last)] + _plan_edge(last, end)
+
+
+def _plan_edge(start: date, end: date) -> List[Tuple[str, date, date]]:
+    """Edges of the window: whole weeks, then single days."""
+    if end <= start:
+        return []
+    first, last = _whole_periods(start, end, "week")
+    if first == last:
+        return [("day", start, end)]
+    segments = [("day", start, first)] if start < first else []
+    segments.append(("week", first, last))
+    if last < end:
+        segments.append(("day", last, end))
+    return segments
+
+
+def window_sql(
+    name: str,
+    start: date,
+    end: date,
+    group_by: Optional[Sequence[str]] = None,
+    where_clause: str = "TRUE",
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Merged measures of a rollup over [start, end), read from the planned tiers.
+
+    Args:
+        name: Rollup name (key of ROLLUPS)
+        start: First day (inclusive)
+        end: Day after the last one (exclusive)
+        group_by: Key columns to keep (default: all keys of the rollup)
+        where_clause: Extra filter on key columns (bound parameters allowed)
+
+    Returns:
+        (SQL, params); columns are group_by then the measures in ROLLUPS order
+    """
+    daily_table, rollup_table, keys, measures = ROLLUPS[name]
+    group_by = list(keys if group_by is None else group_by)
+    unknown = set(group_by) - set(keys)
+    if unknown:
+        raise ValueError(f"Unknown keys for {name}: {sorted(unknown)}")
+
+    columns = ", ".join(list(keys) + list(measures))
+    params: Dict[str, Any] = {}
+    parts = []
+    for i, (tier, seg_from, seg_to) in enumerate(plan_window(start, end)):
+        params[f"from_{i}"], params[f"to_{i}"] = seg_from, seg_to
+        if tier == "day":
+            parts.append(f"""
+                SELECT {columns} FROM {daily_table}
+                WHERE snapshot_date >= :from_{i} AND snapshot_date < :to_{i} AND {where_clause}""")
+        else:
+            parts.append(f"""
+                SELECT {columns} FROM {rollup_table}
+                WHERE period = '{tier}' AND period_start >= :from_{i} AND period_start < :to_{i} AND {where_clause}""")
+    if not parts:
+        parts.append(f"SELECT {columns} FROM {daily_table} WHERE FALSE")
+
+    select = ", ".join(group_by + [f"{fn}({col}) AS {col}" for col, fn in measures.items()])
+    group_clause = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+    sql = f"""
+        SELECT {select}
+        FROM ({" UNION ALL ".join(parts)}) tiers
+        {group_clause}
+    """
+    return sql, params
+
+
+class KpiRollups:
+    """Keep the weekly/monthly rollup tiers in sync with the daily aggregates."""
+
+    def __init__(self, db_url: Optional[str] = None, engine: Optional[Engine] = None):
+        """
+        Initialize rollup engine.
+
+        Args:
+            db_url: Database URL (ignored when engine is given)
+            engine: Existing SQLAlchemy engine to reuse
+        """
+        self.engine = engine if engine is not None else create_engine(db_url)
+
+    def refresh(self, run_id: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Re-roll the weeks and months containing days rewritten since the last refresh.
+
+        Args:
+            run_id: Optional run ID (stored with the rollup watermark)
+
+        Returns:
+            {family: {'days': n, 'week': n, 'month': n}} periods re-rolled
+        """
+        results = {}
+        for family, (daily_table, names) in FAMILIES.items():
+            mv_name = f"rollup.{family}"
+            with self.engine.connect() as conn:
+                # One refresh per family at a time (ingestion and the worker
+                # job both refresh); released at commit
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:mv_name))"), {"mv_name": mv_name})
+                # >= : a re-roll is idempotent, a missed day is not
+                rows = conn.execute(text(f"""
+                    SELECT snapshot_date, MAX(updated_at)
+                    FROM {daily_table}
+                    WHERE updated_at >= COALESCE(
+                        (SELECT last_ts FROM analytics_watermarks WHERE mv_name = :mv_name), '-infinity'
+                    )
+                    GROUP BY snapshot_date
+                """), {"mv_name": mv_name}).fetchall()
+                days = [row[0] for row in rows]
+
+                counts = {"days": len(days)}
+                for period in PERIODS:
+                    starts = sorted({period_start(day, period) for day in days})
+                    for name in names:
+                        self._reroll(conn, name, period, starts)
+                    counts[period] = len(starts)
+
+                if rows:
+                    conn.execute(text("""
+                        INSERT INTO analytics_watermarks (mv_name, last_ts, last_run_id)
+                        VALUES (:mv_name, :last_ts, :run_id)
+                        ON CONFLICT (mv_name)
+                        DO UPDATE SET
+                            last_ts = GREATEST(analytics_watermarks.last_ts, EXCLUDED.last_ts),
+                            last_run_id = COALESCE(EXCLUDED.last_run_id, analytics_watermarks.last_run_id),
+                            updated_at = now()
+                    """), {"mv_name": mv_name, "last_ts": max(row[1] for row in rows) - WATERMARK_MARGIN, "run_id": run_id})
+                conn.commit()
+
+            results[family] = counts
+            logger.info("kpi_rollups_refreshed", family=family, **counts)
+        return results
+
+    def reroll(self, name: str, period: str, starts: Iterable[date]) -> None:
+        """Recompute given periods of one rollup from the daily tier."""
+        with self.engine.connect() as conn:
+            self._reroll(conn, name, period, sorted(set(starts)))
+            conn.commit()
+
+    @staticmethod
+    def _reroll(conn, name: str, period: str, starts: List[date]) -> None:
+        if not starts:
+            return
+        daily_table, rollup_table, keys, measures = ROLLUPS[name]
+        key_cols = ", ".join(keys)
+        measure_cols = ", ".join(measures)
+        merged = ", ".join(f"{fn}({col})" for col, fn in measures.items())
+        params = {
+            "period": period,
+            "starts": starts,
+            "range_start": starts[0],
+            "range_end": next_period(starts[-1], period),
+        }
+        conn.execute(text(f"""
+            DELETE FROM {rollup_table}
+            WHERE period = :period AND period_start = ANY(:starts)
+        """), params)
+        # Range bound keeps the daily read on the snapshot_date index
+        conn.execute(text(f"""
+            INSERT INTO {rollup_table} (period, period_start, {key_cols}, {measure_cols})
+            SELECT :period, (date_trunc(:period, snapshot_date::timestamp))::date, {key_cols}, {merged}
+            FROM {daily_table}
+            WHERE snapshot_date >= :range_start AND snapshot_date < :range_end
+              AND (date_trunc(:period, snapshot_date::timestamp))::date = ANY(:starts)
+            GROUP BY 2, {key_cols}
+        """), params)
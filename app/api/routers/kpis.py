@@ -12,6 +12,17 @@ from app.services.data_quality import get_data_quality_service
 
 router = APIRouter()
 _data_quality_service = None
+_kpi_service = None
+
+
+def get_kpi_service():
+    """Lazy initialization of service to avoid import errors."""
+    global _kpi_service
+    if _kpi_service is None:
+        from backend.config import DATABASE_URL
+        from app.services.kpis import KpiService
+        _kpi_service = KpiService(DATABASE_URL)
+    return _kpi_service
 
 def get_data_quality_service_instance():
     """Lazy initialization of service to avoid import errors."""
@@ -27,13 +38,11 @@ def get_kpis_overview(
     from_date: Optional[datetime] = Query(None, alias="from"),
     to_date: Optional[datetime] = Query(None, alias="to")
 ):
-    """Get KPIs overview."""
-    # TODO: Implementar quando serviço de KPIs estiver pronto
-    return {
-        "message": "KPIs overview endpoint - to be implemented",
-        "from_date": from_date,
-        "to_date": to_date
-    }
+    """Get KPIs overview (aggregate tiers only; default: last 30 days)."""
+    try:
+        return get_kpi_service().get_overview(from_date=from_date, to_date=to_date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/by-employee")
@@ -79,13 +88,10 @@ def get_kpis_by_phase(
     fase_id: Optional[int] = None
 ):
     """Get KPIs by phase."""
-    # TODO: Implementar quando serviço de KPIs estiver pronto
-    return {
-        "message": "KPIs by phase endpoint - to be implemented",
-        "from_date": from_date,
-        "to_date": to_date,
-        "fase_id": fase_id
-    }
+    try:
+        return get_kpi_service().get_by_phase(from_date=from_date, to_date=to_date, fase_id=fase_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/by-product")
@@ -95,11 +101,8 @@ def get_kpis_by_product(
     produto_id: Optional[int] = None  # CORRIGIDO: usar produto_id
 ):
     """Get KPIs by product."""
-    # TODO: Implementar quando serviço de KPIs estiver pronto
-    return {
-        "message": "KPIs by product endpoint - to be implemented",
-        "from_date": from_date,
-        "to_date": to_date,
-        "produto_id": produto_id  # CORRIGIDO
-    }
+    try:
+        return get_kpi_service().get_by_product(from_date=from_date, to_date=to_date, produto_id=produto_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
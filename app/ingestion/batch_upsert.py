@@ -1,9 +1,17 @@
 """
 Batch upsert operations using COPY or execute_values for performance.
 Handles upserts with ON CONFLICT for idempotency.
+
+stream_upsert and batch_insert_rejects accept any iterable of rows and send
+it in bounded chunks via COPY (text format), so a load never materializes
+more than one chunk.
 """
+import io
+import json
 from contextlib import closing
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime, time
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 from sqlalchemy import text, create_engine
 from sqlalchemy.engine import Engine
 import psycopg2
@@ -15,6 +23,52 @@ logger = structlog.get_logger()
 # Batch size for processing
 BATCH_SIZE = 5000
 
+# Session temp table stream_upsert COPYs each chunk into
+STREAM_SOURCE_TABLE = "_stream_upsert_src"
+
+REJECT_COLUMNS = ['ingestion_run_id', 'sheet_name', 'row_number', 'reason_code', 'reason_detail', 'raw_json']
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_field(value: Any) -> str:
+    """Encode a value as a COPY text-format field (the server parses it as the column type)."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _copy_buffer(rows: Iterable[Iterable[Any]]) -> io.StringIO:
+    """COPY text-format buffer for a chunk of value tuples."""
+    buf = io.StringIO()
+    buf.writelines('\t'.join(map(_copy_field, row)) + '\n' for row in rows)
+    buf.seek(0)
+    return buf
+
+
+def _peek(rows: Iterable[Any]):
+    """(first item, iterator over all items), or (None, None) if rows is empty."""
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
+        return None, None
+    return first, chain([first], it)
+
+
+def _chunks(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 def batch_upsert(
     engine: Engine,
@@ -99,59 +153,145 @@ def batch_upsert(
     return total_affected
 
 
+def stream_upsert(
+    engine: Engine,
+    table_name: str,
+    rows: Iterable[Dict[str, Any]],
+    primary_keys: List[str],
+    columns: Optional[List[str]] = None,
+    chunk_size: int = BATCH_SIZE
+) -> Dict[str, int]:
+    """
+    Upsert rows from any iterable, streamed in chunks through COPY.
+    
+    Each chunk is COPYed into a session temp table shaped like the target,
+    then merged with one INSERT ... SELECT ... ON CONFLICT. The whole stream
+    runs in one transaction (rolled back on error), like batch_upsert. As
+    with batch_upsert, a key must not repeat within a chunk.
+    
+    Args:
+        engine: SQLAlchemy engine
+        table_name: Target table name
+        rows: Iterable of row dicts (consumed once)
+        primary_keys: Conflict key column names
+        columns: Columns to load (default: keys of the first row)
+        chunk_size: Rows per COPY + upsert
+    
+    Returns:
+        {'inserted': n, 'updated': n}
+    """
+    counts = {'inserted': 0, 'updated': 0}
+    first, rows = _peek(rows)
+    if first is None:
+        return counts
+    if columns is None:
+        columns = list(first.keys())
+    
+    column_list = ', '.join(columns)
+    update_cols = [col for col in columns if col not in primary_keys]
+    if update_cols:
+        on_conflict = "DO UPDATE SET " + ', '.join(f"{col} = EXCLUDED.{col}" for col in update_cols)
+    else:
+        on_conflict = "DO NOTHING"
+    
+    copy_sql = f"COPY {STREAM_SOURCE_TABLE} ({column_list}) FROM STDIN"
+    # xmax = 0 only on rows this statement inserted
+    upsert_sql = f"""
+        WITH upserted AS (
+            INSERT INTO {table_name} ({column_list})
+            SELECT {column_list} FROM {STREAM_SOURCE_TABLE}
+            ON CONFLICT ({', '.join(primary_keys)})
+            {on_conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM upserted
+    """
+    
+    with closing(engine.raw_connection()) as conn:
+        cur = conn.cursor()
+        total_rows = 0
+        try:
+            cur.execute(f"""
+                CREATE TEMP TABLE {STREAM_SOURCE_TABLE} ON COMMIT DROP AS
+                SELECT {column_list} FROM {table_name} WITH NO DATA
+            """)
+            for chunk in _chunks(rows, chunk_size):
+                cur.copy_expert(copy_sql, _copy_buffer(tuple(row.get(col) for col in columns) for row in chunk))
+                cur.execute(upsert_sql)
+                inserted, updated = cur.fetchone()
+                counts['inserted'] += inserted
+                counts['updated'] += updated
+                cur.execute(f"TRUNCATE {STREAM_SOURCE_TABLE}")
+                total_rows += len(chunk)
+                logger.debug(
+                    "stream_upsert_progress",
+                    table=table_name,
+                    chunk_size=len(chunk),
+                    total_rows=total_rows
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(
+                "stream_upsert_error",
+                table=table_name,
+                rows_before_error=total_rows,
+                exc_info=True
+            )
+            raise
+        finally:
+            cur.close()
+    
+    return counts
+
+
 def batch_insert_rejects(
     engine: Engine,
     table_name: str,
-    rejects: List[Dict[str, Any]],
-    ingestion_run_id: int
+    rejects: Iterable[Dict[str, Any]],
+    ingestion_run_id: int,
+    chunk_size: int = BATCH_SIZE
 ) -> int:
     """
-    Insert rejected rows into rejects table.
+    Insert rejected rows into rejects table, streamed in chunks through COPY.
     
     Args:
         engine: SQLAlchemy engine
         table_name: Source table name
-        rejects: List of reject dicts with keys: row_number, reason_code, reason_detail, raw_json
+        rejects: Iterable of reject dicts with keys: sheet_name, row_number, reason_code, reason_detail, raw_json
         ingestion_run_id: Ingestion run ID
+        chunk_size: Rejects per COPY
     
     Returns:
         Number of rejects inserted
     """
-    if not rejects:
+    first, rejects = _peek(rejects)
+    if first is None:
         return 0
     
     reject_table = f"{table_name}_rejects"
+    copy_sql = f"COPY {reject_table} ({', '.join(REJECT_COLUMNS)}) FROM STDIN"
     
-    columns = ['ingestion_run_id', 'sheet_name', 'row_number', 'reason_code', 'reason_detail', 'raw_json']
-    
-    insert_sql = f"""
-        INSERT INTO {reject_table} ({', '.join(columns)})
-        VALUES %s
-    """
-    
-    data_tuples = [
-        (
-            ingestion_run_id,
-            reject['sheet_name'],
-            reject['row_number'],
-            reject['reason_code'],
-            reject['reason_detail'],
-            reject.get('raw_json')
-        )
-        for reject in rejects
-    ]
-    
+    inserted = 0
     with closing(engine.raw_connection()) as conn:
         cur = conn.cursor()
         try:
-            execute_values(
-                cur,
-                insert_sql,
-                data_tuples,
-                page_size=BATCH_SIZE
-            )
+            for chunk in _chunks(rejects, chunk_size):
+                cur.copy_expert(copy_sql, _copy_buffer(
+                    (
+                        ingestion_run_id,
+                        reject['sheet_name'],
+                        reject['row_number'],
+                        reject['reason_code'],
+                        reject['reason_detail'],
+                        reject.get('raw_json')
+                    )
+                    for reject in chunk
+                ))
+                inserted += len(chunk)
             conn.commit()
-            return len(data_tuples)
+            return inserted
         except Exception:
             conn.rollback()
             logger.error("batch_insert_rejects_error", table=reject_table, exc_info=True)
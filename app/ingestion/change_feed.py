@@ -0,0 +1,187 @@
+"""
+Change feed reader: what each ingestion run changed in the core tables.
+CoreMerger writes core_change_log in the same statement as the upsert, so a
+run's feed is exactly the rows it inserted or updated (unchanged rows are not
+logged). Consumers keep their own cursor (last consumed run_id) in
+analytics_watermarks and process only the affected orders and phases.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+import structlog
+
+logger = structlog.get_logger()
+
+CHANGE_LOG_TABLE = "core_change_log"
+
+
+class ChangeFeed:
+    """Read the per-run change log written by CoreMerger."""
+
+    def __init__(self, db_url: Optional[str] = None, engine: Optional[Engine] = None):
+        """
+        Initialize change feed reader.
+
+        Args:
+            db_url: Database URL (ignored when engine is given)
+            engine: Existing SQLAlchemy engine to reuse
+        """
+        self.engine = engine if engine is not None else create_engine(db_url)
+
+    def pending_runs(self, consumer: str) -> List[int]:
+        """
+        Runs with logged changes not yet consumed by a consumer.
+
+        Args:
+            consumer: Consumer name (e.g. 'incremental_aggregates')
+
+        Returns:
+            Run IDs in ascending order
+        """
+        query = text(f"""
+            SELECT DISTINCT l.run_id
+            FROM {CHANGE_LOG_TABLE} l
+            WHERE l.run_id > COALESCE(
+              (SELECT last_run_id FROM analytics_watermarks WHERE mv_name = :mv_name), 0
+            )
+            ORDER BY l.run_id
+        """)
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(query, {"mv_name": self._cursor_name(consumer)})]
+
+    def last_consumed(self, consumer: str) -> Optional[int]:
+        """
+        Last run_id a consumer marked consumed.
+
+        Args:
+            consumer: Consumer name
+
+        Returns:
+            Run ID, or None if the consumer never consumed the feed
+        """
+        query = text("SELECT last_run_id FROM analytics_watermarks WHERE mv_name = :mv_name")
+        with self.engine.connect() as conn:
+            row = conn.execute(query, {"mv_name": self._cursor_name(consumer)}).fetchone()
+            return row[0] if row else None
+
+    def mark_consumed(self, consumer: str, run_id: int) -> None:
+        """
+        Advance a consumer's cursor after it processed every run up to run_id.
+
+        Args:
+            consumer: Consumer name
+            run_id: Last processed run ID
+        """
+        query = text("""
+            INSERT INTO analytics_watermarks (mv_name, last_run_id)
+            VALUES (:mv_name, :run_id)
+            ON CONFLICT (mv_name)
+            DO UPDATE SET
+                last_run_id = GREATEST(analytics_watermarks.last_run_id, EXCLUDED.last_run_id),
+                updated_at = now()
+        """)
+        with self.engine.connect() as conn:
+            conn.execute(query, {"mv_name": self._cursor_name(consumer), "run_id": run_id})
+            conn.commit()
+
+    def summary(self, run_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        Count of logged changes per core table and operation.
+
+        Args:
+            run_id: Ingestion run ID
+
+        Returns:
+            {table_name: {'I': n, 'U': n, 'D': n}}
+        """
+        query = text(f"""
+            SELECT table_name, op, count(*)
+            FROM {CHANGE_LOG_TABLE}
+            WHERE run_id = :run_id
+            GROUP BY table_name, op
+        """)
+        out: Dict[str, Dict[str, int]] = {}
+        with self.engine.connect() as conn:
+            for table_name, op, n in conn.execute(query, {"run_id": run_id}):
+                out.setdefault(table_name, {"I": 0, "U": 0, "D": 0})[op] = int(n)
+        return out
+
+    def changed_keys(
+        self,
+        run_ids: Sequence[int],
+        table_name: str,
+        ops: Sequence[str] = ("I", "U", "D"),
+    ) -> List[Tuple[str, ...]]:
+        """
+        Distinct business keys of a core table changed in the given runs.
+
+        Args:
+            run_ids: Ingestion run IDs
+            table_name: Core table (e.g. 'fases_ordem_fabrico')
+            ops: Operations to include
+
+        Returns:
+            Business keys as tuples of text, in conflict-key column order
+        """
+        if not run_ids:
+            return []
+        query = text(f"""
+            SELECT DISTINCT business_key
+            FROM {CHANGE_LOG_TABLE}
+            WHERE run_id = ANY(:run_ids) AND table_name = :table_name AND op = ANY(:ops)
+        """)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query, {"run_ids": list(run_ids), "table_name": table_name, "ops": list(ops)})
+            return [tuple(r[0]) for r in rows]
+
+    def affected_orders(self, run_ids: Sequence[int]) -> List[str]:
+        """
+        Orders (of_id) touched in the given runs by any order-scoped table.
+
+        Args:
+            run_ids: Ingestion run IDs
+
+        Returns:
+            Sorted distinct of_id values
+        """
+        return self._distinct_refs("of_id", run_ids)
+
+    def affected_phases(self, run_ids: Sequence[int]) -> List[str]:
+        """
+        Phase instances (faseof_id) touched in the given runs.
+
+        Args:
+            run_ids: Ingestion run IDs
+
+        Returns:
+            Sorted distinct faseof_id values
+        """
+        return self._distinct_refs("faseof_id", run_ids)
+
+    def changed_tables(self, run_ids: Sequence[int]) -> List[str]:
+        """Core tables with at least one logged change in the given runs."""
+        if not run_ids:
+            return []
+        query = text(f"""
+            SELECT DISTINCT table_name FROM {CHANGE_LOG_TABLE}
+            WHERE run_id = ANY(:run_ids)
+            ORDER BY table_name
+        """)
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(query, {"run_ids": list(run_ids)})]
+
+    def _distinct_refs(self, column: str, run_ids: Sequence[int]) -> List[str]:
+        if not run_ids:
+            return []
+        query = text(f"""
+            SELECT DISTINCT {column}
+            FROM {CHANGE_LOG_TABLE}
+            WHERE run_id = ANY(:run_ids) AND {column} IS NOT NULL
+            ORDER BY {column}
+        """)
+        with self.engine.connect() as conn:
+            return [r[0] for r in conn.execute(query, {"run_ids": list(run_ids)})]
+
+    @staticmethod
+    def _cursor_name(consumer: str) -> str:
+        return f"change_feed.{consumer}"
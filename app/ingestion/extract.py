@@ -5,39 +5,107 @@ Memory-efficient, streaming approach.
 import openpyxl
 import csv
 import gzip
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import hashlib
 import structlog
 from datetime import datetime
 
+from app.ingestion.pgcopy import BinaryCopyEncoder, PGCOPY_HEADER, PGCOPY_TRAILER
+from app.ingestion.xlsx_reader import XlsxReader
+
 logger = structlog.get_logger()
 
+STREAM_CHUNK_ROWS = 5000
+
+
+def file_sha256(path: str) -> str:
+    """Calculate SHA256 of a file."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def sheet_part_checksums(excel_path: str) -> Dict[str, Any]:
+    """
+    Checksum the raw XLSX parts of every sheet without extracting cells.
+    
+    Args:
+        excel_path: Path to Excel file
+    
+    Returns:
+        Dict with 'shared_strings' checksum and per-sheet 'sheets' checksums
+    """
+    reader = XlsxReader(excel_path)
+    reader.open(shared_strings=False)
+    try:
+        return reader.part_checksums()
+    finally:
+        reader.close()
+
+
+def _normalize_row(row) -> List[str]:
+    """CSV text of a row (also the input of the content checksum)."""
+    normalized_row = []
+    for cell_value in row:
+        if cell_value is None:
+            normalized_row.append('')
+        elif isinstance(cell_value, datetime):
+            normalized_row.append(cell_value.isoformat())
+        else:
+            normalized_row.append(str(cell_value))
+    return normalized_row
+
+
+def _extract_sheet_worker(excel_path: str, output_dir: str, sheet_name: str, reader: str) -> Dict[str, Any]:
+    """
+    Extract one sheet in a worker process.
+    
+    Each worker opens its own read_only workbook handle: openpyxl handles
+    are not picklable and must not be shared across processes.
+    """
+    with ExcelExtractor(excel_path, Path(output_dir), reader=reader) as extractor:
+        return extractor.extract_sheet(sheet_name)
+
 
 class ExcelExtractor:
     """Extract Excel sheets to CSV.gz files."""
     
-    def __init__(self, excel_path: str, output_dir: Path):
+    def __init__(self, excel_path: str, output_dir: Path, reader: str = 'openpyxl'):
         """
         Initialize extractor.
         
         Args:
             excel_path: Path to Excel file
             output_dir: Output directory for CSV.gz files
+            reader: 'openpyxl' or 'native' (XlsxReader, no cell objects)
         """
+        if reader not in ('openpyxl', 'native'):
+            raise ValueError(f"Unknown reader: {reader}")
+        self.reader = reader
         self.excel_path = Path(excel_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.workbook = None
         self.sheet_checksums = {}
+        self.sheet_stats: Dict[str, Dict[str, Any]] = {}
     
     def __enter__(self):
         """Context manager entry."""
-        self.workbook = openpyxl.load_workbook(
-            self.excel_path,
-            read_only=True,
-            data_only=False
-        )
+        if self.reader == 'native':
+            self.workbook = XlsxReader(str(self.excel_path))
+            self.workbook.open()
+        else:
+            self.workbook = openpyxl.load_workbook(
+                self.excel_path,
+                read_only=True,
+                data_only=False
+            )
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -45,50 +113,61 @@ class ExcelExtractor:
         if self.workbook:
             self.workbook.close()
     
-    def extract_sheet(self, sheet_name: str) -> Dict[str, Any]:
+    def _data_rows(self, sheet_name: str):
+        """Return (headers, data row iterator) for a sheet."""
+        header_row = next(self._iter_rows(sheet_name, min_row=1, max_row=1))
+        headers = [str(cell).strip() if cell else f"col_{i+1}" 
+                  for i, cell in enumerate(header_row)]
+        
+        return headers, self._iter_rows(sheet_name, min_row=2)
+    
+    def _record_stats(self, sheet_name: str, row_count: int, checksum: str, audit_path: Optional[Path]) -> None:
+        self.sheet_checksums[sheet_name] = checksum
+        self.sheet_stats[sheet_name] = {
+            'sheet_name': sheet_name,
+            'file_path': str(audit_path) if audit_path else None,
+            'row_count': row_count,
+            'checksum': checksum,
+        }
+    
+    def stream_sheet_csv(
+        self,
+        sheet_name: str,
+        chunk_rows: int = STREAM_CHUNK_ROWS,
+        audit_path: Optional[Path] = None
+    ) -> Iterator[str]:
         """
-        Extract a sheet to CSV.gz.
+        Stream a sheet as CSV text chunks (header first).
+        
+        Row count and checksum are recorded in self.sheet_stats[sheet_name]
+        once the generator is exhausted.
         
         Args:
             sheet_name: Name of sheet to extract
+            chunk_rows: Rows per yielded chunk
+            audit_path: Optional CSV.gz copy of the streamed data
         
-        Returns:
-            Dict with file path, row count, checksum
+        Yields:
+            CSV text chunks
         """
-        logger.info(f"Extracting sheet: {sheet_name}")
-        
-        sheet = self.workbook[sheet_name]
+        logger.info(f"Extracting sheet: {sheet_name}", reader=self.reader)
         
-        # Read header
-        header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
-        headers = [str(cell).strip() if cell else f"col_{i+1}" 
-                  for i, cell in enumerate(header_row)]
-        
-        # Output file
-        csv_gz_path = self.output_dir / f"{sheet_name}.csv.gz"
+        headers, data_rows = self._data_rows(sheet_name)
         
-        # Extract to CSV.gz
         row_count = 0
         sha256 = hashlib.sha256()
+        buf = io.StringIO()
+        writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+        audit_file = gzip.open(audit_path, 'wt', encoding='utf-8', compresslevel=6) if audit_path else None
         
-        with gzip.open(csv_gz_path, 'wt', encoding='utf-8', compresslevel=6) as gz_file:
-            writer = csv.writer(gz_file, quoting=csv.QUOTE_MINIMAL)
-            
+        try:
             # Write header
             writer.writerow(headers)
             sha256.update(','.join(headers).encode('utf-8'))
             
             # Write rows
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                # Normalize values
-                normalized_row = []
-                for cell_value in row:
-                    if cell_value is None:
-                        normalized_row.append('')
-                    elif isinstance(cell_value, datetime):
-                        normalized_row.append(cell_value.isoformat())
-                    else:
-                        normalized_row.append(str(cell_value))
+            for row in data_rows:
+                normalized_row = _normalize_row(row)
                 
                 writer.writerow(normalized_row)
                 row_count += 1
@@ -96,9 +175,119 @@ class ExcelExtractor:
                 # Update checksum
                 row_str = ','.join(normalized_row)
                 sha256.update(row_str.encode('utf-8'))
+                
+                if row_count % chunk_rows == 0:
+                    chunk = buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+                    if audit_file:
+                        audit_file.write(chunk)
+                    yield chunk
+            
+            chunk = buf.getvalue()
+            if chunk:
+                if audit_file:
+                    audit_file.write(chunk)
+                yield chunk
+        finally:
+            if audit_file:
+                audit_file.close()
         
-        checksum = sha256.hexdigest()
-        self.sheet_checksums[sheet_name] = checksum
+        self._record_stats(sheet_name, row_count, sha256.hexdigest(), audit_path)
+    
+    def stream_sheet_binary(
+        self,
+        sheet_name: str,
+        column_types: List[str],
+        chunk_rows: int = STREAM_CHUNK_ROWS,
+        audit_path: Optional[Path] = None
+    ) -> Iterator[bytes]:
+        """
+        Stream a sheet as PGCOPY binary chunks for a typed staging table.
+        
+        Cells are encoded from the reader's native values (int, float,
+        datetime) without a text round trip. The checksum is computed over
+        the same normalized text as stream_sheet_csv, so per-sheet skip
+        decisions do not depend on the load format.
+        
+        Args:
+            sheet_name: Name of sheet to extract
+            column_types: Typed staging column types, in column order (see pgcopy.ENCODERS)
+            chunk_rows: Rows per yielded chunk
+            audit_path: Optional CSV.gz copy of the streamed data
+        
+        Yields:
+            PGCOPY bytes (signature first, trailer last)
+        """
+        logger.info(f"Extracting sheet: {sheet_name}", reader=self.reader, format='binary')
+        
+        encoder = BinaryCopyEncoder(column_types)
+        headers, data_rows = self._data_rows(sheet_name)
+        
+        row_count = 0
+        sha256 = hashlib.sha256()
+        sha256.update(','.join(headers).encode('utf-8'))
+        parts = [PGCOPY_HEADER]
+        audit_file = gzip.open(audit_path, 'wt', encoding='utf-8', compresslevel=6) if audit_path else None
+        audit_writer = csv.writer(audit_file, quoting=csv.QUOTE_MINIMAL) if audit_file else None
+        
+        try:
+            if audit_writer:
+                audit_writer.writerow(headers)
+            
+            for row in data_rows:
+                parts.append(encoder.encode_row(row))
+                row_count += 1
+                
+                normalized_row = _normalize_row(row)
+                sha256.update(','.join(normalized_row).encode('utf-8'))
+                if audit_writer:
+                    audit_writer.writerow(normalized_row)
+                
+                if row_count % chunk_rows == 0:
+                    yield b''.join(parts)
+                    parts = []
+            
+            parts.append(PGCOPY_TRAILER)
+            yield b''.join(parts)
+        finally:
+            if audit_file:
+                audit_file.close()
+        
+        self._record_stats(sheet_name, row_count, sha256.hexdigest(), audit_path)
+        if encoder.invalid_cells:
+            logger.warning("invalid_cells_sent_as_null", sheet=sheet_name, count=len(encoder.invalid_cells))
+        self.sheet_stats[sheet_name]['invalid_cells'] = [
+            {
+                'row': row_index + 1,  # 1-based data row (header excluded)
+                'column': headers[col] if col < len(headers) else str(col),
+                'type': column_types[col],
+                'value': value,
+            }
+            for row_index, col, value in encoder.invalid_cells
+        ]
+    
+    def extract_sheet(self, sheet_name: str) -> Dict[str, Any]:
+        """
+        Extract a sheet to CSV.gz.
+        
+        Args:
+            sheet_name: Name of sheet to extract
+        
+        Returns:
+            Dict with file path, row count, checksum
+        """
+        # Output file
+        csv_gz_path = self.output_dir / f"{sheet_name}.csv.gz"
+        
+        # Extract to CSV.gz
+        with gzip.open(csv_gz_path, 'wt', encoding='utf-8', compresslevel=6) as gz_file:
+            for chunk in self.stream_sheet_csv(sheet_name):
+                gz_file.write(chunk)
+        
+        stats = self.sheet_stats[sheet_name]
+        row_count = stats['row_count']
+        checksum = stats['checksum']
         
         file_size_mb = csv_gz_path.stat().st_size / (1024 * 1024)
         
@@ -117,20 +306,49 @@ class ExcelExtractor:
             'file_size_mb': round(file_size_mb, 2)
         }
     
-    def extract_all(self) -> Dict[str, Any]:
+    def _iter_rows(self, sheet_name: str, min_row: int = 1, max_row: Optional[int] = None):
+        """Iterate raw row tuples with the configured reader."""
+        if self.reader == 'native':
+            return self.workbook.iter_rows(sheet_name, min_row=min_row, max_row=max_row)
+        return self.workbook[sheet_name].iter_rows(min_row=min_row, max_row=max_row, values_only=True)
+    
+    def _sheet_max_row(self, sheet_name: str) -> int:
+        """Row count hint from the sheet dimension tag."""
+        if self.reader == 'native':
+            return self.workbook.max_row(sheet_name)
+        return self.workbook[sheet_name].max_row or 0
+    
+    def extract_all(
+        self,
+        parallel: bool = False,
+        max_workers: Optional[int] = None,
+        sheets: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
         """
         Extract all sheets.
         
+        Args:
+            parallel: Extract sheets in a process pool (one sheet per worker)
+            max_workers: Pool size (default: min(sheet count, CPU count))
+            sheets: Only extract these sheets (default: all)
+        
         Returns:
             Dict with all extraction results and overall checksum
         """
-        results = {}
-        total_rows = 0
+        start_time = datetime.now()
+        sheet_names = [
+            name for name in self.workbook.sheetnames
+            if sheets is None or name in sheets
+        ]
+        
+        if parallel:
+            results = self._extract_parallel(sheet_names, max_workers)
+        else:
+            results = {}
+            for sheet_name in sheet_names:
+                results[sheet_name] = self.extract_sheet(sheet_name)
         
-        for sheet_name in self.workbook.sheetnames:
-            sheet_result = self.extract_sheet(sheet_name)
-            results[sheet_name] = sheet_result
-            total_rows += sheet_result.get('row_count', 0)
+        total_rows = sum(r.get('row_count', 0) for r in results.values())
         
         # Calculate overall Excel checksum
         excel_checksum = self._calculate_excel_checksum()
@@ -144,16 +362,47 @@ class ExcelExtractor:
             'per_sheet_sha256': per_sheet_checksums,
             'sheets': results,
             'total_rows_extracted': total_rows,
+            'mode': 'parallel' if parallel else 'sequential',
+            'reader': self.reader,
+            'elapsed_seconds': round((datetime.now() - start_time).total_seconds(), 2),
             'extracted_at': datetime.now().isoformat()
         }
     
+    def _extract_parallel(self, sheet_names: List[str], max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Extract sheets concurrently, one sheet per worker process.
+        
+        Largest sheets are submitted first so wall time approaches that of
+        the biggest sheet. Results are returned in workbook order.
+        """
+        if not sheet_names:
+            return {}
+        # max_row comes from the sheet dimension tag; cheap in read_only mode
+        sizes = {name: self._sheet_max_row(name) for name in sheet_names}
+        submit_order = sorted(sheet_names, key=lambda name: sizes[name], reverse=True)
+        
+        workers = max_workers or min(len(sheet_names), os.cpu_count() or 1)
+        logger.info("Parallel extraction", sheets=len(sheet_names), workers=workers)
+        
+        unordered = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    _extract_sheet_worker, str(self.excel_path), str(self.output_dir), name, self.reader
+                ): name
+                for name in submit_order
+            }
+            for future in as_completed(futures):
+                sheet_name = futures[future]
+                sheet_result = future.result()
+                unordered[sheet_name] = sheet_result
+                self.sheet_checksums[sheet_name] = sheet_result['checksum']
+        
+        return {name: unordered[name] for name in sheet_names}
+    
     def _calculate_excel_checksum(self) -> str:
         """Calculate SHA256 of Excel file."""
-        sha256 = hashlib.sha256()
-        with open(self.excel_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+        return file_sha256(str(self.excel_path))
 
 
 def main():
@@ -175,8 +424,11 @@ def main():
         ]
     )
     
-    with ExcelExtractor(str(excel_path), output_dir) as extractor:
-        results = extractor.extract_all()
+    parallel = "--parallel" in sys.argv
+    reader = 'native' if "--native" in sys.argv else 'openpyxl'
+    
+    with ExcelExtractor(str(excel_path), output_dir, reader=reader) as extractor:
+        results = extractor.extract_all(parallel=parallel)
         
         # Save extraction report
         import json
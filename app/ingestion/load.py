@@ -4,9 +4,12 @@ Ultra-fast bulk load with PostgreSQL COPY.
 """
 import gzip
 import csv
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import closing
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 import psycopg2
@@ -17,21 +20,142 @@ import time
 logger = structlog.get_logger()
 
 BATCH_SIZE = 50000  # Batches de 50k para performance
+STREAM_QUEUE_CHUNKS = 8  # Bounded producer/consumer buffer (CSV chunks in flight)
+
+# Per-connection settings for COPY sessions
+DEFAULT_SESSION_SETTINGS = {
+    'synchronous_commit': 'off',
+    'maintenance_work_mem': '256MB',
+    'work_mem': '64MB',
+    'statement_timeout': '1h',
+}
+
+# Map sheet names to staging tables and columns
+SHEET_TO_STAGING = {
+    'OrdensFabrico': {
+        'table': 'staging.ordens_fabrico_raw',
+        'columns': ['of_id', 'of_data_criacao', 'of_data_acabamento', 
+                   'of_produto_id', 'of_fase_id', 'of_data_transporte']
+    },
+    'FasesOrdemFabrico': {
+        'table': 'staging.fases_ordem_fabrico_raw',
+        'columns': ['faseof_id', 'faseof_of_id', 'faseof_inicio', 'faseof_fim',
+                   'faseof_data_prevista', 'faseof_coeficiente', 'faseof_coeficiente_x',
+                   'faseof_fase_id', 'faseof_turno', 'faseof_retorno', 'faseof_peso',
+                   'faseof_sequencia']
+    },
+    'FuncionariosFaseOrdemFabrico': {
+        'table': 'staging.funcionarios_fase_ordem_fabrico_raw',
+        'columns': ['funcionariofaseof_faseof_id', 'funcionariofaseof_funcionario_id',
+                   'funcionariofaseof_chefe']
+    },
+    'OrdemFabricoErros': {
+        'table': 'staging.erros_ordem_fabrico_raw',
+        'columns': ['ofch_descricao_erro', 'ofch_of_id', 'ofch_fase_avaliacao',
+                   'ofch_gravidade', 'ofch_faseof_avaliacao', 'ofch_faseof_culpada']
+    },
+    'Funcionarios': {
+        'table': 'staging.funcionarios_raw',
+        'columns': ['funcionario_id', 'funcionario_nome', 'funcionario_activo']
+    },
+    'FuncionariosFasesAptos': {
+        'table': 'staging.funcionarios_fases_aptos_raw',
+        'columns': ['funcionario_id', 'fase_id', 'funcionariofase_inicio']
+    },
+    'Fases': {
+        'table': 'staging.fases_catalogo_raw',
+        'columns': ['fase_id', 'fase_nome', 'fase_sequencia', 'fase_de_producao',
+                   'fase_automatica']
+    },
+    'Modelos': {
+        'table': 'staging.modelos_raw',
+        'columns': ['produto_id', 'produto_nome', 'produto_peso_desmolde',
+                   'produto_peso_acabamento', 'produto_qtd_gel_deck', 'produto_qtd_gel_casco']
+    },
+    'FasesStandardModelos': {
+        'table': 'staging.fases_standard_modelos_raw',
+        'columns': ['produto_id', 'fase_id', 'sequencia', 'coeficiente', 'coeficiente_x']
+    }
+}
+
+# Typed staging tables for the large sheets (binary COPY, see app.ingestion.pgcopy).
+# Column order matches SHEET_TO_STAGING; types are PGCOPY encoder types.
+SHEET_TO_STAGING_TYPED = {
+    'OrdensFabrico': {
+        'table': 'staging.ordens_fabrico_typed',
+        'columns': SHEET_TO_STAGING['OrdensFabrico']['columns'],
+        'types': ['text', 'timestamp', 'timestamp', 'int8', 'int8', 'timestamp']
+    },
+    'FasesOrdemFabrico': {
+        'table': 'staging.fases_ordem_fabrico_typed',
+        'columns': SHEET_TO_STAGING['FasesOrdemFabrico']['columns'],
+        'types': ['text', 'text', 'timestamp', 'timestamp', 'date', 'float8', 'float8',
+                  'int8', 'int8', 'int8', 'float8', 'int8']
+    },
+    'FuncionariosFaseOrdemFabrico': {
+        'table': 'staging.funcionarios_fase_ordem_fabrico_typed',
+        'columns': SHEET_TO_STAGING['FuncionariosFaseOrdemFabrico']['columns'],
+        'types': ['text', 'int8', 'int8']
+    },
+}
+
+
+class QueueCopyReader:
+    """
+    File-like adapter feeding COPY FROM STDIN from a bounded queue.
+    
+    A producer thread puts CSV text (or PGCOPY bytes) chunks on the queue;
+    copy_expert pulls them through read(). None marks end of stream. Whole
+    chunks are returned regardless of the requested size (COPY accepts any
+    length), which avoids re-slicing large buffers.
+    """
+    
+    def __init__(self, chunk_queue: "queue.Queue[Optional[str]]", binary: bool = False):
+        self.queue = chunk_queue
+        self.eof = False
+        self.empty = b'' if binary else ''
+    
+    def read(self, size: int = -1):
+        if self.eof:
+            return self.empty
+        chunk = self.queue.get()
+        if chunk is None:
+            self.eof = True
+            return self.empty
+        return chunk
 
 
 class StagingLoader:
     """Load CSV.gz files to staging tables using COPY."""
     
-    def __init__(self, db_url: str, processed_dir: Path):
+    def __init__(
+        self,
+        db_url: str,
+        processed_dir: Path,
+        max_parallel: int = 1,
+        session_settings: Optional[Dict[str, str]] = None
+    ):
         """
         Initialize loader.
         
         Args:
             db_url: Database URL
             processed_dir: Directory with CSV.gz files
+            max_parallel: Concurrent COPY sessions in load_all (1 = sequential)
+            session_settings: Overrides for DEFAULT_SESSION_SETTINGS, applied per COPY session
         """
-        self.engine = create_engine(db_url)
+        self.max_parallel = max(1, max_parallel)
+        self.engine = create_engine(db_url, pool_size=max(5, self.max_parallel))
         self.processed_dir = Path(processed_dir)
+        self.session_settings = {**DEFAULT_SESSION_SETTINGS, **(session_settings or {})}
+    
+    def _configure_session(self, cur, sheet_name: Optional[str] = None) -> None:
+        """Configure session for fast load."""
+        for name, value in self.session_settings.items():
+            cur.execute(f"SET {name} = %s", (value,))
+        if sheet_name:
+            # Makes concurrent COPY sessions identifiable in pg_stat_activity
+            cur.execute("SET application_name = %s", (f"staging_load:{sheet_name}",))
     
     def load_sheet(
         self,
@@ -60,11 +184,7 @@ class StagingLoader:
         with closing(self.engine.raw_connection()) as conn:
             cur = conn.cursor()
             try:
-                # Configure session for fast load
-                cur.execute("SET synchronous_commit = off")
-                cur.execute("SET maintenance_work_mem = '256MB'")
-                cur.execute("SET work_mem = '64MB'")
-                cur.execute("SET statement_timeout = '1h'")
+                self._configure_session(cur, sheet_name)
                 
                 # Truncate staging table
                 cur.execute(f"TRUNCATE TABLE {staging_table}")
@@ -109,93 +229,211 @@ class StagingLoader:
             finally:
                 cur.close()
     
+    def load_sheet_stream(
+        self,
+        sheet_name: str,
+        chunks: Iterable[str],
+        staging_table: str,
+        columns: list,
+        max_chunks_in_flight: int = STREAM_QUEUE_CHUNKS,
+        copy_format: str = 'csv'
+    ) -> Dict[str, Any]:
+        """
+        Load a sheet by streaming chunks straight into COPY FROM STDIN.
+        
+        A producer thread drains `chunks` (e.g. ExcelExtractor.stream_sheet_csv)
+        into a bounded queue while COPY consumes it, so extraction and
+        loading overlap and no intermediate file is needed.
+        
+        Args:
+            sheet_name: Sheet name
+            chunks: Iterable of CSV text chunks (header first), or PGCOPY
+                bytes from ExcelExtractor.stream_sheet_binary
+            staging_table: Target staging table name (typed table for binary)
+            columns: List of column names
+            max_chunks_in_flight: Queue bound (back-pressure on the producer)
+            copy_format: 'csv' or 'binary'
+        
+        Returns:
+            Load stats
+        """
+        if copy_format not in ('csv', 'binary'):
+            raise ValueError(f"Unknown COPY format: {copy_format}")
+        logger.info(f"Streaming {sheet_name} to {staging_table}", format=copy_format)
+        
+        start_time = time.time()
+        chunk_queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_chunks_in_flight)
+        cancelled = threading.Event()
+        producer_error = []
+        
+        def put(item: Optional[str]) -> bool:
+            while not cancelled.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            try:
+                for chunk in chunks:
+                    if not put(chunk):
+                        return
+            except Exception as e:
+                producer_error.append(e)
+            finally:
+                put(None)
+        
+        producer = threading.Thread(target=produce, name=f"extract-{sheet_name}", daemon=True)
+        
+        with closing(self.engine.raw_connection()) as conn:
+            cur = conn.cursor()
+            try:
+                self._configure_session(cur, sheet_name)
+                
+                # Truncate staging table
+                cur.execute(f"TRUNCATE TABLE {staging_table}")
+                
+                if copy_format == 'binary':
+                    copy_options = "FORMAT binary"
+                else:
+                    copy_options = "FORMAT csv, HEADER true, DELIMITER ',', QUOTE '\"'"
+                copy_sql = f"""
+                    COPY {staging_table} ({', '.join(columns)})
+                    FROM STDIN
+                    WITH ({copy_options})
+                """
+                
+                producer.start()
+                cur.copy_expert(copy_sql, QueueCopyReader(chunk_queue, binary=(copy_format == 'binary')))
+                row_count = cur.rowcount
+                producer.join()
+                
+                # A failed extraction truncates the stream: never commit a partial sheet
+                if producer_error:
+                    raise producer_error[0]
+                
+                conn.commit()
+                
+                elapsed = time.time() - start_time
+                throughput = row_count / elapsed if elapsed > 0 else 0
+                
+                logger.info(
+                    f"Loaded {sheet_name}",
+                    mode='stream',
+                    format=copy_format,
+                    row_count=row_count,
+                    elapsed_seconds=round(elapsed, 2),
+                    throughput_rows_per_sec=round(throughput, 0)
+                )
+                
+                return {
+                    'sheet_name': sheet_name,
+                    'staging_table': staging_table,
+                    'row_count': row_count,
+                    'elapsed_seconds': round(elapsed, 2),
+                    'throughput_rows_per_sec': round(throughput, 0),
+                    'mode': 'stream',
+                    'format': copy_format
+                }
+                
+            except Exception:
+                cancelled.set()
+                conn.rollback()
+                logger.error(f"Error streaming {sheet_name}", exc_info=True)
+                raise
+            finally:
+                cur.close()
+                if producer.is_alive():
+                    cancelled.set()
+                    producer.join(timeout=5)
+    
     def load_all(self, extraction_report: Dict[str, Any]) -> Dict[str, Any]:
         """
         Load all extracted sheets to staging.
         
+        Staging tables are independent UNLOGGED tables, so with
+        max_parallel > 1 up to that many COPY sessions run concurrently,
+        largest sheets first.
+        
         Args:
             extraction_report: Report from extract phase
         
         Returns:
-            Load results
+            Load results (per-sheet and aggregate throughput)
         """
-        results = {}
-        
-        # Map sheet names to staging tables and columns
-        sheet_to_staging = {
-            'OrdensFabrico': {
-                'table': 'staging.ordens_fabrico_raw',
-                'columns': ['of_id', 'of_data_criacao', 'of_data_acabamento', 
-                           'of_produto_id', 'of_fase_id', 'of_data_transporte']
-            },
-            'FasesOrdemFabrico': {
-                'table': 'staging.fases_ordem_fabrico_raw',
-                'columns': ['faseof_id', 'faseof_of_id', 'faseof_inicio', 'faseof_fim',
-                           'faseof_data_prevista', 'faseof_coeficiente', 'faseof_coeficiente_x',
-                           'faseof_fase_id', 'faseof_turno', 'faseof_retorno', 'faseof_peso',
-                           'faseof_sequencia']
-            },
-            'FuncionariosFaseOrdemFabrico': {
-                'table': 'staging.funcionarios_fase_ordem_fabrico_raw',
-                'columns': ['funcionariofaseof_faseof_id', 'funcionariofaseof_funcionario_id',
-                           'funcionariofaseof_chefe']
-            },
-            'OrdemFabricoErros': {
-                'table': 'staging.erros_ordem_fabrico_raw',
-                'columns': ['ofch_descricao_erro', 'ofch_of_id', 'ofch_fase_avaliacao',
-                           'ofch_gravidade', 'ofch_faseof_avaliacao', 'ofch_faseof_culpada']
-            },
-            'Funcionarios': {
-                'table': 'staging.funcionarios_raw',
-                'columns': ['funcionario_id', 'funcionario_nome', 'funcionario_activo']
-            },
-            'FuncionariosFasesAptos': {
-                'table': 'staging.funcionarios_fases_aptos_raw',
-                'columns': ['funcionario_id', 'fase_id', 'funcionariofase_inicio']
-            },
-            'Fases': {
-                'table': 'staging.fases_catalogo_raw',
-                'columns': ['fase_id', 'fase_nome', 'fase_sequencia', 'fase_de_producao',
-                           'fase_automatica']
-            },
-            'Modelos': {
-                'table': 'staging.modelos_raw',
-                'columns': ['produto_id', 'produto_nome', 'produto_peso_desmolde',
-                           'produto_peso_acabamento', 'produto_qtd_gel_deck', 'produto_qtd_gel_casco']
-            },
-            'FasesStandardModelos': {
-                'table': 'staging.fases_standard_modelos_raw',
-                'columns': ['produto_id', 'fase_id', 'sequencia', 'coeficiente', 'coeficiente_x']
-            }
-        }
-        
+        jobs = []
         for sheet_name, sheet_data in extraction_report['sheets'].items():
-            if sheet_name not in sheet_to_staging:
+            if sheet_name not in SHEET_TO_STAGING:
                 logger.warning(f"No staging mapping for sheet: {sheet_name}")
                 continue
             
-            staging_config = sheet_to_staging[sheet_name]
             csv_gz_path = Path(sheet_data['file_path'])
             
             if not csv_gz_path.exists():
                 logger.error(f"CSV.gz file not found: {csv_gz_path}")
                 continue
             
-            result = self.load_sheet(
-                sheet_name,
-                csv_gz_path,
-                staging_config['table'],
-                staging_config['columns']
-            )
-            results[sheet_name] = result
+            jobs.append((sheet_name, csv_gz_path, sheet_data.get('row_count', 0)))
+        
+        start_time = time.time()
+        results = {}
+        
+        if self.max_parallel > 1 and len(jobs) > 1:
+            jobs.sort(key=lambda job: job[2], reverse=True)
+            with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="staging-load") as pool:
+                futures = {
+                    pool.submit(
+                        self.load_sheet,
+                        sheet_name,
+                        csv_gz_path,
+                        SHEET_TO_STAGING[sheet_name]['table'],
+                        SHEET_TO_STAGING[sheet_name]['columns']
+                    ): sheet_name
+                    for sheet_name, csv_gz_path, _ in jobs
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            # Keep report order stable (extraction order)
+            results = {sheet_name: results[sheet_name] for sheet_name in extraction_report['sheets'] if sheet_name in results}
+        else:
+            for sheet_name, csv_gz_path, _ in jobs:
+                staging_config = SHEET_TO_STAGING[sheet_name]
+                results[sheet_name] = self.load_sheet(
+                    sheet_name,
+                    csv_gz_path,
+                    staging_config['table'],
+                    staging_config['columns']
+                )
+        
+        wall_seconds = time.time() - start_time
+        total_rows = sum(r['row_count'] for r in results.values())
+        busy_seconds = sum(r['elapsed_seconds'] for r in results.values())
+        
+        logger.info(
+            "Staging load complete",
+            sheets=len(results),
+            max_parallel=self.max_parallel,
+            total_rows=total_rows,
+            wall_seconds=round(wall_seconds, 2),
+        )
         
         return {
             'loaded_sheets': len(results),
             'results': results,
+            'aggregate': {
+                'max_parallel': self.max_parallel,
+                'total_rows': total_rows,
+                'wall_seconds': round(wall_seconds, 2),
+                'sum_sheet_seconds': round(busy_seconds, 2),
+                'throughput_rows_per_sec': round(total_rows / wall_seconds, 0) if wall_seconds > 0 else 0,
+                # >1 means sessions overlapped; compare with max_parallel to size the pool
+                'effective_parallelism': round(busy_seconds / wall_seconds, 2) if wall_seconds > 0 else 0,
+            },
             'loaded_at': time.time()
         }
 
-
 def main():
     """CLI entry point."""
     import sys
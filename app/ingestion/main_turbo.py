@@ -8,6 +8,15 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from app.ingestion.orchestrator_turbo import TurboIngestionOrchestrator
 import structlog
 
+
+def _int_flag(name: str, default: int) -> int:
+    """Parse --name=N from argv."""
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return int(arg.split("=", 1)[1])
+    return default
+
+
 structlog.configure(
     processors=[
         structlog.processors.TimeStamper(fmt="iso"),
@@ -17,8 +26,16 @@ structlog.configure(
 
 if __name__ == "__main__":
     try:
-        orchestrator = TurboIngestionOrchestrator()
-        results = orchestrator.run()
+        orchestrator = TurboIngestionOrchestrator(
+            parallel_extract="--parallel-extract" in sys.argv,
+            extract_reader='native' if "--native-reader" in sys.argv else 'openpyxl',
+            stream_load="--stream" in sys.argv,
+            audit_csv="--audit-csv" in sys.argv,
+            load_parallel=_int_flag("load-parallel", 1),
+            binary_copy="--binary-copy" in sys.argv,
+            merge_parallel=_int_flag("merge-parallel", 1)
+        )
+        results = orchestrator.run(force="--force" in sys.argv)
         
         # Check validation status
         validation_status = results.get('validation', {}).get('status', 'UNKNOWN')
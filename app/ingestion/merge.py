@@ -7,13 +7,20 @@ Correções chave:
 - Resolve schema core/public automaticamente.
 - CAST correcto (int/numeric/date/timestamptz/bool) e tratamento do literal "NULL".
 - Rejects por tabela: <tabela>_rejects com payload JSONB.
-- Erros: fingerprint com pgcrypto digest quando disponível, fallback para Python.
+- Erros: fingerprint calculado no servidor (pgcrypto digest ou sha256 nativo), merge set-based.
+- Staging tipada (COPY binário): colunas já tipadas, o merge só faz CAST directo.
+- row_hash: linhas classificadas em new/changed/unchanged; só as duas primeiras são escritas.
+- Metadados (tabelas, tipos, chaves únicas) em cache por fingerprint do schema.
+- merge_all paralelo (max_parallel > 1): DAG de dependências a partir das FKs do core.
+- Colunas derivadas (faseof_event_time, ...) calculadas na projecção do INSERT: cada linha é escrita uma vez.
+- Change feed: chaves inseridas/actualizadas por run em core_change_log (leitura: app.ingestion.change_feed).
 """
 
 from __future__ import annotations
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from contextlib import closing
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 import os
@@ -25,7 +32,7 @@ import logging
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 
-from psycopg2.extras import execute_values
+from app.ingestion.schema_cache import SchemaMetadataCache
 
 try:
     import structlog
@@ -34,9 +41,6 @@ except Exception:
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger("merge")
 
-BATCH_SIZE = 50_000
-
-
 def _normalize_str(x: object) -> str:
     if x is None:
         return ""
@@ -48,6 +52,56 @@ def _python_fingerprint(*parts: object) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
+def _sql_normalize_str(expr: str) -> str:
+    # Equivalente SQL de _normalize_str: NULL -> '', minúsculas, espaços colapsados e aparados
+    return f"btrim(regexp_replace(lower(coalesce(({expr})::text, '')), '\\s+', ' ', 'g'), ' ')"
+
+
+def _sql_fingerprint(exprs: List[str], digest_fn: str = "sha256") -> str:
+    # Equivalente SQL de _python_fingerprint (sha256 hex sobre UTF-8).
+    # digest_fn: "digest" (pgcrypto) ou "sha256" (nativo, PostgreSQL >= 11)
+    joined = " || '|' || ".join(_sql_normalize_str(e) for e in exprs)
+    if digest_fn == "digest":
+        return f"encode(digest(convert_to({joined}, 'UTF8'), 'sha256'), 'hex')"
+    return f"encode(sha256(convert_to({joined}, 'UTF8')), 'hex')"
+
+
+# Colunas derivadas de fases_ordem_fabrico: expressões sobre as colunas do core já convertidas.
+# Escritas pelo próprio INSERT/UPSERT do merge (sem UPDATE posterior à tabela inteira).
+FASEOF_DERIVED_COLUMNS: Dict[str, str] = {
+    "faseof_event_time": "COALESCE(faseof_fim, faseof_inicio, faseof_data_prevista)",
+    "faseof_duration_seconds": (
+        "CASE WHEN faseof_fim IS NOT NULL AND faseof_inicio IS NOT NULL "
+        "THEN LEAST(EXTRACT(EPOCH FROM (faseof_fim - faseof_inicio))::numeric, 99999999.99) END"
+    ),
+    "faseof_is_open": "(faseof_inicio IS NOT NULL AND faseof_fim IS NULL)",
+    "faseof_is_done": "(faseof_fim IS NOT NULL)",
+}
+
+
+# Change feed: ordem / fase afectada por cada linha escrita (w = linha devolvida pelo INSERT)
+CHANGE_FEED_REFS: Dict[str, Tuple[str, str]] = {
+    "ordens_fabrico": ("w.of_id", "NULL"),
+    "fases_ordem_fabrico": ("w.faseof_of_id", "w.faseof_id"),
+    "funcionarios_fase_ordem_fabrico": (
+        "(SELECT f.faseof_of_id FROM fases_ordem_fabrico f WHERE f.faseof_id = w.funcionariofaseof_faseof_id LIMIT 1)",
+        "w.funcionariofaseof_faseof_id",
+    ),
+    "erros_ordem_fabrico": ("w.ofch_of_id", "NULL"),
+}
+
+
+def faseof_derived_backfill_sql() -> str:
+    """UPDATE das derivadas só nas linhas ainda sem valores (legado anterior à migração 010)."""
+    assignments = ",\n              ".join(f"{col} = {expr}" for col, expr in FASEOF_DERIVED_COLUMNS.items())
+    return f"""
+            UPDATE fases_ordem_fabrico
+            SET
+              {assignments}
+            WHERE faseof_event_time IS NULL AND COALESCE(faseof_fim, faseof_inicio, faseof_data_prevista) IS NOT NULL
+    """
+
+
 @dataclass(frozen=True)
 class MergeConfig:
     sheet_name: str
@@ -56,12 +110,66 @@ class MergeConfig:
     preferred_conflict_cols: List[str]
     column_mapping: Dict[str, str]
     is_errors: bool = False
+    typed: bool = False  # staging_table has typed columns (binary COPY)
+    derived_columns: Optional[Dict[str, str]] = None  # core col -> expressão sobre as colunas mapeadas
+    invalid_cells: Tuple[Dict[str, Any], ...] = ()  # células que o encoder binário gravou como NULL
+
+
+# Folhas e respectivo merge, pela ordem de ingestão
+MERGE_CONFIGS: Tuple[MergeConfig, ...] = (
+    MergeConfig("Fases", "staging.fases_catalogo_raw", "fases_catalogo",
+                ["fase_id"],
+                {"fase_id":"fase_id","fase_nome":"fase_nome","fase_sequencia":"fase_sequencia","fase_de_producao":"fase_de_producao","fase_automatica":"fase_automatica"}),
+    MergeConfig("Modelos", "staging.modelos_raw", "modelos",
+                ["produto_id"],
+                {"produto_id":"produto_id","produto_nome":"produto_nome","produto_peso_desmolde":"produto_peso_desmolde","produto_peso_acabamento":"produto_peso_acabamento","produto_qtd_gel_deck":"produto_qtd_gel_deck","produto_qtd_gel_casco":"produto_qtd_gel_casco"}),
+    MergeConfig("Funcionarios", "staging.funcionarios_raw", "funcionarios",
+                ["funcionario_id"],
+                {"funcionario_id":"funcionario_id","funcionario_nome":"funcionario_nome","funcionario_activo":"funcionario_activo"}),
+    MergeConfig("FuncionariosFasesAptos", "staging.funcionarios_fases_aptos_raw", "funcionarios_fases_aptos",
+                ["funcionario_id","fase_id"],
+                {"funcionario_id":"funcionario_id","fase_id":"fase_id","funcionariofase_inicio":"funcionariofase_inicio"}),
+    MergeConfig("FasesStandardModelos", "staging.fases_standard_modelos_raw", "fases_standard_modelos",
+                ["produto_id","fase_id","sequencia"],
+                {"produto_id":"produto_id","fase_id":"fase_id","sequencia":"sequencia","coeficiente":"coeficiente","coeficiente_x":"coeficiente_x"}),
+    MergeConfig("OrdensFabrico", "staging.ordens_fabrico_raw", "ordens_fabrico",
+                ["of_id"],
+                {"of_id":"of_id","of_data_criacao":"of_data_criacao","of_data_acabamento":"of_data_acabamento","of_produto_id":"of_produto_id","of_fase_id":"of_fase_id","of_data_transporte":"of_data_transporte"}),
+    MergeConfig("FasesOrdemFabrico", "staging.fases_ordem_fabrico_raw", "fases_ordem_fabrico",
+                ["faseof_id","faseof_fim"],
+                {"faseof_id":"faseof_id","faseof_of_id":"faseof_of_id","faseof_inicio":"faseof_inicio","faseof_fim":"faseof_fim","faseof_data_prevista":"faseof_data_prevista","faseof_coeficiente":"faseof_coeficiente","faseof_coeficiente_x":"faseof_coeficiente_x","faseof_fase_id":"faseof_fase_id","faseof_turno":"faseof_turno","faseof_retorno":"faseof_retorno","faseof_peso":"faseof_peso","faseof_sequencia":"faseof_sequencia"},
+                derived_columns=FASEOF_DERIVED_COLUMNS),
+    MergeConfig("FuncionariosFaseOrdemFabrico", "staging.funcionarios_fase_ordem_fabrico_raw", "funcionarios_fase_ordem_fabrico",
+                ["funcionariofaseof_faseof_id","funcionariofaseof_funcionario_id"],
+                {"funcionariofaseof_faseof_id":"funcionariofaseof_faseof_id","funcionariofaseof_funcionario_id":"funcionariofaseof_funcionario_id","funcionariofaseof_chefe":"funcionariofaseof_chefe"}),
+    MergeConfig("OrdemFabricoErros", "staging.erros_ordem_fabrico_raw", "erros_ordem_fabrico",
+                ["ofch_fingerprint","ofch_of_id"],
+                {"ofch_descricao_erro":"ofch_descricao_erro","ofch_of_id":"ofch_of_id","ofch_fase_avaliacao":"ofch_fase_avaliacao","ofch_gravidade":"ofch_gravidade","ofch_faseof_avaliacao":"ofch_faseof_avaliacao","ofch_faseof_culpada":"ofch_faseof_culpada"},
+                is_errors=True),
+)
 
 
 class CoreMerger:
-    def __init__(self, db_url: str, ingestion_run_id: int):
-        self.engine: Engine = create_engine(db_url, pool_pre_ping=True, future=True)
+    def __init__(
+        self,
+        db_url: str,
+        ingestion_run_id: int,
+        metadata_cache_path: Optional[Path] = None,
+        max_parallel: int = 1,
+    ):
+        self.max_parallel = max(1, max_parallel)
+        self.engine: Engine = create_engine(
+            db_url, pool_pre_ping=True, future=True, pool_size=max(5, self.max_parallel)
+        )
         self.run_id = ingestion_run_id
+        self.metadata_cache = SchemaMetadataCache(metadata_cache_path)
+        self._schema_checked = False
+
+    def _check_schema(self, cur) -> None:
+        # Uma verificação do fingerprint por merge_all (ou primeiro merge_sheet avulso)
+        if not self._schema_checked:
+            self.metadata_cache.refresh(cur)
+            self._schema_checked = True
 
     # ----------------- schema resolve -----------------
     @staticmethod
@@ -71,6 +179,15 @@ class CoreMerger:
         return r[0] if r else None
 
     def _resolve_table(self, cur, raw: str, schemas: List[str]) -> str:
+        key = f"{raw}|{','.join(schemas)}"
+        found, qualified = self.metadata_cache.get("tables", key)
+        if found:
+            return qualified
+        qualified = self._resolve_table_uncached(cur, raw, schemas)
+        self.metadata_cache.put("tables", key, qualified)
+        return qualified
+
+    def _resolve_table_uncached(self, cur, raw: str, schemas: List[str]) -> str:
         if "." in raw:
             if self._to_regclass(cur, raw) is None:
                 raise ValueError(f"Table does not exist: {raw}")
@@ -120,8 +237,108 @@ class CoreMerger:
             except Exception:
                 pass
 
+    # ----------------- FK dependency graph -----------------
+    def _get_fk_edges(self, cur) -> List[Tuple[str, str]]:
+        found, cached = self.metadata_cache.get("fk_edges", "all")
+        if found:
+            return [(child, parent) for child, parent in cached]
+        # Só FKs declaradas na tabela-mãe (clones nas partições têm conparentid)
+        cur.execute(
+            """
+            SELECT cn.nspname || '.' || c.relname, pn.nspname || '.' || p.relname
+            FROM pg_constraint k
+            JOIN pg_class c ON c.oid = k.conrelid
+            JOIN pg_namespace cn ON cn.oid = c.relnamespace
+            JOIN pg_class p ON p.oid = k.confrelid
+            JOIN pg_namespace pn ON pn.oid = p.relnamespace
+            WHERE k.contype = 'f' AND k.conparentid = 0 AND NOT c.relispartition
+            """
+        )
+        edges = [(child, parent) for child, parent in cur.fetchall()]
+        self.metadata_cache.put("fk_edges", "all", [[child, parent] for child, parent in edges])
+        return edges
+
+    def _sheet_dependencies(self, configs: List[MergeConfig]) -> Dict[str, List[str]]:
+        """Sheets each sheet must wait for: parents of its core table in the FK graph (this run only)."""
+        with closing(self.engine.raw_connection()) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("SET search_path TO public, core, staging;")
+                self._check_schema(cur)
+                core_by_sheet = {
+                    cfg.sheet_name: self._resolve_table(cur, cfg.core_table, ["public", "core"])
+                    for cfg in configs
+                }
+                edges = self._get_fk_edges(cur)
+                conn.commit()
+            finally:
+                cur.close()
+
+        sheet_by_core = {core: sheet for sheet, core in core_by_sheet.items()}
+        deps: Dict[str, List[str]] = {cfg.sheet_name: [] for cfg in configs}
+        for child, parent in edges:
+            if child == parent or child not in sheet_by_core or parent not in sheet_by_core:
+                continue
+            child_sheet, parent_sheet = sheet_by_core[child], sheet_by_core[parent]
+            if parent_sheet not in deps[child_sheet]:
+                deps[child_sheet].append(parent_sheet)
+        return deps
+
+    def sheet_dependencies(self, sheets: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """Pais FK de cada folha (entre as folhas indicadas; por omissão todas as de MERGE_CONFIGS)."""
+        configs = [cfg for cfg in MERGE_CONFIGS if sheets is None or cfg.sheet_name in sheets]
+        return self._sheet_dependencies(configs)
+
+    def _merge_dag(self, configs: List[MergeConfig], deps: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Merge sheets concurrently (one connection each), starting a sheet only
+        after all its FK parents committed. On failure no new sheet starts;
+        running ones finish and the first error is raised.
+        """
+        pending = {cfg.sheet_name: cfg for cfg in configs}
+        done: set = set()
+        results: Dict[str, Any] = {}
+        errors: List[BaseException] = []
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="merge") as pool:
+            running: Dict[Any, str] = {}
+            while pending or running:
+                if not errors and pending:
+                    ready = [name for name in pending if all(d in done for d in deps.get(name, []))]
+                    if not ready and not running:
+                        # Ciclo no grafo de FKs: segue a ordem das configs
+                        ready = [next(iter(pending))]
+                        try:
+                            logger.warning("fk dependency cycle, merging in config order", sheets=list(pending))
+                        except Exception:
+                            pass
+                    for name in ready:
+                        running[pool.submit(self.merge_sheet, pending.pop(name))] = name
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                        done.add(name)
+                    except Exception as e:
+                        errors.append(e)
+
+        if errors:
+            raise errors[0]
+        return results
+
     # ----------------- column types -----------------
     def _get_core_column_types(self, cur, qualified_core: str) -> Dict[str, Dict[str, Any]]:
+        found, cached = self.metadata_cache.get("columns", qualified_core)
+        if found:
+            return cached
+        out = self._get_core_column_types_uncached(cur, qualified_core)
+        self.metadata_cache.put("columns", qualified_core, out)
+        return out
+
+    def _get_core_column_types_uncached(self, cur, qualified_core: str) -> Dict[str, Dict[str, Any]]:
         if "." in qualified_core:
             schema, rel = qualified_core.split(".", 1)
         else:
@@ -188,8 +405,30 @@ class CoreMerger:
         # text/varchar/uuid/etc: mantém texto limpo
         return f"{n} AS {core_col}"
 
+    @staticmethod
+    def _typed_cast_expr(stg_col: str, core_col: str, core_udt: str) -> str:
+        # Staging tipada: NULL/trim já normalizados no encoder (app.ingestion.pgcopy)
+        e = f"t.{stg_col}"
+        if core_udt in ("int2", "int4", "int8", "numeric", "float4", "float8",
+                        "date", "timestamp", "timestamptz", "bool"):
+            return f"({e})::{core_udt} AS {core_col}"
+        return f"{e} AS {core_col}"
+
+    def _column_expr(self, cfg: MergeConfig, stg_col: str, core_col: str, core_udt: str) -> str:
+        if cfg.typed:
+            return self._typed_cast_expr(stg_col, core_col, core_udt)
+        return self._cast_expr(stg_col, core_col, core_udt)
+
     # ----------------- unique targets -----------------
     def _get_unique_sets(self, cur, qualified: str) -> List[Tuple[str, Tuple[str, ...]]]:
+        found, cached = self.metadata_cache.get("uniques", qualified)
+        if found:
+            return [(kind, tuple(cols)) for kind, cols in cached]
+        out = self._get_unique_sets_uncached(cur, qualified)
+        self.metadata_cache.put("uniques", qualified, [[kind, list(cols)] for kind, cols in out])
+        return out
+
+    def _get_unique_sets_uncached(self, cur, qualified: str) -> List[Tuple[str, Tuple[str, ...]]]:
         if "." in qualified:
             schema, rel = qualified.split(".", 1)
         else:
@@ -256,18 +495,7 @@ class CoreMerger:
         name = f"{rel}_rejects"
         q = f"{schema}.{name}"
 
-        cur.execute(
-            """
-            SELECT EXISTS (
-              SELECT 1 FROM information_schema.tables
-              WHERE table_schema=%s AND table_name=%s
-            )
-            """,
-            (schema, name),
-        )
-        exists = cur.fetchone()[0]
-
-        if not exists:
+        if self._to_regclass(cur, q) is None:
             cur.execute(
                 f"""
                 CREATE TABLE {q} (
@@ -283,36 +511,236 @@ class CoreMerger:
             )
         return q
 
-    def _insert_rejects(self, cur, rejects_q: str, staging_q: str, sheet: str, code: str, detail: str, where_sql: str) -> int:
+    # ----------------- classification -----------------
+    def _classify_staging(self, cur, staging_q: str, select_exprs: List[str], reasons: List[Tuple[str, str, str]]) -> int:
+        # Único scan da staging: valores convertidos + primeiro motivo de rejeição (+ payload só para rejeitadas).
+        # reasons: (código, detalhe, predicado sobre v.*), por ordem de avaliação.
+        reject_case = "NULL"
+        if reasons:
+            whens = " ".join(f"WHEN {pred} THEN {i}" for i, (_, _, pred) in enumerate(reasons))
+            reject_case = f"CASE {whens} END"
         cur.execute(
             f"""
-            INSERT INTO {rejects_q} (run_id, sheet_name, reason_code, reason_detail, payload)
-            SELECT %s, %s, %s, %s, to_jsonb(t)
+            CREATE TEMP TABLE merge_classified ON COMMIT DROP AS
+            SELECT v.*, r.reject_idx, t.ctid AS src_ctid,
+                   CASE WHEN r.reject_idx IS NOT NULL THEN to_jsonb(t) END AS reject_payload
             FROM {staging_q} t
-            WHERE {where_sql}
+            CROSS JOIN LATERAL (SELECT {", ".join(select_exprs)}) v
+            CROSS JOIN LATERAL (SELECT {reject_case} AS reject_idx) r
+            """
+        )
+        return cur.rowcount
+
+    def _insert_classified_rejects(self, cur, rejects_q: str, sheet: str, reasons: List[Tuple[str, str, str]]) -> int:
+        if not reasons:
+            return 0
+        values_sql = ", ".join(["(%s, %s, %s)"] * len(reasons))
+        params: List[Any] = [self.run_id, sheet]
+        for i, (code, detail, _) in enumerate(reasons):
+            params.extend([i, code, detail])
+        cur.execute(
+            f"""
+            INSERT INTO {rejects_q} (run_id, sheet_name, reason_code, reason_detail, payload)
+            SELECT %s, %s, r.code, r.detail, m.reject_payload
+            FROM merge_classified m
+            JOIN (VALUES {values_sql}) AS r(idx, code, detail) ON r.idx = m.reject_idx
+            ORDER BY m.reject_idx, m.src_ctid
             """,
-            (self.run_id, sheet, code, detail),
+            params,
         )
         return cur.rowcount
 
+    def _insert_invalid_cell_rejects(self, cur, rejects_q: str, cfg: MergeConfig) -> int:
+        # Staging tipada: a célula inválida já está NULL na linha (que segue para o merge);
+        # o valor original fica registado como reject para auditoria. Não conta em "rejected".
+        if not cfg.invalid_cells:
+            return 0
+        cur.execute(
+            f"""
+            INSERT INTO {rejects_q} (run_id, sheet_name, reason_code, reason_detail, payload)
+            SELECT %s, %s, 'INVALID_VALUE',
+                   format('%%s: valor inválido para %%s (gravado NULL)', c->>'column', c->>'type'),
+                   c
+            FROM jsonb_array_elements(%s::jsonb) AS c
+            """,
+            [self.run_id, cfg.sheet_name, json.dumps(list(cfg.invalid_cells))],
+        )
+        return cur.rowcount
+
+    @staticmethod
+    def _digest_fn(cur) -> str:
+        # pgcrypto (migração 006) quando instalado; senão sha256() nativo. Sem CREATE EXTENSION aqui:
+        # uma falha de permissões abortaria a transacção do merge.
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pgcrypto'")
+        return "digest" if cur.fetchone() else "sha256"
+
+    def _merge_errors(
+        self,
+        cur,
+        core_q: str,
+        orders_q: str,
+        cols: List[str],
+        conflict_cols: List[str],
+        change_log_q: Optional[str] = None,
+    ) -> Dict[str, int]:
+        # Set-based: as linhas nunca saem da base de dados. A existência da OF é um join pela PK
+        # (of_id = valor já aparado, sem cast na coluna indexada); dedup pela chave de conflito.
+        keys = ", ".join(f"m.{k}" for k in conflict_cols)
+        payload = [c for c in cols if c not in conflict_cols]
+        differs = (
+            f"({', '.join(f'c.{c}' for c in payload)}) IS DISTINCT FROM ({', '.join(f's.{c}' for c in payload)})"
+            if payload else "false"
+        )
+        update_set = ", ".join(f"{c} = EXCLUDED.{c}" for c in payload) or f"{conflict_cols[0]} = EXCLUDED.{conflict_cols[0]}"
+        log_cte, params = "", None
+        if change_log_q:
+            log_sql, params = self._change_feed_sql(change_log_q, core_q, conflict_cols, "ins")
+            log_cte = f", feed AS ({log_sql})"
+        cur.execute(
+            f"""
+            WITH src AS (
+              SELECT DISTINCT ON ({keys}) {", ".join(f"m.{c}" for c in cols)}
+              FROM merge_classified m
+              JOIN {orders_q} o ON o.of_id = m.ofch_of_id
+              WHERE m.reject_idx IS NULL
+              ORDER BY {keys}, m.src_ctid
+            ),
+            cls AS (
+              SELECT s.*,
+                     c.{conflict_cols[0]} IS NULL AS is_new,
+                     c.{conflict_cols[0]} IS NOT NULL AND {differs} AS is_changed
+              FROM src s
+              LEFT JOIN {core_q} c ON {" AND ".join(f"c.{k} = s.{k}" for k in conflict_cols)}
+            ),
+            ins AS (
+              INSERT INTO {core_q} AS c ({", ".join(cols)})
+              SELECT {", ".join(cols)} FROM cls WHERE is_new OR is_changed
+              ON CONFLICT ({", ".join(conflict_cols)})
+              DO UPDATE SET {update_set}
+              RETURNING c.*, (c.xmax = 0) AS merge_inserted
+            ){log_cte}
+            SELECT
+              count(*) FILTER (WHERE is_new),
+              count(*) FILTER (WHERE is_changed),
+              count(*) FILTER (WHERE NOT is_new AND NOT is_changed),
+              (SELECT count(*) FROM ins)
+            FROM cls
+            """,
+            params,
+        )
+        new_rows, changed_rows, unchanged_rows, written = (int(x) for x in cur.fetchone())
+        return {
+            "new": new_rows,
+            "changed": changed_rows,
+            "unchanged": unchanged_rows,
+            "written": written,
+        }
+
+    # ----------------- change feed -----------------
+    def _change_log_table(self, cur) -> Optional[str]:
+        # None até a migração 011 ser aplicada (o merge continua sem feed)
+        found, qualified = self.metadata_cache.get("tables", "core_change_log")
+        if not found:
+            qualified = self._to_regclass(cur, "public.core_change_log")
+            self.metadata_cache.put("tables", "core_change_log", qualified)
+        return qualified
+
+    def _change_feed_sql(self, change_log_q: str, core_q: str, conflict_cols: List[str], written: str) -> Tuple[str, List[Any]]:
+        # INSERT no change log a partir das linhas devolvidas por um INSERT ... RETURNING c.*, (c.xmax = 0) AS merge_inserted
+        table = core_q.split(".")[-1]
+        of_expr, faseof_expr = CHANGE_FEED_REFS.get(table, ("NULL", "NULL"))
+        sql = f"""
+            INSERT INTO {change_log_q} (run_id, table_name, op, business_key, of_id, faseof_id)
+            SELECT %s, %s, CASE WHEN w.merge_inserted THEN 'I' ELSE 'U' END,
+                   ARRAY[{", ".join(f"w.{k}::text" for k in conflict_cols)}], {of_expr}, {faseof_expr}
+            FROM {written} w
+        """
+        return sql, [self.run_id, table]
+
+    # ----------------- change detection -----------------
+    def _merge_changed_rows(
+        self,
+        cur,
+        core_q: str,
+        source_sql: str,
+        core_cols: List[str],
+        conflict_cols: List[str],
+        update_set: str,
+        derived: Optional[Dict[str, str]] = None,
+        change_log_q: Optional[str] = None,
+    ) -> Dict[str, int]:
+        derived = derived or {}
+        # Fonte deduplicada + md5 dos valores convertidos (igual para staging texto ou tipada)
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE merge_src ON COMMIT DROP AS
+            SELECT q.*, md5(ROW(q.*)::text) AS row_hash
+            FROM ({source_sql}) q
+            """
+        )
+        cur.execute("ANALYZE merge_src")
+
+        def key_match(alias: str) -> str:
+            return " AND ".join(f"{alias}.{k} = s.{k}" for k in conflict_cols)
+
+        cur.execute(
+            f"""
+            SELECT
+              count(*) FILTER (WHERE c.{conflict_cols[0]} IS NULL),
+              count(*) FILTER (WHERE c.{conflict_cols[0]} IS NOT NULL AND c.row_hash IS DISTINCT FROM s.row_hash),
+              count(*) FILTER (WHERE c.row_hash = s.row_hash)
+            FROM merge_src s
+            LEFT JOIN {core_q} c ON {key_match("c")}
+            """
+        )
+        new_rows, changed_rows, unchanged_rows = (int(x) for x in cur.fetchone())
+
+        # Linhas iguais ficam intactas: sem nova versão, WAL nem entradas de índice
+        upsert_sql = f"""
+            INSERT INTO {core_q} AS c ({", ".join([*core_cols, *derived])}, row_hash)
+            SELECT {", ".join([*(f"s.{col}" for col in core_cols), *derived.values()])}, s.row_hash
+            FROM merge_src s
+            WHERE NOT EXISTS (
+              SELECT 1 FROM {core_q} e WHERE {key_match("e")} AND e.row_hash = s.row_hash
+            )
+            ON CONFLICT ({", ".join(conflict_cols)})
+            DO UPDATE SET {update_set}, row_hash = EXCLUDED.row_hash
+            WHERE c.row_hash IS DISTINCT FROM EXCLUDED.row_hash
+        """
+        if change_log_q:
+            # Mesmo statement: o feed regista exactamente as linhas escritas (rowcount igual)
+            log_sql, params = self._change_feed_sql(change_log_q, core_q, conflict_cols, "written")
+            cur.execute(
+                f"WITH written AS ({upsert_sql} RETURNING c.*, (c.xmax = 0) AS merge_inserted) {log_sql}",
+                params,
+            )
+        else:
+            cur.execute(upsert_sql)
+        return {
+            "new": new_rows,
+            "changed": changed_rows,
+            "unchanged": unchanged_rows,
+            "written": cur.rowcount,
+        }
+
     # ----------------- merge sheet -----------------
     def merge_sheet(self, cfg: MergeConfig) -> Dict[str, Any]:
         t0 = time.time()
         processed = 0
         rejected = 0
+        change_counts: Optional[Dict[str, int]] = None
 
         with closing(self.engine.raw_connection()) as conn:
             cur = conn.cursor()
             try:
                 cur.execute("SET search_path TO public, core, staging;")
+                self._check_schema(cur)
 
                 staging_q = self._resolve_table(cur, cfg.staging_table, ["staging"])
                 core_q = self._resolve_table(cur, cfg.core_table, ["public", "core"])
 
                 rejects_q = self._ensure_rejects_table(cur, core_q)
-
-                cur.execute(f"SELECT COUNT(*) FROM {staging_q}")
-                staging_count = int(cur.fetchone()[0])
+                invalid_cells = self._insert_invalid_cell_rejects(cur, rejects_q, cfg)
 
                 conflict_cols = self._resolve_conflict_target(cur, core_q, cfg.preferred_conflict_cols)
 
@@ -320,192 +748,89 @@ class CoreMerger:
 
                 # -------- errors (fingerprint) --------
                 if cfg.is_errors:
-                    rejected += self._insert_rejects(
-                        cur, rejects_q, staging_q, cfg.sheet_name,
-                        "NULL_REQUIRED",
-                        "Erro_Descricao ou Erro_OfId está NULL",
-                        "t.ofch_descricao_erro IS NULL OR t.ofch_of_id IS NULL",
-                    )
-                    rejected += self._insert_rejects(
-                        cur, rejects_q, staging_q, cfg.sheet_name,
-                        "INVALID_GRAVIDADE",
-                        "OFCH_GRAVIDADE fora de {1,2,3}",
-                        "t.ofch_gravidade IS NOT NULL AND (CASE WHEN upper(trim(t.ofch_gravidade))='NULL' THEN NULL ELSE trim(t.ofch_gravidade)::int END) NOT IN (1,2,3)",
+                    core_cols = list(cfg.column_mapping.values())
+                    select_exprs = [
+                        self._column_expr(cfg, stg, core, core_types.get(core, {}).get("udt", "text"))
+                        for stg, core in cfg.column_mapping.items()
+                    ]
+                    # Fingerprint sobre os valores da staging (antes do cast), pela ordem do mapping
+                    select_exprs.append(
+                        f"{_sql_fingerprint([f't.{stg}' for stg in cfg.column_mapping], self._digest_fn(cur))} AS ofch_fingerprint"
                     )
+                    reasons = [
+                        ("NULL_REQUIRED",
+                         "Erro_Descricao ou Erro_OfId está NULL",
+                         "v.ofch_descricao_erro IS NULL OR v.ofch_of_id IS NULL"),
+                        ("INVALID_GRAVIDADE",
+                         "OFCH_GRAVIDADE fora de {1,2,3}",
+                         "v.ofch_gravidade IS NOT NULL AND v.ofch_gravidade NOT IN (1,2,3)"),
+                    ]
+                    staging_count = self._classify_staging(cur, staging_q, select_exprs, reasons)
+                    rejected += self._insert_classified_rejects(cur, rejects_q, cfg.sheet_name, reasons)
 
-                    # tenta SQL digest
-                    sql_digest_ok = True
-                    try:
-                        cur.execute("CREATE EXTENSION IF NOT EXISTS pgcrypto;")
-                    except Exception:
-                        sql_digest_ok = False
-
-                    if sql_digest_ok:
-                        cur.execute(
-                            f"""
-                            INSERT INTO {core_q} (
-                              ofch_descricao_erro, ofch_of_id, ofch_fase_avaliacao,
-                              ofch_gravidade, ofch_faseof_avaliacao, ofch_faseof_culpada,
-                              ofch_fingerprint
-                            )
-                            SELECT
-                              t.ofch_descricao_erro,
-                              t.ofch_of_id,
-                              (CASE WHEN upper(trim(t.ofch_fase_avaliacao))='NULL' OR trim(t.ofch_fase_avaliacao)='' THEN NULL ELSE trim(t.ofch_fase_avaliacao)::bigint END),
-                              (CASE WHEN upper(trim(t.ofch_gravidade))='NULL' OR trim(t.ofch_gravidade)='' THEN NULL ELSE trim(t.ofch_gravidade)::int END),
-                              (CASE WHEN upper(trim(t.ofch_faseof_avaliacao))='NULL' OR trim(t.ofch_faseof_avaliacao)='' THEN NULL ELSE trim(t.ofch_faseof_avaliacao) END),
-                              (CASE WHEN upper(trim(t.ofch_faseof_culpada))='NULL' OR trim(t.ofch_faseof_culpada)='' THEN NULL ELSE trim(t.ofch_faseof_culpada) END),
-                              encode(
-                                digest(
-                                  regexp_replace(lower(trim(coalesce(t.ofch_descricao_erro,''))), '\\s+',' ','g') || '|' ||
-                                  regexp_replace(lower(trim(coalesce(t.ofch_of_id::text,''))), '\\s+',' ','g') || '|' ||
-                                  regexp_replace(lower(trim(coalesce(t.ofch_fase_avaliacao::text,''))), '\\s+',' ','g') || '|' ||
-                                  regexp_replace(lower(trim(coalesce(t.ofch_gravidade::text,''))), '\\s+',' ','g') || '|' ||
-                                  regexp_replace(lower(trim(coalesce(t.ofch_faseof_avaliacao::text,''))), '\\s+',' ','g') || '|' ||
-                                  regexp_replace(lower(trim(coalesce(t.ofch_faseof_culpada::text,''))), '\\s+',' ','g'),
-                                  'sha256'
-                                ),
-                                'hex'
-                              )
-                            FROM {staging_q} t
-                            WHERE t.ofch_descricao_erro IS NOT NULL
-                              AND t.ofch_of_id IS NOT NULL
-                              AND trim(t.ofch_of_id) != ''
-                              AND upper(trim(t.ofch_of_id)) != 'NULL'
-                              AND EXISTS (SELECT 1 FROM ordens_fabrico o WHERE o.of_id::text = trim(t.ofch_of_id))
-                            ON CONFLICT ({", ".join(conflict_cols)})
-                            DO UPDATE SET
-                              ofch_descricao_erro = EXCLUDED.ofch_descricao_erro,
-                              ofch_fase_avaliacao = EXCLUDED.ofch_fase_avaliacao,
-                              ofch_gravidade = EXCLUDED.ofch_gravidade,
-                              ofch_faseof_avaliacao = EXCLUDED.ofch_faseof_avaliacao,
-                              ofch_faseof_culpada = EXCLUDED.ofch_faseof_culpada,
-                              ofch_fingerprint = EXCLUDED.ofch_fingerprint
-                            """
-                        )
-                        processed = cur.rowcount
-                    else:
-                        # python fallback (mais lento, mas funciona)
-                        cur.execute(
-                            f"""
-                            SELECT t.ofch_descricao_erro, t.ofch_of_id, t.ofch_fase_avaliacao, t.ofch_gravidade, t.ofch_faseof_avaliacao, t.ofch_faseof_culpada
-                            FROM {staging_q} t
-                            WHERE t.ofch_descricao_erro IS NOT NULL 
-                              AND t.ofch_of_id IS NOT NULL
-                              AND trim(t.ofch_of_id) != ''
-                              AND upper(trim(t.ofch_of_id)) != 'NULL'
-                              AND EXISTS (SELECT 1 FROM ordens_fabrico o WHERE o.of_id::text = trim(t.ofch_of_id))
-                            """
-                        )
-                        rows = cur.fetchall()
-                        vals = []
-                        for r in rows:
-                            fp = _python_fingerprint(*r)
-                            vals.append((r[0], r[1], r[2], r[3], r[4], r[5], fp))
-
-                        if vals:
-                            execute_values(
-                                cur,
-                                f"""
-                                INSERT INTO {core_q} (
-                                  ofch_descricao_erro, ofch_of_id, ofch_fase_avaliacao, ofch_gravidade,
-                                  ofch_faseof_avaliacao, ofch_faseof_culpada, ofch_fingerprint
-                                ) VALUES %s
-                                ON CONFLICT ({", ".join(conflict_cols)})
-                                DO UPDATE SET
-                                  ofch_descricao_erro = EXCLUDED.ofch_descricao_erro,
-                                  ofch_fase_avaliacao = EXCLUDED.ofch_fase_avaliacao,
-                                  ofch_gravidade = EXCLUDED.ofch_gravidade,
-                                  ofch_faseof_avaliacao = EXCLUDED.ofch_faseof_avaliacao,
-                                  ofch_faseof_culpada = EXCLUDED.ofch_faseof_culpada,
-                                  ofch_fingerprint = EXCLUDED.ofch_fingerprint
-                                """,
-                                vals,
-                                page_size=BATCH_SIZE,
-                            )
-                            processed = len(vals)
+                    orders_q = self._resolve_table(cur, "ordens_fabrico", ["public", "core"])
+                    change_counts = self._merge_errors(
+                        cur, core_q, orders_q, core_cols + ["ofch_fingerprint"], conflict_cols,
+                        self._change_log_table(cur),
+                    )
+                    processed = change_counts["new"] + change_counts["changed"] + change_counts["unchanged"]
 
                 # -------- standard tables --------
                 else:
-                    # rejects: conflito não pode ser NULL
                     rev = {core: stg for stg, core in cfg.column_mapping.items()}
-                    null_checks = []
-                    for c in conflict_cols:
-                        if c in rev:
-                            null_checks.append(f"t.{rev[c]} IS NULL OR trim(t.{rev[c]})='' OR upper(trim(t.{rev[c]}))='NULL'")
+                    core_cols = list(cfg.column_mapping.values())
+                    table_name = core_q.split(".")[-1]
+
+                    select_exprs = []
+                    for stg, core in cfg.column_mapping.items():
+                        udt = core_types.get(core, {}).get("udt", "text")
+                        select_exprs.append(self._column_expr(cfg, stg, core, udt))
+
+                    # Motivos de rejeição por ordem de avaliação: cada linha fica com o primeiro que falha.
+                    # Predicados sobre v.* (valores já convertidos).
+                    reasons: List[Tuple[str, str, str]] = []
+
+                    # rejects: conflito não pode ser NULL (após cast: inclui ''/NULL/NONE/NIL e números inválidos)
+                    null_checks = [f"v.{c} IS NULL" for c in conflict_cols if c in rev]
                     if null_checks:
-                        rejected += self._insert_rejects(
-                            cur, rejects_q, staging_q, cfg.sheet_name,
+                        reasons.append((
                             "NULL_CONFLICT_KEY",
                             f"Chaves de conflito inválidas: {', '.join(conflict_cols)}",
                             " OR ".join(null_checks),
-                        )
-                        where_valid = " AND ".join([f"NOT ({x})" for x in null_checks])
-                    else:
-                        where_valid = "TRUE"
+                        ))
 
-                    # Get NOT NULL columns and validate they won't be NULL after cast
+                    # NOT NULL columns that would be NULL after cast
                     not_null_cols = [
                         col for col, info in core_types.items()
                         if not info["nullable"] and col in cfg.column_mapping.values()
                     ]
-                    
-                    # Reject rows where NOT NULL cols will be NULL after cast
                     for not_null_col in not_null_cols:
                         if not_null_col not in conflict_cols and not_null_col in rev:
-                            stg_col = rev[not_null_col]
-                            udt = core_types.get(not_null_col, {}).get("udt", "text")
-                            cast_expr = self._cast_expr(stg_col, not_null_col, udt).split(" AS ")[0]  # Remove AS clause
-                            # Check if cast will result in NULL
-                            rejected += self._insert_rejects(
-                                cur, rejects_q, staging_q, cfg.sheet_name,
+                            reasons.append((
                                 "NULL_REQUIRED_FIELD",
                                 f"Campo obrigatório {not_null_col} será NULL após cast",
-                                f"{where_valid} AND ({cast_expr} IS NULL)"
-                            )
-                            # Add to WHERE to exclude these rows
-                            where_valid = f"{where_valid} AND ({cast_expr} IS NOT NULL)"
-                    
+                                f"v.{not_null_col} IS NULL",
+                            ))
+
                     # Special validation for fases_ordem_fabrico: faseof_fim must be >= faseof_inicio
-                    table_name = core_q.split(".")[-1]
                     if table_name == "fases_ordem_fabrico" and "faseof_inicio" in rev and "faseof_fim" in rev:
-                        inicio_stg = rev["faseof_inicio"]
-                        fim_stg = rev["faseof_fim"]
-                        inicio_cast = self._cast_expr(inicio_stg, "faseof_inicio", "timestamptz").split(" AS ")[0]
-                        fim_cast = self._cast_expr(fim_stg, "faseof_fim", "timestamptz").split(" AS ")[0]
-                        rejected += self._insert_rejects(
-                            cur, rejects_q, staging_q, cfg.sheet_name,
+                        reasons.append((
                             "INVALID_TIME_RANGE",
                             "faseof_fim < faseof_inicio",
-                            f"{where_valid} AND {fim_cast} IS NOT NULL AND {inicio_cast} IS NOT NULL AND {fim_cast} < {inicio_cast}"
-                        )
-                        # Exclude invalid ranges from WHERE
-                        where_valid = f"{where_valid} AND ({fim_cast} IS NULL OR {inicio_cast} IS NULL OR {fim_cast} >= {inicio_cast})"
-                    
+                            "v.faseof_fim IS NOT NULL AND v.faseof_inicio IS NOT NULL AND v.faseof_fim < v.faseof_inicio",
+                        ))
+
                     # Validate foreign keys for funcionarios_fase_ordem_fabrico
-                    if table_name == "funcionarios_fase_ordem_fabrico" and "funcionariofaseof_funcionario_id" in cfg.column_mapping.values():
-                        fk_col = "funcionariofaseof_funcionario_id"
-                        if fk_col in rev:
-                            fk_stg = rev[fk_col]
-                            fk_udt = core_types.get(fk_col, {}).get("udt", "int4")
-                            fk_cast = self._cast_expr(fk_stg, fk_col, fk_udt).split(" AS ")[0]
-                            # Reject rows where FK doesn't exist
-                            rejected += self._insert_rejects(
-                                cur, rejects_q, staging_q, cfg.sheet_name,
-                                "FOREIGN_KEY_VIOLATION",
-                                f"{fk_col} não existe em funcionarios",
-                                f"{where_valid} AND {fk_cast} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM funcionarios f WHERE f.funcionario_id = {fk_cast})"
-                            )
-                            # Exclude invalid FKs from WHERE
-                            where_valid = f"{where_valid} AND ({fk_cast} IS NULL OR EXISTS (SELECT 1 FROM funcionarios f WHERE f.funcionario_id = {fk_cast}))"
-
-                    staging_cols = list(cfg.column_mapping.keys())
-                    core_cols = list(cfg.column_mapping.values())
+                    fk_col = "funcionariofaseof_funcionario_id"
+                    if table_name == "funcionarios_fase_ordem_fabrico" and fk_col in rev:
+                        reasons.append((
+                            "FOREIGN_KEY_VIOLATION",
+                            f"{fk_col} não existe em funcionarios",
+                            f"v.{fk_col} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM funcionarios f WHERE f.funcionario_id = v.{fk_col})",
+                        ))
 
-                    select_exprs = []
-                    for stg, core in cfg.column_mapping.items():
-                        udt = core_types.get(core, {}).get("udt", "text")
-                        select_exprs.append(self._cast_expr(stg, core, udt))
+                    staging_count = self._classify_staging(cur, staging_q, select_exprs, reasons)
+                    rejected += self._insert_classified_rejects(cur, rejects_q, cfg.sheet_name, reasons)
 
                     update_set = ", ".join(
                         f"{col}=EXCLUDED.{col}" for col in core_cols if col not in conflict_cols
@@ -513,21 +838,41 @@ class CoreMerger:
                     if not update_set:
                         update_set = f"{conflict_cols[0]}=EXCLUDED.{conflict_cols[0]}"
 
-                    distinct_on = ", ".join([f"t.{rev[c]}" for c in conflict_cols if c in rev])
-                    order_by = distinct_on if distinct_on else "t.ctid"
-
-                    cur.execute(
-                        f"""
-                        INSERT INTO {core_q} ({", ".join(core_cols)})
-                        SELECT DISTINCT ON ({distinct_on}) {", ".join(select_exprs)}
-                        FROM {staging_q} t
-                        WHERE {where_valid}
-                        ORDER BY {order_by}, t.ctid
-                        ON CONFLICT ({", ".join(conflict_cols)})
-                        DO UPDATE SET {update_set}
-                        """
-                    )
-                    processed = cur.rowcount
+                    # Derivadas fora do row_hash: são função das colunas já incluídas nele
+                    derived = {
+                        col: expr for col, expr in (cfg.derived_columns or {}).items() if col in core_types
+                    }
+                    for col in derived:
+                        update_set += f", {col}=EXCLUDED.{col}"
+
+                    # Dedup pelas chaves já convertidas; a primeira linha da staging ganha
+                    distinct_on = ", ".join(c for c in conflict_cols if c in rev)
+                    order_by = f"{distinct_on}, m.src_ctid" if distinct_on else "m.src_ctid"
+                    source_sql = f"""
+                        SELECT {"DISTINCT ON (" + distinct_on + ")" if distinct_on else ""} {", ".join(core_cols)}
+                        FROM merge_classified m
+                        WHERE m.reject_idx IS NULL
+                        ORDER BY {order_by}
+                    """
+
+                    if "row_hash" in core_types and distinct_on and all(c in rev for c in conflict_cols):
+                        change_counts = self._merge_changed_rows(
+                            cur, core_q, source_sql, core_cols, conflict_cols, update_set, derived,
+                            self._change_log_table(cur),
+                        )
+                        processed = change_counts["new"] + change_counts["changed"] + change_counts["unchanged"]
+                    else:
+                        # Sem row_hash (migração 009 por aplicar): upsert de todas as linhas, sem change feed
+                        cur.execute(
+                            f"""
+                            INSERT INTO {core_q} ({", ".join([*core_cols, *derived])})
+                            SELECT {", ".join(["q.*", *derived.values()])}
+                            FROM ({source_sql}) q
+                            ON CONFLICT ({", ".join(conflict_cols)})
+                            DO UPDATE SET {update_set}
+                            """
+                        )
+                        processed = cur.rowcount
 
                 conn.commit()
 
@@ -541,18 +886,24 @@ class CoreMerger:
                         staging_count=staging_count,
                         processed=processed,
                         rejected=rejected,
+                        changes=change_counts,
                         elapsed_seconds=round(elapsed, 2),
                     )
                 except Exception:
                     pass
 
-                return {
+                result = {
                     "sheet_name": cfg.sheet_name,
                     "staging_count": staging_count,
+                    "typed_staging": cfg.typed,
                     "processed": processed,
                     "rejected": rejected,
+                    "invalid_cells": invalid_cells,
                     "elapsed_seconds": round(elapsed, 2),
                 }
+                if change_counts is not None:
+                    result.update(change_counts)
+                return result
 
             except Exception as e:
                 conn.rollback()
@@ -564,79 +915,73 @@ class CoreMerger:
             finally:
                 cur.close()
 
-    def populate_derived_columns(self) -> None:
+    def populate_derived_columns(self) -> int:
+        """Backfill de linhas escritas antes das derivadas no merge (o merge já não precisa disto)."""
         with self.engine.begin() as conn:
             conn.execute(text("SET search_path TO public, core, staging;"))
-            conn.execute(text("""
-                UPDATE fases_ordem_fabrico
-                SET
-                  faseof_event_time = COALESCE(faseof_fim, faseof_inicio, faseof_data_prevista),
-                  faseof_duration_seconds = CASE
-                    WHEN faseof_fim IS NOT NULL AND faseof_inicio IS NOT NULL
-                    THEN LEAST(EXTRACT(EPOCH FROM (faseof_fim - faseof_inicio))::numeric, 99999999.99)
-                    ELSE NULL
-                  END,
-                  faseof_is_open = (faseof_inicio IS NOT NULL AND faseof_fim IS NULL),
-                  faseof_is_done = (faseof_fim IS NOT NULL)
-                WHERE faseof_event_time IS NULL OR faseof_is_open IS NULL OR faseof_is_done IS NULL;
-            """))
+            result = conn.execute(text(faseof_derived_backfill_sql()))
+            return result.rowcount
 
     def merge_all(self, load_report: Dict[str, Any]) -> Dict[str, Any]:
         self._update_ingestion_run_status("MERGE_RUNNING")
+        self._schema_checked = False
+
+        configs: List[MergeConfig] = list(MERGE_CONFIGS)
 
-        configs: List[MergeConfig] = [
-            MergeConfig("Fases", "staging.fases_catalogo_raw", "fases_catalogo",
-                        ["fase_id"],
-                        {"fase_id":"fase_id","fase_nome":"fase_nome","fase_sequencia":"fase_sequencia","fase_de_producao":"fase_de_producao","fase_automatica":"fase_automatica"}),
-            MergeConfig("Modelos", "staging.modelos_raw", "modelos",
-                        ["produto_id"],
-                        {"produto_id":"produto_id","produto_nome":"produto_nome","produto_peso_desmolde":"produto_peso_desmolde","produto_peso_acabamento":"produto_peso_acabamento","produto_qtd_gel_deck":"produto_qtd_gel_deck","produto_qtd_gel_casco":"produto_qtd_gel_casco"}),
-            MergeConfig("Funcionarios", "staging.funcionarios_raw", "funcionarios",
-                        ["funcionario_id"],
-                        {"funcionario_id":"funcionario_id","funcionario_nome":"funcionario_nome","funcionario_activo":"funcionario_activo"}),
-            MergeConfig("FuncionariosFasesAptos", "staging.funcionarios_fases_aptos_raw", "funcionarios_fases_aptos",
-                        ["funcionario_id","fase_id"],
-                        {"funcionario_id":"funcionario_id","fase_id":"fase_id","funcionariofase_inicio":"funcionariofase_inicio"}),
-            MergeConfig("FasesStandardModelos", "staging.fases_standard_modelos_raw", "fases_standard_modelos",
-                        ["produto_id","fase_id","sequencia"],
-                        {"produto_id":"produto_id","fase_id":"fase_id","sequencia":"sequencia","coeficiente":"coeficiente","coeficiente_x":"coeficiente_x"}),
-            MergeConfig("OrdensFabrico", "staging.ordens_fabrico_raw", "ordens_fabrico",
-                        ["of_id"],
-                        {"of_id":"of_id","of_data_criacao":"of_data_criacao","of_data_acabamento":"of_data_acabamento","of_produto_id":"of_produto_id","of_fase_id":"of_fase_id","of_data_transporte":"of_data_transporte"}),
-            MergeConfig("FasesOrdemFabrico", "staging.fases_ordem_fabrico_raw", "fases_ordem_fabrico",
-                        ["faseof_id","faseof_fim"],
-                        {"faseof_id":"faseof_id","faseof_of_id":"faseof_of_id","faseof_inicio":"faseof_inicio","faseof_fim":"faseof_fim","faseof_data_prevista":"faseof_data_prevista","faseof_coeficiente":"faseof_coeficiente","faseof_coeficiente_x":"faseof_coeficiente_x","faseof_fase_id":"faseof_fase_id","faseof_turno":"faseof_turno","faseof_retorno":"faseof_retorno","faseof_peso":"faseof_peso","faseof_sequencia":"faseof_sequencia"}),
-            MergeConfig("FuncionariosFaseOrdemFabrico", "staging.funcionarios_fase_ordem_fabrico_raw", "funcionarios_fase_ordem_fabrico",
-                        ["funcionariofaseof_faseof_id","funcionariofaseof_funcionario_id"],
-                        {"funcionariofaseof_faseof_id":"funcionariofaseof_faseof_id","funcionariofaseof_funcionario_id":"funcionariofaseof_funcionario_id","funcionariofaseof_chefe":"funcionariofaseof_chefe"}),
-            MergeConfig("OrdemFabricoErros", "staging.erros_ordem_fabrico_raw", "erros_ordem_fabrico",
-                        ["ofch_fingerprint","ofch_of_id"],
-                        {"ofch_descricao_erro":"ofch_descricao_erro","ofch_of_id":"ofch_of_id","ofch_fase_avaliacao":"ofch_fase_avaliacao","ofch_gravidade":"ofch_gravidade","ofch_faseof_avaliacao":"ofch_faseof_avaliacao","ofch_faseof_culpada":"ofch_faseof_culpada"},
-                        is_errors=True),
-        ]
-
-        available = set((load_report.get("results") or {}).keys())
+        load_results = load_report.get("results") or {}
+        available = set(load_results.keys())
         results: Dict[str, Any] = {}
         total_processed = 0
         total_rejected = 0
+        totals = {"new": 0, "changed": 0, "unchanged": 0}
+
+        selected: List[MergeConfig] = []
+        for cfg in configs:
+            if cfg.sheet_name not in available:
+                continue
+            if load_results[cfg.sheet_name].get("format") == "binary":
+                cfg = replace(
+                    cfg,
+                    staging_table=load_results[cfg.sheet_name]["staging_table"],
+                    typed=True,
+                    invalid_cells=tuple(load_results[cfg.sheet_name].get("invalid_cells") or ()),
+                )
+            selected.append(cfg)
 
+        t0 = time.time()
         try:
-            for cfg in configs:
-                if cfg.sheet_name not in available:
-                    continue
-                r = self.merge_sheet(cfg)
+            dependencies: Optional[Dict[str, List[str]]] = None
+            if self.max_parallel > 1 and len(selected) > 1:
+                dependencies = self._sheet_dependencies(selected)
+                merged = self._merge_dag(selected, dependencies)
+            else:
+                merged = {}
+                for cfg in selected:
+                    merged[cfg.sheet_name] = self.merge_sheet(cfg)
+
+            for cfg in selected:
+                r = merged[cfg.sheet_name]
                 results[cfg.sheet_name] = r
                 total_processed += int(r["processed"])
                 total_rejected += int(r["rejected"])
+                for k in totals:
+                    totals[k] += int(r.get(k, 0))
 
-            self.populate_derived_columns()
             self._update_ingestion_run_status("MERGE_DONE")
+            self.metadata_cache.save()
 
             return {
                 "run_id": self.run_id,
                 "merged_sheets": len(results),
                 "total_processed": total_processed,
                 "total_rejected": total_rejected,
+                "total_new": totals["new"],
+                "total_changed": totals["changed"],
+                "total_unchanged": totals["unchanged"],
+                "schema_cache": self.metadata_cache.stats(),
+                "max_parallel": self.max_parallel,
+                "dependencies": dependencies,
+                "wall_seconds": round(time.time() - t0, 2),
                 "results": results,
             }
         except Exception as e:
@@ -668,7 +1013,7 @@ def main() -> None:
     with open(load_report_path, "r", encoding="utf-8") as f:
         load_report = json.load(f)
 
-    merger = CoreMerger(db_url, run_id)
+    merger = CoreMerger(db_url, run_id, metadata_cache_path=processed_dir / "schema_metadata_cache.json")
     report = merger.merge_all(load_report)
 
     merge_report = processed_dir / "merge_report.json"
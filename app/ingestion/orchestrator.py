@@ -40,7 +40,8 @@ class IngestionOrchestrator:
         self,
         file_path: Optional[str] = None,
         db_url: Optional[str] = None,
-        batch_size: int = 5000
+        batch_size: int = 5000,
+        reader: str = 'openpyxl'
     ):
         """
         Initialize orchestrator.
@@ -49,11 +50,13 @@ class IngestionOrchestrator:
             file_path: Path to Excel file
             db_url: Database URL
             batch_size: Batch size for processing
+            reader: Excel reader backend ('openpyxl' or 'native')
         """
         self.file_path = file_path or FOLHA_IA_PATH
         self.db_url = db_url or DATABASE_URL
         self.engine = create_engine(self.db_url)
         self.batch_size = batch_size
+        self.reader = reader
         self.redis_client = redis_client
         
         # Ingestion order (master data first, then transactions)
@@ -371,7 +374,7 @@ class IngestionOrchestrator:
             total_rejected = 0
             sheet_stats = {}
             
-            with StreamingExcelLoader(self.file_path) as loader:
+            with StreamingExcelLoader(self.file_path, reader=self.reader) as loader:
                 for sheet_name in self.ingestion_order:
                     if sheet_name not in loader.get_sheet_names():
                         logger.warning("sheet_not_found", sheet=sheet_name)
@@ -2,7 +2,8 @@
 Turbo Ingestion Orchestrator: Extract → Load → Merge pipeline.
 Idempotent by checksum, ultra-fast with staging tables.
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from datetime import datetime
 from pathlib import Path
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
@@ -11,8 +12,8 @@ import json
 import structlog
 import time
 
-from app.ingestion.extract import ExcelExtractor
-from app.ingestion.load import StagingLoader
+from app.ingestion.extract import ExcelExtractor, file_sha256, sheet_part_checksums
+from app.ingestion.load import StagingLoader, SHEET_TO_STAGING, SHEET_TO_STAGING_TYPED
 from app.ingestion.merge import CoreMerger
 from backend.config import DATABASE_URL, FOLHA_IA_PATH
 
@@ -36,7 +37,16 @@ class TurboIngestionOrchestrator:
         self,
         excel_path: Optional[str] = None,
         db_url: Optional[str] = None,
-        processed_dir: Optional[Path] = None
+        processed_dir: Optional[Path] = None,
+        parallel_extract: bool = False,
+        extract_workers: Optional[int] = None,
+        extract_reader: str = 'openpyxl',
+        skip_unchanged_sheets: bool = True,
+        stream_load: bool = False,
+        audit_csv: bool = False,
+        load_parallel: int = 1,
+        binary_copy: bool = False,
+        merge_parallel: int = 1
     ):
         """
         Initialize orchestrator.
@@ -45,6 +55,18 @@ class TurboIngestionOrchestrator:
             excel_path: Path to Excel file
             db_url: Database URL
             processed_dir: Directory for processed files
+            parallel_extract: Extract sheets in a process pool (not in stream mode)
+            extract_workers: Process pool size for parallel extraction
+            extract_reader: Excel reader backend ('openpyxl' or 'native')
+            skip_unchanged_sheets: Only extract/load/merge sheets whose content changed
+            stream_load: Pipe extracted rows straight into COPY (no intermediate CSV.gz);
+                sheets are streamed one at a time from one open workbook, so
+                parallel_extract / extract_workers / load_parallel do not apply
+            audit_csv: In stream mode, also write CSV.gz copies for audit
+            load_parallel: Concurrent COPY sessions for the LOAD phase (not in stream mode)
+            binary_copy: Load the large sheets as binary COPY into typed staging
+                tables (implies stream_load; other sheets stay CSV)
+            merge_parallel: Concurrent sheet merges, scheduled along the core FK graph
         """
         self.excel_path = excel_path or FOLHA_IA_PATH
         self.db_url = db_url or DATABASE_URL
@@ -52,6 +74,24 @@ class TurboIngestionOrchestrator:
         self.processed_dir = processed_dir or Path(__file__).parent.parent.parent / "data" / "processed"
         self.processed_dir.mkdir(parents=True, exist_ok=True)
         self.redis_client = redis_client
+        self.parallel_extract = parallel_extract
+        self.extract_workers = extract_workers
+        self.extract_reader = extract_reader
+        self.skip_unchanged_sheets = skip_unchanged_sheets
+        self.stream_load = stream_load or binary_copy
+        self.binary_copy = binary_copy
+        self.merge_parallel = merge_parallel
+        self.audit_csv = audit_csv
+        self.load_parallel = load_parallel
+        
+        if self.stream_load and (parallel_extract or extract_workers or load_parallel > 1):
+            logger.warning(
+                "stream_load_ignores_parallel_flags",
+                parallel_extract=parallel_extract,
+                extract_workers=extract_workers,
+                load_parallel=load_parallel,
+                message="Stream mode extracts and loads one sheet at a time; parallel extract/load flags are ignored"
+            )
         
         # Ingestion order (master data first)
         self.ingestion_order = [
@@ -66,21 +106,294 @@ class TurboIngestionOrchestrator:
             'OrdemFabricoErros',
         ]
     
-    def create_ingestion_run(self, excel_checksum: str) -> int:
-        """Create ingestion run record."""
+    def find_completed_run(self, excel_checksum: str) -> Optional[int]:
+        """Return the latest completed run for this workbook checksum, if any."""
         with Session(self.engine) as session:
-            # Check if run with same checksum exists
             result = session.execute(
                 text("""
-                    SELECT run_id, status
+                    SELECT run_id
                     FROM ingestion_runs
-                    WHERE excel_sha256 = :checksum
+                    WHERE excel_sha256 = :checksum AND status = 'completed'
                     ORDER BY run_id DESC
                     LIMIT 1
                 """),
                 {'checksum': excel_checksum}
             )
-            existing = result.fetchone()
+            row = result.fetchone()
+            return row[0] if row else None
+    
+    def get_sheet_checksums(self) -> Dict[str, Dict[str, Any]]:
+        """Load checksums of the last successfully merged content per sheet."""
+        with Session(self.engine) as session:
+            exists = session.execute(
+                text("SELECT to_regclass('ingestion_sheet_checksums') IS NOT NULL")
+            ).scalar()
+            if not exists:
+                logger.warning("ingestion_sheet_checksums missing, run migrations for per-sheet skip")
+                return {}
+            
+            result = session.execute(
+                text("""
+                    SELECT sheet_name, part_sha256, shared_strings_sha256, content_sha256, row_count
+                    FROM ingestion_sheet_checksums
+                """)
+            )
+            return {
+                row[0]: {
+                    'part_sha256': row[1],
+                    'shared_strings_sha256': row[2],
+                    'content_sha256': row[3],
+                    'row_count': row[4],
+                }
+                for row in result.fetchall()
+            }
+    
+    def save_sheet_checksums(
+        self,
+        run_id: int,
+        part_checksums: Dict[str, Any],
+        extraction_results: Dict[str, Any],
+        merge_results: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Persist checksums of the sheets merged by this run.
+        
+        A sheet whose merge rejected or dropped rows (e.g. children of rows
+        missing from a parent) loses its checksum instead, so the next run
+        merges it again even if its content is unchanged.
+        """
+        incomplete = [
+            sheet_name for sheet_name, result in ((merge_results or {}).get('results') or {}).items()
+            if self.merge_incomplete(result)
+        ]
+        rows = [
+            {
+                'sheet_name': sheet_name,
+                'part_sha256': part_checksums['sheets'].get(sheet_name),
+                'shared_strings_sha256': part_checksums.get('shared_strings'),
+                'content_sha256': sheet_data['checksum'],
+                'row_count': sheet_data.get('row_count', 0),
+                'run_id': run_id,
+            }
+            for sheet_name, sheet_data in extraction_results['sheets'].items()
+            if part_checksums['sheets'].get(sheet_name) and sheet_name not in incomplete
+        ]
+        if not rows and not incomplete:
+            return
+        
+        with Session(self.engine) as session:
+            if incomplete:
+                session.execute(
+                    text("DELETE FROM ingestion_sheet_checksums WHERE sheet_name = ANY(:sheets)"),
+                    {'sheets': incomplete}
+                )
+            if not rows:
+                session.commit()
+                return
+            session.execute(
+                text("""
+                    INSERT INTO ingestion_sheet_checksums
+                    (sheet_name, part_sha256, shared_strings_sha256, content_sha256, row_count, run_id, updated_at)
+                    VALUES (:sheet_name, :part_sha256, :shared_strings_sha256, :content_sha256, :row_count, :run_id, now())
+                    ON CONFLICT (sheet_name) DO UPDATE SET
+                        part_sha256 = EXCLUDED.part_sha256,
+                        shared_strings_sha256 = EXCLUDED.shared_strings_sha256,
+                        content_sha256 = EXCLUDED.content_sha256,
+                        row_count = EXCLUDED.row_count,
+                        run_id = EXCLUDED.run_id,
+                        updated_at = now()
+                """),
+                rows
+            )
+            session.commit()
+    
+    @staticmethod
+    def merge_incomplete(merge_result: Dict[str, Any]) -> bool:
+        """Whether a sheet's merge rejected or dropped staging rows."""
+        written = int(merge_result.get('processed', 0)) + int(merge_result.get('rejected', 0))
+        return int(merge_result.get('rejected', 0)) > 0 or int(merge_result.get('staging_count', 0)) > written
+    
+    @staticmethod
+    def with_dependents(
+        selected: Iterable[str],
+        candidates: Iterable[str],
+        dependencies: Dict[str, List[str]]
+    ) -> Set[str]:
+        """Add to selected every candidate with an FK parent (transitively) in selected."""
+        selected = set(selected)
+        candidates = [name for name in candidates if name not in selected]
+        grew = True
+        while grew:
+            grew = False
+            for name in candidates:
+                if name not in selected and any(p in selected for p in dependencies.get(name, ())):
+                    selected.add(name)
+                    grew = True
+        return selected
+    
+    def sheet_dependencies(self) -> Dict[str, List[str]]:
+        """FK parents of each sheet, from the merge's own FK graph."""
+        merger = CoreMerger(
+            self.db_url,
+            None,
+            metadata_cache_path=self.processed_dir / "schema_metadata_cache.json"
+        )
+        try:
+            return merger.sheet_dependencies()
+        finally:
+            merger.engine.dispose()
+    
+    def plan_sheets(
+        self,
+        part_checksums: Dict[str, Any],
+        previous: Dict[str, Dict[str, Any]],
+        dependencies: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, str]:
+        """
+        Decide which sheets need extraction.
+        
+        A sheet is skipped outright only when its raw XML part and the
+        shared string table are both unchanged and none of its FK parents
+        is extracted (a merged parent can make previously rejected child
+        rows valid); otherwise it is extracted and its content checksum
+        decides whether it is loaded and merged.
+        
+        Returns:
+            Dict sheet_name -> 'extract' | 'unchanged'
+        """
+        extract = set()
+        for sheet_name, part_sha in part_checksums['sheets'].items():
+            prev = previous.get(sheet_name)
+            if not (
+                self.skip_unchanged_sheets
+                and prev is not None
+                and prev['part_sha256'] == part_sha
+                and prev['shared_strings_sha256'] == part_checksums.get('shared_strings')
+            ):
+                extract.add(sheet_name)
+        extract = self.with_dependents(extract, part_checksums['sheets'], dependencies or {})
+        return {
+            sheet_name: 'extract' if sheet_name in extract else 'unchanged'
+            for sheet_name in part_checksums['sheets']
+        }
+    
+    def select_changed_sheets(
+        self,
+        extracted: Dict[str, Any],
+        previous: Dict[str, Dict[str, Any]],
+        dependencies: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Extracted sheets to load and merge.
+        
+        A sheet is merged when its normalized content changed or when any of
+        its FK parents is merged in this run.
+        
+        Returns:
+            Dict sheet_name -> sheet data, for the sheets to merge
+        """
+        changed = {
+            sheet_name for sheet_name, sheet_data in extracted.items()
+            if not (
+                self.skip_unchanged_sheets
+                and previous.get(sheet_name)
+                and previous[sheet_name]['content_sha256'] == sheet_data['checksum']
+            )
+        }
+        changed = self.with_dependents(changed, extracted, dependencies or {})
+        return {name: data for name, data in extracted.items() if name in changed}
+    
+    def extract_and_stream_load(self, sheets: List[str], excel_checksum: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Pipelined EXTRACT → LOAD: each sheet is streamed from the workbook
+        into COPY FROM STDIN through a bounded buffer, so extraction and
+        loading overlap and no CSV.gz round trip sits on the critical path.
+        
+        Args:
+            sheets: Sheets to extract and load
+            excel_checksum: Workbook checksum (for the extraction report)
+        
+        Returns:
+            (extraction_results, load_results) shaped like extract_all/load_all
+        """
+        loader = StagingLoader(self.db_url, self.processed_dir)
+        extracted = {}
+        loaded = {}
+        
+        with ExcelExtractor(self.excel_path, self.processed_dir, reader=self.extract_reader) as extractor:
+            for sheet_name in extractor.workbook.sheetnames:
+                if sheet_name not in sheets:
+                    continue
+                staging_config = SHEET_TO_STAGING.get(sheet_name)
+                if not staging_config:
+                    logger.warning(f"No staging mapping for sheet: {sheet_name}")
+                    continue
+                
+                audit_path = self.processed_dir / f"{sheet_name}.csv.gz" if self.audit_csv else None
+                typed_config = SHEET_TO_STAGING_TYPED.get(sheet_name) if self.binary_copy else None
+                if typed_config:
+                    chunks = extractor.stream_sheet_binary(sheet_name, typed_config['types'], audit_path=audit_path)
+                    loaded[sheet_name] = loader.load_sheet_stream(
+                        sheet_name,
+                        chunks,
+                        typed_config['table'],
+                        typed_config['columns'],
+                        copy_format='binary'
+                    )
+                    # Cells the encoder sent as NULL: the merge records them as rejects
+                    loaded[sheet_name]['invalid_cells'] = extractor.sheet_stats[sheet_name]['invalid_cells']
+                else:
+                    chunks = extractor.stream_sheet_csv(sheet_name, audit_path=audit_path)
+                    loaded[sheet_name] = loader.load_sheet_stream(
+                        sheet_name,
+                        chunks,
+                        staging_config['table'],
+                        staging_config['columns']
+                    )
+                extracted[sheet_name] = extractor.sheet_stats[sheet_name]
+        
+        extraction_results = {
+            'excel_path': str(self.excel_path),
+            'excel_checksum': excel_checksum,
+            'per_sheet_sha256': {name: data['checksum'] for name, data in extracted.items()},
+            'sheets': extracted,
+            'total_rows_extracted': sum(data['row_count'] for data in extracted.values()),
+            'mode': 'stream',
+            'reader': self.extract_reader,
+            'extracted_at': datetime.now().isoformat()
+        }
+        load_results = {
+            'loaded_sheets': len(loaded),
+            'results': loaded,
+            'loaded_at': time.time()
+        }
+        return extraction_results, load_results
+    
+    def create_ingestion_run(self, excel_checksum: str, force: bool = False) -> int:
+        """
+        Create ingestion run record.
+        
+        Args:
+            excel_checksum: Workbook checksum
+            force: Always create a new run; a forced re-ingest must not reuse a
+                finalized run (its change-log rows would sit below the
+                change-feed cursors)
+        """
+        with Session(self.engine) as session:
+            # Check if run with same checksum exists
+            existing = None
+            if not force:
+                result = session.execute(
+                    text("""
+                        SELECT run_id, status
+                        FROM ingestion_runs
+                        WHERE excel_sha256 = :checksum
+                        ORDER BY run_id DESC
+                        LIMIT 1
+                    """),
+                    {'checksum': excel_checksum}
+                )
+                existing = result.fetchone()
             
             if existing and existing[1] == 'completed':
                 logger.info("Idempotent run detected", run_id=existing[0], checksum=excel_checksum)
@@ -135,10 +448,13 @@ class TurboIngestionOrchestrator:
                 )
                 session.commit()
     
-    def run(self) -> Dict[str, Any]:
+    def run(self, force: bool = False) -> Dict[str, Any]:
         """
         Run full turbo ingestion pipeline.
         
+        Args:
+            force: Re-ingest even if this workbook was already ingested
+        
         Returns:
             Final results
         """
@@ -154,14 +470,60 @@ class TurboIngestionOrchestrator:
         try:
             start_time = time.time()
             
-            # PHASE 1: EXTRACT
-            logger.info("Starting EXTRACT phase")
-            with ExcelExtractor(self.excel_path, self.processed_dir) as extractor:
-                extraction_results = extractor.extract_all()
+            # PHASE 0: CHECKSUM (before any extraction)
+            excel_checksum = file_sha256(self.excel_path)
+            completed_run_id = None if force else self.find_completed_run(excel_checksum)
+            if completed_run_id is not None:
+                logger.info("Workbook unchanged, skipping ingestion", run_id=completed_run_id, checksum=excel_checksum)
+                return {
+                    'run_id': completed_run_id,
+                    'excel_checksum': excel_checksum,
+                    'status': 'unchanged',
+                    'total_processed': 0,
+                    'total_rejected': 0,
+                    'elapsed_seconds': round(time.time() - start_time, 2),
+                    'merge': {'results': {}},
+                }
             
-            excel_checksum = extraction_results['excel_checksum']
-            run_id = self.create_ingestion_run(excel_checksum)
-            logger.info("Ingestion run created", run_id=run_id, checksum=excel_checksum)
+            part_checksums = sheet_part_checksums(self.excel_path)
+            previous_checksums = {} if force else self.get_sheet_checksums()
+            # Only needed when something could be skipped
+            dependencies = self.sheet_dependencies() if self.skip_unchanged_sheets and previous_checksums else {}
+            sheet_plan = self.plan_sheets(part_checksums, previous_checksums, dependencies)
+            skipped_sheets = {name: 'part_unchanged' for name, action in sheet_plan.items() if action == 'unchanged'}
+            
+            sheets_to_extract = [name for name, action in sheet_plan.items() if action == 'extract']
+            load_results = None
+            
+            # PHASE 1: EXTRACT (streamed straight into staging when stream_load)
+            logger.info("Starting EXTRACT phase", skipped_sheets=list(skipped_sheets), stream_load=self.stream_load)
+            if self.stream_load:
+                extraction_results, load_results = self.extract_and_stream_load(sheets_to_extract, excel_checksum)
+            else:
+                with ExcelExtractor(self.excel_path, self.processed_dir, reader=self.extract_reader) as extractor:
+                    extraction_results = extractor.extract_all(
+                        parallel=self.parallel_extract,
+                        max_workers=self.extract_workers,
+                        sheets=sheets_to_extract
+                    )
+            
+            # Extracted sheets whose normalized content (and FK parents) did not change are not loaded/merged
+            changed_sheets = self.select_changed_sheets(
+                extraction_results['sheets'], previous_checksums, dependencies
+            )
+            for sheet_name in extraction_results['sheets']:
+                if sheet_name not in changed_sheets:
+                    skipped_sheets[sheet_name] = 'content_unchanged'
+            extraction_results['skipped_sheets'] = skipped_sheets
+            
+            run_id = self.create_ingestion_run(excel_checksum, force=force)
+            logger.info(
+                "Ingestion run created",
+                run_id=run_id,
+                checksum=excel_checksum,
+                changed_sheets=list(changed_sheets),
+                skipped_sheets=skipped_sheets
+            )
             
             # Save extraction report
             extraction_report_path = self.processed_dir / "extraction_report.json"
@@ -169,9 +531,16 @@ class TurboIngestionOrchestrator:
                 json.dump(extraction_results, f, indent=2)
             
             # PHASE 2: LOAD
-            logger.info("Starting LOAD phase")
-            loader = StagingLoader(self.db_url, self.processed_dir)
-            load_results = loader.load_all(extraction_results)
+            if load_results is None:
+                logger.info("Starting LOAD phase")
+                loader = StagingLoader(self.db_url, self.processed_dir, max_parallel=self.load_parallel)
+                load_results = loader.load_all({**extraction_results, 'sheets': changed_sheets})
+            else:
+                # Already streamed; unchanged sheets just aren't merged
+                load_results['results'] = {
+                    name: result for name, result in load_results['results'].items()
+                    if name in changed_sheets
+                }
             
             # Save load report
             load_report_path = self.processed_dir / "load_report.json"
@@ -180,12 +549,15 @@ class TurboIngestionOrchestrator:
             
             # PHASE 3: MERGE
             logger.info("Starting MERGE phase")
-            merger = CoreMerger(self.db_url, run_id)
+            merger = CoreMerger(
+                self.db_url,
+                run_id,
+                metadata_cache_path=self.processed_dir / "schema_metadata_cache.json",
+                max_parallel=self.merge_parallel
+            )
+            # Derived phase columns are written by the merge itself
             merge_results = merger.merge_all(load_results)
             
-            # Populate derived columns
-            merger.populate_derived_columns()
-            
             # Save merge report
             merge_report_path = self.processed_dir / "merge_report.json"
             with open(merge_report_path, 'w') as f:
@@ -203,12 +575,15 @@ class TurboIngestionOrchestrator:
                 processed_rows=total_processed,
                 rejected_rows=total_rejected
             )
+            self.save_sheet_checksums(run_id, part_checksums, extraction_results, merge_results)
             
             elapsed = time.time() - start_time
             
             final_results = {
                 'run_id': run_id,
                 'excel_checksum': excel_checksum,
+                'status': 'completed',
+                'skipped_sheets': skipped_sheets,
                 'total_processed': total_processed,
                 'total_rejected': total_rejected,
                 'elapsed_seconds': round(elapsed, 2),
@@ -255,12 +630,12 @@ class TurboIngestionOrchestrator:
             try:
                 from app.analytics.incremental_aggregates import IncrementalAggregates
                 aggregates = IncrementalAggregates(self.db_url)
-                # Compute for today and last 7 days
+                # Compute for today and last 7 days (one range pass per aggregate)
                 from datetime import date, timedelta
                 today = date.today()
-                for i in range(7):
-                    snapshot_date = today - timedelta(days=i)
-                    aggregates.compute_all_incremental(snapshot_date, run_id)
+                aggregates.compute_range_incremental(today - timedelta(days=6), today, run_id)
+                from app.analytics.rollups import KpiRollups
+                KpiRollups(engine=aggregates.engine).refresh(run_id)
                 logger.info("initial_aggregates_computed")
             except Exception as e:
                 logger.warning("aggregates_computation_failed", error=str(e))
@@ -306,7 +681,11 @@ def main():
     
     try:
         orchestrator = TurboIngestionOrchestrator()
-        results = orchestrator.run()
+        results = orchestrator.run(force="--force" in sys.argv)
+        
+        if results.get('status') == 'unchanged':
+            print(f"Workbook unchanged (checksum {results['excel_checksum']}), run {results['run_id']} already completed.")
+            return 0
         
         print("\n" + "="*80)
         print("TURBO INGESTION COMPLETED")
@@ -316,11 +695,15 @@ def main():
         print(f"Total Processed: {results['total_processed']:,}")
         print(f"Total Rejected: {results['total_rejected']:,}")
         print(f"Elapsed: {results['elapsed_seconds']:.2f}s")
+        if results.get('skipped_sheets'):
+            print(f"Skipped (unchanged): {', '.join(results['skipped_sheets'])}")
         print("\nSheet Statistics:")
         for sheet, merge_result in results['merge']['results'].items():
             print(f"  {sheet}:")
             print(f"    Processed: {merge_result.get('processed', 0):,}")
             print(f"    Rejected: {merge_result.get('rejected', 0):,}")
+            if 'unchanged' in merge_result:
+                print(f"    New/Changed/Unchanged: {merge_result['new']:,}/{merge_result['changed']:,}/{merge_result['unchanged']:,}")
             if 'throughput_rows_per_sec' in merge_result:
                 print(f"    Throughput: {merge_result['throughput_rows_per_sec']:.0f} rows/sec")
         print("="*80)
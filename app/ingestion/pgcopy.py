@@ -0,0 +1,171 @@
+"""
+PGCOPY binary encoder for typed staging loads.
+Encodes rows for COPY ... FROM STDIN WITH (FORMAT binary), so the server
+stores int/float/timestamp values directly instead of parsing CSV text.
+
+Value coercion mirrors what CoreMerger._cast_expr does to the CSV text of
+the same cell, so the text and binary paths merge identical core rows:
+- text: trimmed, '' and NULL/NONE/NIL literals -> NULL
+- int8: only non-negative integral values (regex '^[0-9]+$'), else NULL
+- float8: any number (Excel stores doubles, so no precision is lost)
+- timestamp/date: naive datetime/date values (session TimeZone applies at merge)
+
+A cell that cannot be encoded as its column type (e.g. '01/02/2024' or 'N/A'
+in a timestamp column) is sent as NULL and kept in invalid_cells, so one
+bad cell does not abort the COPY; the merge records those as rejects.
+"""
+import struct
+from datetime import date, datetime
+from typing import Callable, Dict, List, Sequence, Tuple
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack('!ii', 0, 0)  # flags, header extension length
+PGCOPY_TRAILER = struct.pack('!h', -1)
+
+PG_EPOCH_ORDINAL = date(2000, 1, 1).toordinal()
+USECS_PER_DAY = 86_400_000_000
+
+_NULL = struct.pack('!i', -1)
+_NULL_LITERALS = ('NULL', 'NONE', 'NIL')
+
+_pack_int8 = struct.Struct('!iq').pack
+_pack_float8 = struct.Struct('!id').pack
+_pack_int4 = struct.Struct('!ii').pack
+_pack_len = struct.Struct('!i').pack
+
+
+def _text_or_none(value) -> "str | None":
+    """CSV text of a cell after the merge's NULL normalization."""
+    if value is None:
+        return None
+    text = value.isoformat() if isinstance(value, datetime) else str(value)
+    text = text.strip(' ')
+    if not text or text.upper() in _NULL_LITERALS:
+        return None
+    return text
+
+
+def _encode_text(value) -> bytes:
+    text = _text_or_none(value)
+    if text is None:
+        return _NULL
+    data = text.encode('utf-8')
+    return _pack_len(len(data)) + data
+
+
+def _encode_int8(value) -> bytes:
+    if type(value) is int:
+        return _pack_int8(8, value) if value >= 0 else _NULL
+    # bool/float/datetime text never matches '^[0-9]+$'
+    if not isinstance(value, str):
+        return _NULL
+    text = value.strip(' ')
+    if text.isascii() and text.isdigit():
+        return _pack_int8(8, int(text))
+    return _NULL
+
+
+def _encode_float8(value) -> bytes:
+    if value is None:
+        return _NULL
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _pack_float8(8, float(value))
+    text = _text_or_none(value)
+    if text is None:
+        return _NULL
+    # Not a number: same failure as '<text>'::numeric in the CSV path
+    return _pack_float8(8, float(text))
+
+
+def _as_datetime(value) -> "datetime | None":
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            raise ValueError(f"Timezone-aware value not supported in typed staging: {value!r}")
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = _text_or_none(value)
+    if text is None:
+        return None
+    return _as_datetime(datetime.fromisoformat(text))
+
+
+def _encode_timestamp(value) -> bytes:
+    dt = _as_datetime(value)
+    if dt is None:
+        return _NULL
+    days = dt.toordinal() - PG_EPOCH_ORDINAL
+    usecs = (dt.hour * 3600 + dt.minute * 60 + dt.second) * 1_000_000 + dt.microsecond
+    return _pack_int8(8, days * USECS_PER_DAY + usecs)
+
+
+def _encode_date(value) -> bytes:
+    dt = _as_datetime(value)
+    if dt is None:
+        return _NULL
+    return _pack_int4(4, dt.toordinal() - PG_EPOCH_ORDINAL)
+
+
+ENCODERS: Dict[str, Callable[[object], bytes]] = {
+    'text': _encode_text,
+    'int8': _encode_int8,
+    'float8': _encode_float8,
+    'timestamp': _encode_timestamp,
+    'date': _encode_date,
+}
+
+
+class BinaryCopyEncoder:
+    """Encode row tuples into PGCOPY binary tuples for a fixed column layout."""
+
+    def __init__(self, column_types: Sequence[str]):
+        """
+        Initialize encoder.
+
+        Args:
+            column_types: Staging column types, in COPY column order (keys of ENCODERS)
+        """
+        unknown = [t for t in column_types if t not in ENCODERS]
+        if unknown:
+            raise ValueError(f"Unsupported PGCOPY column types: {unknown}")
+        self.column_types: List[str] = list(column_types)
+        self._encoders = [ENCODERS[t] for t in self.column_types]
+        self._field_count = struct.pack('!h', len(self._encoders))
+        self.rows_encoded = 0
+        # (row index, column index, raw value) of cells sent as NULL
+        self.invalid_cells: List[Tuple[int, int, str]] = []
+
+    def encode_row(self, row: Sequence[object]) -> bytes:
+        """
+        Encode one row.
+
+        Short rows are padded with NULLs (ragged read_only rows); extra
+        non-empty cells are an error, as they would be for CSV COPY.
+        """
+        width = len(self._encoders)
+        if len(row) != width:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            elif any(v is not None for v in row[width:]):
+                raise ValueError(f"Row has {len(row)} values, expected {width}")
+        row_index = self.rows_encoded
+        self.rows_encoded += 1
+        try:
+            return self._field_count + b''.join(
+                encode(value) for encode, value in zip(self._encoders, row)
+            )
+        except (ValueError, OverflowError):
+            return self._encode_lenient(row_index, row)
+
+    def _encode_lenient(self, row_index: int, row: Sequence[object]) -> bytes:
+        """Field by field: cells that fail to encode become NULL and are recorded."""
+        parts = [self._field_count]
+        for col, (encode, value) in enumerate(zip(self._encoders, row)):
+            try:
+                parts.append(encode(value))
+            except (ValueError, OverflowError):
+                self.invalid_cells.append((row_index, col, str(value)))
+                parts.append(_NULL)
+        return b''.join(parts)
@@ -0,0 +1,136 @@
+"""
+Schema metadata cache for the merge phase.
+Table resolution, column types and unique keys are cached under a schema
+fingerprint (alembic revision + catalog OIDs/attributes/indexes/FKs), so they
+are looked up once per schema version instead of once per sheet and run.
+Any migration changes the fingerprint, which invalidates the cache.
+"""
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import structlog
+    logger = structlog.get_logger()
+except Exception:
+    import logging
+    logger = logging.getLogger("schema_cache")
+
+# Schemas whose relations CoreMerger resolves
+FINGERPRINT_SCHEMAS = ("public", "core", "staging")
+
+# One pass over pg_catalog (no information_schema views). Partitions and
+# *_rejects tables are excluded: partition maintenance and rejects tables
+# created by the merge itself must not invalidate the cache.
+_FINGERPRINT_SQL = """
+    WITH rels AS (
+      SELECT c.oid, n.nspname, c.relname
+      FROM pg_class c
+      JOIN pg_namespace n ON n.oid = c.relnamespace
+      WHERE n.nspname = ANY(%s)
+        AND c.relkind IN ('r', 'p')
+        AND NOT c.relispartition
+        AND c.relname NOT LIKE '%%\\_rejects'
+    )
+    SELECT
+      (SELECT md5(string_agg(format('%%s.%%s:%%s', nspname, relname, oid), ',' ORDER BY oid)) FROM rels),
+      (SELECT md5(string_agg(format('%%s:%%s:%%s:%%s:%%s', a.attrelid, a.attnum, a.attname, a.atttypid, a.attnotnull),
+                             ',' ORDER BY a.attrelid, a.attnum))
+         FROM pg_attribute a JOIN rels r ON r.oid = a.attrelid
+        WHERE a.attnum > 0 AND NOT a.attisdropped),
+      (SELECT md5(string_agg(format('%%s:%%s:%%s:%%s', i.indexrelid, i.indrelid, i.indisunique, i.indkey),
+                             ',' ORDER BY i.indexrelid))
+         FROM pg_index i JOIN rels r ON r.oid = i.indrelid),
+      (SELECT md5(string_agg(format('%%s:%%s:%%s', k.oid, k.conrelid, k.confrelid), ',' ORDER BY k.oid))
+         FROM pg_constraint k JOIN rels r ON r.oid = k.conrelid
+        WHERE k.contype = 'f')
+"""
+
+# Process-wide: fingerprint -> {kind -> {key -> value}}
+_MEMORY: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+
+class SchemaMetadataCache:
+    """Fingerprint-keyed cache of merge metadata (in process, optionally persisted as JSON)."""
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Initialize cache.
+
+        Args:
+            path: Optional JSON file to reuse metadata across runs
+        """
+        self.path = Path(path) if path else None
+        self.fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._lock = threading.Lock()  # merge_all may merge sheets on several threads
+
+    def compute_fingerprint(self, cur) -> str:
+        """Current schema fingerprint (alembic revision + catalog state)."""
+        revision = None
+        cur.execute("SELECT to_regclass('public.alembic_version')")
+        if cur.fetchone()[0] is not None:
+            cur.execute("SELECT string_agg(version_num, ',' ORDER BY version_num) FROM public.alembic_version")
+            revision = cur.fetchone()[0]
+        cur.execute(_FINGERPRINT_SQL, (list(FINGERPRINT_SCHEMAS),))
+        catalog = "|".join(str(part) for part in cur.fetchone())
+        return f"{revision or 'none'}:{hashlib.sha256(catalog.encode('utf-8')).hexdigest()[:16]}"
+
+    def refresh(self, cur) -> str:
+        """Recompute the fingerprint; switch to (or load) the entries stored under it."""
+        fingerprint = self.compute_fingerprint(cur)
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            if fingerprint not in _MEMORY:
+                _MEMORY[fingerprint] = self._load(fingerprint)
+        return fingerprint
+
+    def _load(self, fingerprint: str) -> Dict[str, Dict[str, Any]]:
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("fingerprint") == fingerprint:
+                    return stored.get("entries") or {}
+            except (OSError, ValueError):
+                logger.warning(f"schema metadata cache unreadable, rebuilding: {self.path}")
+        return {}
+
+    def get(self, kind: str, key: str) -> Tuple[bool, Any]:
+        """Return (found, value) for the current fingerprint."""
+        with self._lock:
+            entries = _MEMORY.get(self.fingerprint or "", {}).get(kind, {})
+            if key in entries:
+                self.hits += 1
+                return True, entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        if self.fingerprint is None:
+            return
+        with self._lock:
+            _MEMORY.setdefault(self.fingerprint, {}).setdefault(kind, {})[key] = value
+            self._dirty = True
+
+    def save(self) -> None:
+        """Persist entries for the current fingerprint (replaces older fingerprints)."""
+        if not (self.path and self.fingerprint and self._dirty):
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "entries": _MEMORY.get(self.fingerprint, {})}, f)
+        tmp.replace(self.path)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
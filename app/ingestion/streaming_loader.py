@@ -7,31 +7,41 @@ from pathlib import Path
 from typing import Iterator, Dict, Any, List, Optional
 import structlog
 
+from app.ingestion.xlsx_reader import XlsxReader
+
 logger = structlog.get_logger()
 
 
 class StreamingExcelLoader:
     """Load Excel sheets in streaming mode (read_only, row-by-row)."""
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, reader: str = 'openpyxl'):
         """
         Initialize loader.
         
         Args:
             file_path: Path to Excel file
+            reader: 'openpyxl' or 'native' (XlsxReader, no cell objects)
         """
         self.file_path = Path(file_path)
         if not self.file_path.exists():
             raise FileNotFoundError(f"Excel file not found: {file_path}")
+        if reader not in ('openpyxl', 'native'):
+            raise ValueError(f"Unknown reader: {reader}")
+        self.reader = reader
         self.workbook = None
     
     def __enter__(self):
         """Context manager entry."""
-        self.workbook = openpyxl.load_workbook(
-            self.file_path,
-            read_only=True,
-            data_only=False  # Keep formulas/formats for inspection
-        )
+        if self.reader == 'native':
+            self.workbook = XlsxReader(str(self.file_path))
+            self.workbook.open()
+        else:
+            self.workbook = openpyxl.load_workbook(
+                self.file_path,
+                read_only=True,
+                data_only=False  # Keep formulas/formats for inspection
+            )
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -58,6 +68,11 @@ class StreamingExcelLoader:
         if not self.workbook:
             raise RuntimeError("Workbook not opened. Use as context manager.")
         
+        if self.reader == 'native':
+            end_row = start_row + max_rows - 1 if max_rows else None
+            yield from self.workbook.iter_rows(sheet_name, min_row=start_row, max_row=end_row)
+            return
+        
         sheet = self.workbook[sheet_name]
         end_row = sheet.max_row
         if max_rows:
@@ -79,8 +94,11 @@ class StreamingExcelLoader:
         if not self.workbook:
             raise RuntimeError("Workbook not opened. Use as context manager.")
         
-        sheet = self.workbook[sheet_name]
-        header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
+        if self.reader == 'native':
+            header_row = next(self.workbook.iter_rows(sheet_name, min_row=1, max_row=1), ())
+        else:
+            sheet = self.workbook[sheet_name]
+            header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
         return [str(cell).strip() if cell else f"col_{i+1}" for i, cell in enumerate(header_row)]
     
     def get_row_count(self, sheet_name: str) -> int:
@@ -96,6 +114,9 @@ class StreamingExcelLoader:
         if not self.workbook:
             raise RuntimeError("Workbook not opened. Use as context manager.")
         
+        if self.reader == 'native':
+            return max(0, self.workbook.max_row(sheet_name) - 1)
+        
         sheet = self.workbook[sheet_name]
         return max(0, sheet.max_row - 1)  # Exclude header
 
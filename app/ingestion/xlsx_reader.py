@@ -0,0 +1,439 @@
+"""
+Native streaming XLSX reader.
+Parses sheet XML and sharedStrings straight from the zip (expat, no tree)
+and yields plain tuples, skipping openpyxl cell/style objects (the dominant CPU cost
+of the turbo pipeline on 500k+ row sheets).
+
+Value semantics follow openpyxl read_only + values_only (data_only=False):
+- shared/inline strings -> str
+- numbers -> int when integral text, else float
+- booleans -> bool
+- numbers whose cell style has a date/time number format -> datetime/time
+  (timedelta for elapsed-time formats), Windows or 1904 epoch
+- formula cells -> the formula ('=A8*2'), not the cached value
+- empty <v/> -> None
+"""
+import zipfile
+import hashlib
+import posixpath
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Dict, Any, List, Optional, Set, Tuple
+from xml.etree.ElementTree import iterparse, XMLParser
+
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import from_excel
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_T_ROW = f"{{{_NS_MAIN}}}row"
+_T_C = f"{{{_NS_MAIN}}}c"
+_T_V = f"{{{_NS_MAIN}}}v"
+_T_T = f"{{{_NS_MAIN}}}t"
+_T_F = f"{{{_NS_MAIN}}}f"
+_T_NUMFMT = f"{{{_NS_MAIN}}}numFmt"
+_T_CELLXFS = f"{{{_NS_MAIN}}}cellXfs"
+_T_XF = f"{{{_NS_MAIN}}}xf"
+_T_SI = f"{{{_NS_MAIN}}}si"
+_T_RPH = f"{{{_NS_MAIN}}}rPh"
+_T_SHEET = f"{{{_NS_MAIN}}}sheet"
+_T_WBPR = f"{{{_NS_MAIN}}}workbookPr"
+_T_DIMENSION = f"{{{_NS_MAIN}}}dimension"
+_T_SHEETDATA = f"{{{_NS_MAIN}}}sheetData"
+_A_RID = f"{{{_NS_REL}}}id"
+
+WINDOWS_EPOCH = datetime(1899, 12, 30)
+MAC_EPOCH = datetime(1904, 1, 1)
+CHUNK_SIZE = 64 * 1024
+
+
+def _column_index(ref: str) -> int:
+    """Convert a cell reference ('AB12') to a 0-based column index."""
+    idx = 0
+    for ch in ref:
+        if 'A' <= ch <= 'Z':
+            idx = idx * 26 + (ord(ch) - 64)
+        else:
+            break
+    return idx - 1
+
+
+def _row_index(ref: str) -> int:
+    """Extract the 1-based row number from a cell reference ('AB12')."""
+    for i, ch in enumerate(ref):
+        if ch.isdigit():
+            return int(ref[i:])
+    return 0
+
+
+def _cast_number(text: str):
+    """Cast numeric cell text the way openpyxl does (int unless decimal/exponent)."""
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+
+class _SheetHandler:
+    """
+    XMLParser target for worksheet XML.
+
+    Builds row value lists straight from expat callbacks, so no Element
+    objects are created per cell. Completed rows accumulate in `rows`
+    as (row_number, values) until the caller drains them.
+    """
+
+    __slots__ = ('rows', 'strings', 'date_styles', 'timedelta_styles', 'epoch', 'max_col',
+                 'row_num', 'values', 'col', 'ref', 'ctype', 'style', 'formula', 'formula_attrib',
+                 'shared_formulae', 'capture', 'text')
+
+    def __init__(self, strings: List[str], date_styles: Set[int], timedelta_styles: Set[int], epoch: datetime):
+        self.rows: List[Tuple[int, List[Any]]] = []
+        self.strings = strings
+        self.date_styles = date_styles
+        self.timedelta_styles = timedelta_styles
+        self.epoch = epoch
+        self.max_col: Optional[int] = None
+        self.row_num = 0
+        self.values: List[Any] = []
+        self.col = 0
+        self.ref: Optional[str] = None
+        self.ctype: Optional[str] = None
+        self.style = 0
+        self.formula: Optional[str] = None
+        self.formula_attrib: Dict[str, str] = {}
+        self.shared_formulae: Dict[str, Translator] = {}
+        self.capture = False
+        self.text: List[str] = []
+
+    def start(self, tag, attrib):
+        if tag == _T_C:
+            values = self.values
+            ref = attrib.get('r')
+            if ref:
+                col = _column_index(ref)
+                if col > len(values):
+                    values.extend([None] * (col - len(values)))
+            self.col = len(values)
+            self.ref = ref
+            self.ctype = attrib.get('t')
+            style = attrib.get('s')
+            self.style = int(style) if style else 0
+            self.formula = None
+            values.append(None)
+        elif tag == _T_V or tag == _T_T:
+            self.capture = True
+            self.text = []
+        elif tag == _T_F:
+            self.capture = True
+            self.text = []
+            self.formula_attrib = attrib
+        elif tag == _T_ROW:
+            r_attr = attrib.get('r')
+            self.row_num = int(r_attr) if r_attr else 0
+            self.values = []
+        elif tag == _T_DIMENSION:
+            ref = attrib.get('ref')
+            if ref:
+                self.max_col = _column_index(ref.split(':')[-1]) + 1
+
+    def data(self, data):
+        if self.capture:
+            self.text.append(data)
+
+    def end(self, tag):
+        if tag == _T_V:
+            self.capture = False
+            text = ''.join(self.text)
+            ctype = self.ctype
+            if not text or ctype == 'inlineStr':
+                value = None
+            elif ctype == 's':
+                value = self.strings[int(text)]
+            elif ctype is None or ctype == 'n':
+                value = _cast_number(text)
+                if self.style in self.date_styles:
+                    try:
+                        value = from_excel(value, self.epoch, timedelta=self.style in self.timedelta_styles)
+                    except (OverflowError, ValueError):
+                        # openpyxl treats out-of-range date serials as an error cell
+                        value = "#VALUE!"
+            elif ctype == 'b':
+                value = bool(int(text))
+            elif ctype == 'd':
+                value = datetime.fromisoformat(text)
+            else:
+                # 'str' (formula string) and 'e' (error)
+                value = text
+            self.values[self.col] = value
+        elif tag == _T_T:
+            # Inline string runs (<is><t>...</t></is>)
+            self.capture = False
+            if self.ctype == 'inlineStr':
+                current = self.values[self.col]
+                self.values[self.col] = (current or '') + ''.join(self.text)
+        elif tag == _T_F:
+            self.capture = False
+            self.formula = "=" + ''.join(self.text)
+        elif tag == _T_C:
+            if self.formula is not None:
+                self.values[self.col] = self._formula_value()
+        elif tag == _T_ROW:
+            self.rows.append((self.row_num, self.values))
+
+    def _formula_value(self):
+        """Formula of the current cell, as openpyxl parse_formula returns it."""
+        value = self.formula
+        attrib = self.formula_attrib
+        formula_type = attrib.get('t')
+        if formula_type == 'array':
+            return ArrayFormula(ref=attrib.get('ref'), text=value)
+        if formula_type == 'shared':
+            idx = attrib.get('si')
+            if idx in self.shared_formulae:
+                return self.shared_formulae[idx].translate_formula(self.ref)
+            if value != "=":
+                self.shared_formulae[idx] = Translator(value, self.ref)
+        elif formula_type == 'dataTable':
+            return DataTableFormula(**attrib)
+        return value
+
+    def close(self):
+        return None
+
+
+class XlsxReader:
+    """Streaming XLSX reader over the raw zip parts."""
+
+    def __init__(self, file_path: str):
+        """
+        Initialize reader.
+
+        Args:
+            file_path: Path to .xlsx file
+        """
+        self.file_path = Path(file_path)
+        if not self.file_path.exists():
+            raise FileNotFoundError(f"Excel file not found: {file_path}")
+        self.zip: Optional[zipfile.ZipFile] = None
+        self.sheet_paths: Dict[str, str] = {}
+        self.shared_strings: List[str] = []
+        self.epoch = WINDOWS_EPOCH
+        # cellXfs indexes whose number format is a date/time (resp. elapsed time)
+        self.date_styles: Set[int] = set()
+        self.timedelta_styles: Set[int] = set()
+
+    def __enter__(self):
+        """Context manager entry."""
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit."""
+        self.close()
+
+    def open(self, shared_strings: bool = True) -> None:
+        """
+        Open the zip and read workbook metadata and shared strings.
+
+        Args:
+            shared_strings: Load the shared string table (skip for metadata-only use)
+        """
+        self.zip = zipfile.ZipFile(self.file_path)
+        self._read_workbook()
+        if shared_strings:
+            self._read_shared_strings()
+            self._read_styles()
+
+    def close(self) -> None:
+        """Close the underlying zip."""
+        if self.zip:
+            self.zip.close()
+            self.zip = None
+
+    @property
+    def sheetnames(self) -> List[str]:
+        """Sheet names in workbook order."""
+        return list(self.sheet_paths.keys())
+
+    def _read_workbook(self) -> None:
+        rels = {}
+        with self.zip.open('xl/_rels/workbook.xml.rels') as f:
+            for _, elem in iterparse(f):
+                if elem.tag == f"{{{_NS_PKG_REL}}}Relationship":
+                    target = elem.get('Target')
+                    if target.startswith('/'):
+                        target = target.lstrip('/')
+                    else:
+                        target = posixpath.normpath(posixpath.join('xl', target))
+                    rels[elem.get('Id')] = target
+
+        with self.zip.open('xl/workbook.xml') as f:
+            for _, elem in iterparse(f):
+                if elem.tag == _T_WBPR and elem.get('date1904') in ('1', 'true'):
+                    self.epoch = MAC_EPOCH
+                elif elem.tag == _T_SHEET:
+                    self.sheet_paths[elem.get('name')] = rels[elem.get(_A_RID)]
+
+    def _read_shared_strings(self) -> None:
+        try:
+            f = self.zip.open('xl/sharedStrings.xml')
+        except KeyError:
+            return
+
+        strings = self.shared_strings
+        with f:
+            for _, elem in iterparse(f):
+                if elem.tag == _T_SI:
+                    # Rich text: concatenate runs, ignoring phonetic (rPh) hints
+                    parts = []
+                    for child in elem:
+                        if child.tag == _T_T:
+                            parts.append(child.text or '')
+                        elif child.tag != _T_RPH:
+                            for t in child.iter(_T_T):
+                                parts.append(t.text or '')
+                    strings.append(''.join(parts))
+                    elem.clear()
+
+    def _read_styles(self) -> None:
+        """Index the date/time cell styles (same rule as openpyxl's stylesheet)."""
+        try:
+            f = self.zip.open('xl/styles.xml')
+        except KeyError:
+            return
+
+        custom: Dict[int, str] = {}
+        xf_formats: List[int] = []
+        in_cell_xfs = False
+        with f:
+            for event, elem in iterparse(f, events=('start', 'end')):
+                if elem.tag == _T_CELLXFS:
+                    in_cell_xfs = event == 'start'
+                elif event == 'end':
+                    if elem.tag == _T_NUMFMT:
+                        custom[int(elem.get('numFmtId'))] = elem.get('formatCode')
+                    elif elem.tag == _T_XF and in_cell_xfs:
+                        xf_formats.append(int(elem.get('numFmtId', 0)))
+
+        for idx, fmt_id in enumerate(xf_formats):
+            fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+            if is_date_format(fmt):
+                self.date_styles.add(idx)
+            if is_timedelta_format(fmt):
+                self.timedelta_styles.add(idx)
+
+    def _part_sha256(self, part: str) -> Optional[str]:
+        try:
+            f = self.zip.open(part)
+        except KeyError:
+            return None
+        sha256 = hashlib.sha256()
+        with f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def part_checksums(self) -> Dict[str, Any]:
+        """
+        SHA256 of the raw XML parts, without parsing any cells.
+
+        A sheet part only holds shared string *indexes*, so an unchanged
+        sheet part is only proof of unchanged content when the shared
+        string table is unchanged too.
+
+        Returns:
+            Dict with 'shared_strings' checksum and per-sheet 'sheets' checksums
+        """
+        if not self.zip:
+            raise RuntimeError("Workbook not opened. Use as context manager.")
+        return {
+            'shared_strings': self._part_sha256('xl/sharedStrings.xml'),
+            'sheets': {name: self._part_sha256(path) for name, path in self.sheet_paths.items()},
+        }
+
+    def max_row(self, sheet_name: str) -> int:
+        """
+        Row count from the sheet <dimension> tag (0 if absent).
+
+        Only the sheet header is parsed; stops at <sheetData>.
+        """
+        with self.zip.open(self.sheet_paths[sheet_name]) as f:
+            for event, elem in iterparse(f, events=('start',)):
+                if elem.tag == _T_DIMENSION:
+                    ref = elem.get('ref', '')
+                    return _row_index(ref.split(':')[-1])
+                if elem.tag == _T_SHEETDATA:
+                    break
+        return 0
+
+    def iter_rows(
+        self,
+        sheet_name: str,
+        min_row: int = 1,
+        max_row: Optional[int] = None
+    ) -> Iterator[Tuple[Any, ...]]:
+        """
+        Iterate over sheet rows as tuples.
+
+        Mirrors openpyxl read_only: when the sheet has a <dimension> tag,
+        rows are padded/truncated to its width and gaps in row numbering
+        are yielded as all-None rows; unsized sheets yield ragged rows.
+
+        Args:
+            sheet_name: Name of sheet
+            min_row: First row to yield (1-indexed)
+            max_row: Last row to yield (None = all)
+
+        Yields:
+            Tuple of cell values for each row
+        """
+        if not self.zip:
+            raise RuntimeError("Workbook not opened. Use as context manager.")
+
+        handler = _SheetHandler(self.shared_strings, self.date_styles, self.timedelta_styles, self.epoch)
+        parser = XMLParser(target=handler)
+        expected_row = 1
+
+        with self.zip.open(self.sheet_paths[sheet_name]) as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if chunk:
+                    parser.feed(chunk)
+                else:
+                    parser.close()
+
+                width = handler.max_col
+                empty_row = (None,) * width if width else ()
+
+                for row_num, values in handler.rows:
+                    if row_num == 0:
+                        row_num = expected_row
+                    if max_row is not None and row_num > max_row:
+                        for missing in range(expected_row, max_row + 1):
+                            if missing >= min_row:
+                                yield empty_row
+                        return
+
+                    # Empty rows skipped in the XML
+                    while expected_row < row_num:
+                        if expected_row >= min_row:
+                            yield empty_row
+                        expected_row += 1
+                    expected_row = row_num + 1
+
+                    if row_num < min_row:
+                        continue
+                    if width:
+                        if len(values) < width:
+                            values.extend([None] * (width - len(values)))
+                        elif len(values) > width:
+                            del values[width:]
+                    yield tuple(values)
+                handler.rows.clear()
+
+                if not chunk:
+                    break
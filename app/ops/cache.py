@@ -1,31 +1,189 @@
 """
 Cache versionado com singleflight para evitar stampede.
+
+Two tiers: a bounded in-process LRU (L1) in front of Redis (L2), both keyed
+by the versioned key, so a cache_version bump invalidates both.
 """
-from typing import Optional, Any, Callable
+from typing import Optional, Any, Callable, Dict, Union
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import redis
 import json
 import hashlib
+import os
 import asyncio
+import inspect
+import threading
 import time
+import uuid
 import structlog
 
 logger = structlog.get_logger()
 
-# Global singleflight locks (in-memory)
-_singleflight_locks = {}
-_singleflight_results = {}
+try:
+    from app.ops.metrics import cache_tier_requests, cache_tier_bytes, cache_tier_entries, cache_tier_evictions
+    HAS_METRICS = True
+except ImportError:
+    HAS_METRICS = False
+
+# L1 budget (approximate bytes: serialized size + ENTRY_OVERHEAD per entry)
+# and max entry lifetime; L1 may lag Redis by up to L1_MAX_TTL seconds
+L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(32 * 1024 * 1024)))
+L1_MAX_TTL = float(os.getenv("CACHE_L1_MAX_TTL", "5"))
+ENTRY_OVERHEAD = 200
+
+# Seconds between re-reads of ops_cache_version (bumps from other processes)
+VERSION_CHECK_INTERVAL = 5.0
+
+# Seconds between samples of Redis used_memory for the L2 memory gauge
+L2_MEMORY_SAMPLE_INTERVAL = 30.0
+
+# Singleflight: one in-flight computation per cache key in this process.
+# Futures work for sync callers (result()) and async ones (wrap_future).
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Lease owner check-and-delete (a lease that expired and was taken over is not ours)
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Polling bounds while another process holds the lease
+_LEASE_POLL_MIN = 0.01
+_LEASE_POLL_MAX = 0.2
+
+
+def _count_tier(tier: str, result: str):
+    if HAS_METRICS:
+        cache_tier_requests.labels(tier=tier, result=result).inc()
+
+
+class LocalCache:
+    """
+    In-process L1 tier: LRU bounded by approximate bytes, with per-entry TTL.
+    
+    Values are stored deserialized and shared between callers (read-only).
+    """
+    
+    def __init__(self, max_bytes: int = L1_MAX_BYTES, max_ttl: float = L1_MAX_TTL):
+        """
+        Initialize local cache.
+        
+        Args:
+            max_bytes: Byte budget (entries larger than this are not kept)
+            max_ttl: Upper bound of any entry's TTL in seconds
+        """
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Value if present and not expired (and mark it most recently used)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self._evicted("expired")
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+    
+    def set(self, key: str, value: Any, ttl: float, size: int) -> bool:
+        """
+        Store a value, evicting least recently used entries past the budget.
+        
+        Args:
+            key: Versioned cache key
+            value: Deserialized value
+            ttl: Requested TTL (capped at max_ttl)
+            size: Serialized size in bytes
+        
+        Returns:
+            False if the value is too large (or ttl too short) to keep
+        """
+        size += ENTRY_OVERHEAD
+        ttl = min(ttl, self.max_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes or ttl <= 0:
+                self._observe()
+                return False
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._evicted("lru")
+            self._observe()
+        return True
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._observe()
+    
+    def usage(self) -> Dict[str, int]:
+        """Entries and approximate bytes held."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+    
+    def _drop(self, key: str):
+        self._bytes -= self._entries.pop(key)[1]
+    
+    @staticmethod
+    def _evicted(reason: str):
+        if HAS_METRICS:
+            cache_tier_evictions.labels(tier="local", reason=reason).inc()
+    
+    def _observe(self):
+        if HAS_METRICS:
+            cache_tier_bytes.labels(tier="local").set(self._bytes)
+            cache_tier_entries.labels(tier="local").set(len(self._entries))
+
+
+# One L1 per process, shared by every VersionedCache (single byte budget)
+_local_cache: Optional[LocalCache] = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache() -> LocalCache:
+    """Get or create the process-wide L1 tier."""
+    global _local_cache
+    with _local_cache_lock:
+        if _local_cache is None:
+            _local_cache = LocalCache()
+        return _local_cache
 
 
 class VersionedCache:
     """Cache versionado com singleflight."""
     
-    def __init__(self, redis_url: str = "redis://localhost:6379/0", db_url: str = None):
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379/0",
+        db_url: str = None,
+        distributed_lease: bool = False,
+        lease_ms: int = 30000,
+        local_cache: Optional[LocalCache] = None
+    ):
         """
         Initialize versioned cache.
         
         Args:
             redis_url: Redis URL
             db_url: Database URL (para ler cache_version)
+            distributed_lease: Take a Redis lease per key on a miss so only one
+                process recomputes it cluster-wide
+            lease_ms: Lease expiry (upper bound of a computation)
+            local_cache: L1 tier (default: the process-wide one)
         """
         try:
             self.redis_client = redis.from_url(redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1)
@@ -35,41 +193,55 @@ class VersionedCache:
             logger.warning("redis_not_available", message=f"Redis not available (optional), caching disabled: {str(e)}")
         
         self.db_url = db_url
+        self._engine = None
         self._cache_version = None
+        self._version_checked_at = 0.0
+        self._l2_memory_sampled_at = 0.0
+        self.local = local_cache if local_cache is not None else get_local_cache()
+        self.distributed_lease = distributed_lease
+        self.lease_ms = lease_ms
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "lease_waits": 0}
+    
+    def _get_engine(self):
+        if self._engine is None:
+            from sqlalchemy import create_engine
+            self._engine = create_engine(self.db_url)
+        return self._engine
     
     def get_cache_version(self) -> int:
-        """Get current cache version from DB."""
-        if self._cache_version is not None:
+        """Get current cache version from DB (re-read every VERSION_CHECK_INTERVAL seconds)."""
+        now = time.monotonic()
+        if self._cache_version is not None and now - self._version_checked_at < VERSION_CHECK_INTERVAL:
             return self._cache_version
         
         if not self.db_url:
             return 1
         
-        from sqlalchemy import create_engine, text
-        engine = create_engine(self.db_url)
+        from sqlalchemy import text
         
         try:
-            with engine.connect() as conn:
+            with self._get_engine().connect() as conn:
                 result = conn.execute(text("SELECT cache_version FROM ops_cache_version LIMIT 1"))
                 row = result.fetchone()
                 if row:
                     self._cache_version = int(row[0])
+                    self._version_checked_at = now
                     return self._cache_version
         except:
             pass
         
-        return 1
+        return self._cache_version or 1
     
     def increment_cache_version(self):
         """Increment cache version (after ingestion, backfill, etc.)."""
         if not self.db_url:
             return
         
-        from sqlalchemy import create_engine, text
-        engine = create_engine(self.db_url)
+        from sqlalchemy import text
         
         try:
-            with engine.connect() as conn:
+            with self._get_engine().connect() as conn:
                 conn.execute(text("UPDATE ops_cache_version SET cache_version = cache_version + 1"))
                 conn.commit()
             self._cache_version = None  # Invalidate cache
@@ -101,19 +273,31 @@ class VersionedCache:
         Returns:
             Cached value or None
         """
-        if not self.redis_client:
-            return None
-        
-        key = self._make_key(endpoint, params)
-        
+        return self._read(self._make_key(endpoint, params))
+    
+    def _read(self, key: str) -> Optional[Any]:
+        value = self._read_local(key)
+        if value is None and self.redis_client:
+            value = self._read_redis(key)
+        return value
+    
+    def _read_local(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        _count_tier("local", "miss" if value is None else "hit")
+        return value
+    
+    def _read_redis(self, key: str) -> Optional[Any]:
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
+            raw = self.redis_client.get(key)
         except Exception as e:
             logger.warning("cache_get_error", error=str(e))
-        
-        return None
+            return None
+        _count_tier("redis", "hit" if raw else "miss")
+        if not raw:
+            return None
+        value = json.loads(raw)
+        self.local.set(key, value, self.local.max_ttl, len(raw))
+        return value
     
     def set(
         self,
@@ -131,19 +315,31 @@ class VersionedCache:
             value: Value to cache
             ttl: TTL in seconds
         """
+        self._write(self._make_key(endpoint, params), value, ttl)
+    
+    def _write(self, key: str, value: Any, ttl: int):
+        raw = json.dumps(value, default=str)
+        # L1 holds what L2 would return (e.g. datetimes as strings)
+        self.local.set(key, json.loads(raw), ttl, len(raw))
         if not self.redis_client:
             return
-        
-        key = self._make_key(endpoint, params)
-        
         try:
-            self.redis_client.setex(
-                key,
-                ttl,
-                json.dumps(value, default=str)
-            )
+            self.redis_client.setex(key, ttl, raw)
         except Exception as e:
             logger.warning("cache_set_error", error=str(e))
+        self._sample_redis_memory()
+    
+    def _sample_redis_memory(self):
+        """Export Redis used_memory as the L2 memory gauge (rate-limited)."""
+        now = time.monotonic()
+        if not HAS_METRICS or now - self._l2_memory_sampled_at < L2_MEMORY_SAMPLE_INTERVAL:
+            return
+        self._l2_memory_sampled_at = now
+        try:
+            info = self.redis_client.info("memory")
+            cache_tier_bytes.labels(tier="redis").set(int(info.get("used_memory", 0)))
+        except Exception as e:
+            logger.warning("cache_memory_sample_error", error=str(e))
     
     def get_or_compute(
         self,
@@ -156,57 +352,188 @@ class VersionedCache:
         """
         Get from cache or compute with singleflight.
         
+        Concurrent misses on the same key in this process share one
+        computation (a per-key future); with distributed_lease, one process
+        cluster-wide computes while the others wait for its cached value.
+        
         Args:
             endpoint: Endpoint name
             params: Parameters dict
             compute_func: Function to compute value if cache miss
             ttl: TTL in seconds
-            stale_ttl: Stale TTL (return stale while computing)
+            stale_ttl: Max seconds to wait for another computation before
+                computing independently
         
         Returns:
             Cached or computed value
         """
-        # Try cache first
-        cached = self.get(endpoint, params, ttl)
+        key = self._make_key(endpoint, params)
+        cached = self._read(key)
         if cached is not None:
+            self._count("hits")
             return cached
         
-        # Singleflight: check if already computing
+        future, leader = self._join_flight(key)
+        if not leader:
+            try:
+                return future.result(timeout=stale_ttl)
+            except FutureTimeoutError:
+                logger.warning("singleflight_wait_timeout", key=key)
+                return compute_func()
+        
+        try:
+            token = self._acquire_lease(key)
+            result = self._wait_for_remote(key, stale_ttl) if token is False else None
+            if result is None:
+                try:
+                    result = compute_func()
+                    self._write(key, result, ttl)
+                finally:
+                    if token:
+                        self._release_lease(key, token)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave_flight(key, future)
+    
+    async def get_or_compute_async(
+        self,
+        endpoint: str,
+        params: dict,
+        compute_func: Callable[[], Any],
+        ttl: int = 60,
+        stale_ttl: int = 5
+    ) -> Any:
+        """
+        Async get_or_compute: compute_func may be sync or a coroutine function.
+        
+        Shares in-flight computations with sync callers; Redis calls run in a
+        worker thread so the event loop is never blocked.
+        """
         key = self._make_key(endpoint, params)
-        lock_key = f"{key}:lock"
-        
-        # Check in-memory lock
-        if lock_key in _singleflight_locks:
-            # Wait for result (with timeout)
-            start = time.time()
-            while lock_key in _singleflight_locks and time.time() - start < stale_ttl:
-                time.sleep(0.1)
-            
-            # Check if result is ready
-            if lock_key in _singleflight_results:
-                result = _singleflight_results.pop(lock_key)
-                _singleflight_locks.pop(lock_key, None)
-                return result
-        
-        # Acquire lock
-        _singleflight_locks[lock_key] = True
+        cached = self._read_local(key)
+        if cached is None and self.redis_client:
+            cached = await asyncio.to_thread(self._read_redis, key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+        
+        future, leader = self._join_flight(key)
+        if not leader:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=stale_ttl)
+            except asyncio.TimeoutError:
+                logger.warning("singleflight_wait_timeout", key=key)
+                return await self._call_async(compute_func)
         
         try:
-            # Compute value
-            result = compute_func()
-            
-            # Cache it
-            self.set(endpoint, params, result, ttl)
-            
-            # Store result for other waiters
-            _singleflight_results[lock_key] = result
-            
+            token = await asyncio.to_thread(self._acquire_lease, key)
+            result = await self._wait_for_remote_async(key, stale_ttl) if token is False else None
+            if result is None:
+                try:
+                    result = await self._call_async(compute_func)
+                    await asyncio.to_thread(self._write, key, result, ttl)
+                finally:
+                    if token:
+                        await asyncio.to_thread(self._release_lease, key, token)
+            future.set_result(result)
             return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
         finally:
-            # Release lock after a short delay (for other waiters)
-            time.sleep(0.1)
-            _singleflight_locks.pop(lock_key, None)
-            _singleflight_results.pop(lock_key, None)
+            self._leave_flight(key, future)
+    
+    @staticmethod
+    async def _call_async(compute_func: Callable[[], Any]) -> Any:
+        if inspect.iscoroutinefunction(compute_func):
+            return await compute_func()
+        result = await asyncio.to_thread(compute_func)
+        return await result if inspect.isawaitable(result) else result
+    
+    def _join_flight(self, key: str):
+        """Return (future, is_leader): the first miss on a key leads, later ones wait on its future."""
+        with _inflight_lock:
+            future = _inflight.get(key)
+            if future is not None:
+                self._count("coalesced")
+                return future, False
+            future = Future()
+            _inflight[key] = future
+        self._count("misses")
+        return future, True
+    
+    @staticmethod
+    def _leave_flight(key: str, future: Future):
+        with _inflight_lock:
+            if _inflight.get(key) is future:
+                del _inflight[key]
+    
+    def _acquire_lease(self, key: str) -> Union[str, bool, None]:
+        """Lease token if acquired, False if another process holds it, None if leases are off/unavailable."""
+        if not (self.distributed_lease and self.redis_client):
+            return None
+        token = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(f"{key}:lease", token, nx=True, px=self.lease_ms):
+                return token
+            return False
+        except Exception as e:
+            logger.warning("cache_lease_error", error=str(e))
+            return None
+    
+    def _release_lease(self, key: str, token: str):
+        try:
+            self.redis_client.eval(_RELEASE_LEASE_SCRIPT, 1, f"{key}:lease", token)
+        except Exception as e:
+            logger.warning("cache_lease_release_error", error=str(e))
+    
+    def _remote_poll(self, key: str) -> tuple:
+        """(cached value, lease still held) for a key another process is computing."""
+        value = self._read_redis(key)
+        if value is not None:
+            return value, False
+        try:
+            return None, bool(self.redis_client.exists(f"{key}:lease"))
+        except Exception:
+            return None, False
+    
+    def _wait_for_remote(self, key: str, timeout: float) -> Optional[Any]:
+        """Wait (bounded backoff) for the lease holder's value; None -> compute locally."""
+        self._count("lease_waits")
+        deadline = time.monotonic() + timeout
+        delay = _LEASE_POLL_MIN
+        while time.monotonic() < deadline:
+            value, held = self._remote_poll(key)
+            if value is not None or not held:
+                return value
+            time.sleep(delay)
+            delay = min(delay * 2, _LEASE_POLL_MAX)
+        return None
+    
+    async def _wait_for_remote_async(self, key: str, timeout: float) -> Optional[Any]:
+        self._count("lease_waits")
+        deadline = time.monotonic() + timeout
+        delay = _LEASE_POLL_MIN
+        while time.monotonic() < deadline:
+            value, held = await asyncio.to_thread(self._remote_poll, key)
+            if value is not None or not held:
+                return value
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _LEASE_POLL_MAX)
+        return None
+    
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+    
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss (computations led), coalesced-waiter and lease-wait counters."""
+        with self._stats_lock:
+            return dict(self._stats)
     
     def invalidate(self, pattern: str = "*"):
         """
@@ -215,9 +542,6 @@ class VersionedCache:
         Args:
             pattern: Redis pattern (default: all)
         """
-        if not self.redis_client:
-            return
-        
         try:
             # Increment version (invalidates all keys with old version)
             self.increment_cache_version()
@@ -232,6 +556,10 @@ def get_cache(db_url: str = None) -> VersionedCache:
     """Get or create cache instance."""
     global _cache_instance
     if _cache_instance is None:
-        _cache_instance = VersionedCache(db_url=db_url)
+        # Several API processes share Redis: opt in to the cluster-wide lease
+        _cache_instance = VersionedCache(
+            db_url=db_url,
+            distributed_lease=os.getenv("CACHE_DISTRIBUTED_LEASE", "").lower() in ("true", "1", "yes")
+        )
     return _cache_instance
 
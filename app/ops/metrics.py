@@ -56,6 +56,31 @@ cache_misses = Counter(
     ['cache_key']
 )
 
+# Two-tier cache (tier: 'local' in-process LRU, 'redis')
+cache_tier_requests = Counter(
+    'cache_tier_requests_total',
+    'Cache lookups per tier',
+    ['tier', 'result']
+)
+
+cache_tier_bytes = Gauge(
+    'cache_tier_bytes',
+    'Memory used per cache tier (local: approximate serialized bytes)',
+    ['tier']
+)
+
+cache_tier_entries = Gauge(
+    'cache_tier_entries',
+    'Entries held per cache tier',
+    ['tier']
+)
+
+cache_tier_evictions = Counter(
+    'cache_tier_evictions_total',
+    'Cache entries evicted per tier',
+    ['tier', 'reason']
+)
+
 
 def track_request_time(func):
     """Decorator to track request time."""
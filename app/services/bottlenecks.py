@@ -6,6 +6,8 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 import structlog
 
+from app.analytics.quantile_sketch import window_quantiles_sql
+
 logger = structlog.get_logger()
 
 
@@ -119,8 +121,13 @@ class BottleneckService:
         Returns:
             List of at-risk orders
         """
-        query = text("""
-            WITH order_etas AS (
+        # Historical medians per (produto, fase) merged from the daily
+        # duration sketches instead of sorting raw phases per open phase
+        query = text(f"""
+            WITH phase_medians AS (
+                {window_quantiles_sql("phase_duration", (0.5,))}
+            ),
+            order_etas AS (
                 SELECT 
                     of.of_id,
                     of.of_produto_id,
@@ -129,15 +136,10 @@ class BottleneckService:
                     -- ETA: soma de medianas históricas por fase restante
                     COALESCE(
                         (SELECT SUM(COALESCE(
-                            (SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY faseof_duration_seconds)
-                             FROM fases_ordem_fabrico fof2
-                             JOIN ordens_fabrico of2 ON fof2.faseof_of_id = of2.of_id
-                             WHERE of2.of_produto_id = of.of_produto_id
-                               AND fof2.faseof_fase_id = fof.faseof_fase_id
-                               AND fof2.faseof_fim IS NOT NULL
-                               AND fof2.faseof_inicio IS NOT NULL
-                               AND EXTRACT(EPOCH FROM (fof2.faseof_fim - fof2.faseof_inicio)) > 0
-                             LIMIT 1),
+                            (SELECT pm.p50_seconds
+                             FROM phase_medians pm
+                             WHERE pm.produto_id = of.of_produto_id
+                               AND pm.fase_id = fof.faseof_fase_id),
                             -- Fallback: baseline por coeficientes
                             (SELECT COALESCE(
                                 fsm.coeficiente * COALESCE(fof.faseof_peso, m.produto_peso_desmolde, 0) + fsm.coeficiente_x,
@@ -157,15 +159,10 @@ class BottleneckService:
                     ) as remaining_seconds,
                     NOW() + COALESCE(
                         (SELECT SUM(COALESCE(
-                            (SELECT PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY faseof_duration_seconds)
-                             FROM fases_ordem_fabrico fof2
-                             JOIN ordens_fabrico of2 ON fof2.faseof_of_id = of2.of_id
-                             WHERE of2.of_produto_id = of.of_produto_id
-                               AND fof2.faseof_fase_id = fof.faseof_fase_id
-                               AND fof2.faseof_fim IS NOT NULL
-                               AND fof2.faseof_inicio IS NOT NULL
-                               AND EXTRACT(EPOCH FROM (fof2.faseof_fim - fof2.faseof_inicio)) > 0
-                             LIMIT 1),
+                            (SELECT pm.p50_seconds
+                             FROM phase_medians pm
+                             WHERE pm.produto_id = of.of_produto_id
+                               AND pm.fase_id = fof.faseof_fase_id),
                             (SELECT COALESCE(
                                 fsm.coeficiente * COALESCE(fof.faseof_peso, m.produto_peso_desmolde, 0) + fsm.coeficiente_x,
                                 3600
@@ -0,0 +1,268 @@
+"""
+KPIs Service: overview, by phase and by product.
+Served from the aggregate tiers only (daily + weekly/monthly rollups);
+no raw-table scans on the request path.
+"""
+import math
+from typing import Optional, List, Dict, Any, Sequence, Tuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, text
+import structlog
+
+from app.analytics.distinct_sketch import RELATIVE_STD_ERROR, bounds, estimate
+from app.analytics.quantile_sketch import QuantileSketch
+from app.analytics.rollups import window_sql
+
+logger = structlog.get_logger()
+
+# Window used when the request gives no 'from'
+DEFAULT_WINDOW_DAYS = 30
+
+
+def moments(n, total, total_sq) -> Tuple[Optional[float], Optional[float]]:
+    """Mean and (population) standard deviation from n, sum and sum of squares."""
+    n = float(n or 0)
+    if n <= 0:
+        return None, None
+    mean = float(total) / n
+    variance = max(float(total_sq) / n - mean * mean, 0.0)
+    return mean, math.sqrt(variance)
+
+
+def _hours(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds / 3600.0, 3) if seconds is not None else None
+
+
+class KpiService:
+    """KPI service over the mergeable aggregate tiers."""
+
+    def __init__(self, db_url: str):
+        """
+        Initialize service.
+
+        Args:
+            db_url: Database URL
+        """
+        self.engine = create_engine(db_url)
+
+    @staticmethod
+    def window(
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None
+    ) -> Tuple[date, date]:
+        """
+        Days covered by a request: [from, to] inclusive, as a half-open [start, end).
+
+        Defaults to the last DEFAULT_WINDOW_DAYS days up to today.
+        """
+        end = (to_date.date() if to_date else date.today()) + timedelta(days=1)
+        start = from_date.date() if from_date else end - timedelta(days=DEFAULT_WINDOW_DAYS)
+        return start, max(start, end)
+
+    def get_overview(
+        self,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Get KPIs overview for a window.
+
+        Args:
+            from_date: First day
+            to_date: Last day (inclusive)
+
+        Returns:
+            Phase duration, order lead time and quality KPIs
+        """
+        start, end = self.window(from_date, to_date)
+        phases = self._phase_kpis(start, end, [])
+        orders = self._order_kpis(start, end, [])
+        quality = self._quality_kpis(start, end, [])
+        return {
+            "from_date": start.isoformat(),
+            "to_date": (end - timedelta(days=1)).isoformat(),
+            "phases": phases.get((), self._empty_phase()),
+            "orders": orders.get((), self._empty_order()),
+            "quality": quality.get((), self._empty_quality()),
+        }
+
+    def get_by_phase(
+        self,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        fase_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Get KPIs per phase (durations; errors detected at the phase).
+
+        Args:
+            from_date: First day
+            to_date: Last day (inclusive)
+            fase_id: Filter by phase
+
+        Returns:
+            One entry per phase
+        """
+        start, end = self.window(from_date, to_date)
+        phases = self._phase_kpis(start, end, ["fase_id"], "fase_id", fase_id)
+        quality = self._quality_kpis(start, end, ["fase_avaliacao_id"], "fase_avaliacao_id", fase_id)
+
+        by_phase = [
+            {
+                "fase_id": key[0],
+                **phases.get(key, self._empty_phase()),
+                "quality": quality.get(key, self._empty_quality()),
+            }
+            for key in sorted(set(phases) | set(quality), key=lambda k: (k[0] is None, k[0]))
+        ]
+        return {
+            "from_date": start.isoformat(),
+            "to_date": (end - timedelta(days=1)).isoformat(),
+            "by_phase": by_phase,
+        }
+
+    def get_by_product(
+        self,
+        from_date: Optional[datetime] = None,
+        to_date: Optional[datetime] = None,
+        produto_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Get KPIs per product (lead time, durations, errors).
+
+        Args:
+            from_date: First day
+            to_date: Last day (inclusive)
+            produto_id: Filter by product
+
+        Returns:
+            One entry per product
+        """
+        start, end = self.window(from_date, to_date)
+        phases = self._phase_kpis(start, end, ["produto_id"], "produto_id", produto_id)
+        orders = self._order_kpis(start, end, ["produto_id"], "produto_id", produto_id)
+        quality = self._quality_kpis(start, end, ["produto_id"], "produto_id", produto_id)
+
+        by_product = [
+            {
+                "produto_id": key[0],
+                "orders": orders.get(key, self._empty_order()),
+                "phases": phases.get(key, self._empty_phase()),
+                "quality": quality.get(key, self._empty_quality()),
+            }
+            for key in sorted(set(phases) | set(orders) | set(quality), key=lambda k: (k[0] is None, k[0]))
+        ]
+        return {
+            "from_date": start.isoformat(),
+            "to_date": (end - timedelta(days=1)).isoformat(),
+            "by_product": by_product,
+        }
+
+    def _rows(
+        self,
+        name: str,
+        start: date,
+        end: date,
+        group_by: Sequence[str],
+        filter_col: Optional[str] = None,
+        filter_value: Optional[int] = None
+    ) -> List[Any]:
+        """Merged measures of one rollup over the window (coarsest tiers first)."""
+        where_clause = "TRUE"
+        params: Dict[str, Any] = {}
+        if filter_col and filter_value is not None:
+            where_clause = f"{filter_col} = :filter_value"
+            params["filter_value"] = filter_value
+        sql, window_params = window_sql(name, start, end, group_by=group_by, where_clause=where_clause)
+        with self.engine.connect() as conn:
+            return conn.execute(text(sql), {**window_params, **params}).fetchall()
+
+    def _quantiles(self, name: str, start: date, end: date, group_by: Sequence[str], *filter_args):
+        """p50/p90 per group from a quantile-sketch rollup."""
+        sketches: Dict[tuple, QuantileSketch] = {}
+        for row in self._rows(name, start, end, list(group_by) + ["bucket"], *filter_args):
+            key = tuple(row[:len(group_by)])
+            sketches.setdefault(key, QuantileSketch()).counts[row[len(group_by)]] = int(row[-1])
+        return {
+            key: (sketch.quantile(0.5), sketch.quantile(0.9))
+            for key, sketch in sketches.items()
+        }
+
+    def _phase_kpis(self, start: date, end: date, group_by: List[str], *filter_args) -> Dict[tuple, Dict[str, Any]]:
+        quantiles = self._quantiles("phase_duration_sketch", start, end, group_by, *filter_args)
+        out = {}
+        for row in self._rows("phase_stats", start, end, group_by, *filter_args):
+            key = tuple(row[:len(group_by)])
+            n, total, total_sq, min_s, max_s = row[len(group_by):]
+            mean, std = moments(n, total, total_sq)
+            p50, p90 = quantiles.get(key, (None, None))
+            out[key] = {
+                "phase_count": int(n or 0),
+                "avg_duration_hours": _hours(mean),
+                "std_duration_hours": _hours(std),
+                "min_duration_hours": _hours(float(min_s)) if min_s is not None else None,
+                "max_duration_hours": _hours(float(max_s)) if max_s is not None else None,
+                "p50_duration_hours": _hours(p50),
+                "p90_duration_hours": _hours(p90),
+            }
+        return out
+
+    def _order_kpis(self, start: date, end: date, group_by: List[str], *filter_args) -> Dict[tuple, Dict[str, Any]]:
+        quantiles = self._quantiles("order_leadtime_sketch", start, end, group_by, *filter_args)
+        out = {}
+        for row in self._rows("order_stats", start, end, group_by, *filter_args):
+            key = tuple(row[:len(group_by)])
+            n, total, total_sq, on_time, late = row[len(group_by):]
+            mean, std = moments(n, total, total_sq)
+            p50, p90 = quantiles.get(key, (None, None))
+            with_due = int(on_time or 0) + int(late or 0)
+            out[key] = {
+                "order_count": int(n or 0),
+                "avg_leadtime_hours": _hours(mean),
+                "std_leadtime_hours": _hours(std),
+                "p50_leadtime_hours": _hours(p50),
+                "p90_leadtime_hours": _hours(p90),
+                "on_time_count": int(on_time or 0),
+                "late_count": int(late or 0),
+                "on_time_rate": round(int(on_time or 0) / with_due, 4) if with_due else None,
+            }
+        return out
+
+    def _quality_kpis(self, start: date, end: date, group_by: List[str], *filter_args) -> Dict[tuple, Dict[str, Any]]:
+        registers: Dict[tuple, List[int]] = {}
+        for row in self._rows("quality_orders_hll", start, end, list(group_by) + ["register"], *filter_args):
+            registers.setdefault(tuple(row[:len(group_by)]), []).append(int(row[-1]))
+        out = {}
+        for row in self._rows("quality_stats", start, end, group_by, *filter_args):
+            key = tuple(row[:len(group_by)])
+            n_errors, sum_gravidade = row[len(group_by):]
+            rhos = registers.get(key, [])
+            distinct = estimate(len(rhos), sum(2.0 ** -rho for rho in rhos)) if rhos else 0.0
+            low, high = bounds(len(rhos), distinct) if rhos else (0.0, 0.0)
+            out[key] = {
+                "error_count": int(n_errors or 0),
+                "avg_gravidade": round(float(sum_gravidade) / int(n_errors), 3) if n_errors else None,
+                "affected_orders": round(distinct),
+                "affected_orders_low": math.floor(low),
+                "affected_orders_high": math.ceil(high),
+                "affected_orders_relative_error": RELATIVE_STD_ERROR,
+            }
+        return out
+
+    @staticmethod
+    def _empty_phase() -> Dict[str, Any]:
+        return {"phase_count": 0, "avg_duration_hours": None, "std_duration_hours": None,
+                "min_duration_hours": None, "max_duration_hours": None,
+                "p50_duration_hours": None, "p90_duration_hours": None}
+
+    @staticmethod
+    def _empty_order() -> Dict[str, Any]:
+        return {"order_count": 0, "avg_leadtime_hours": None, "std_leadtime_hours": None,
+                "p50_leadtime_hours": None, "p90_leadtime_hours": None,
+                "on_time_count": 0, "late_count": 0, "on_time_rate": None}
+
+    @staticmethod
+    def _empty_quality() -> Dict[str, Any]:
+        return {"error_count": 0, "avg_gravidade": None, "affected_orders": 0,
+                "affected_orders_low": 0, "affected_orders_high": 0,
+                "affected_orders_relative_error": RELATIVE_STD_ERROR}
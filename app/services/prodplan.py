@@ -6,10 +6,12 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
-import redis
 import json
 import structlog
 
+from app.analytics.incremental_aggregates import WIP_AGE_COLUMNS_SQL
+from app.ops.cache import VersionedCache
+
 logger = structlog.get_logger()
 
 
@@ -32,12 +34,9 @@ class ProdplanService:
             logger.error("database_connection_failed", error=str(e))
             raise
         
-        try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1)
-            self.redis_client.ping()  # Test connection
-        except Exception as e:
-            self.redis_client = None
-            logger.warning("redis_not_available", message=f"Redis not available (optional), caching disabled: {str(e)}")
+        # Two-tier cache (in-process LRU + Redis), keys versioned by ops_cache_version
+        self.cache = VersionedCache(redis_url=redis_url, db_url=db_url)
+        self.redis_client = self.cache.redis_client
     
     def get_orders(
         self,
@@ -166,13 +165,12 @@ class ProdplanService:
         Returns:
             Order dict or None
         """
-        cache_key = f"order:{of_id}"
+        cache_params = {'of_id': of_id}
         
         # Check cache
-        if self.redis_client:
-            cached = self.redis_client.get(cache_key)
-            if cached:
-                return json.loads(cached)
+        cached = self.cache.get("order", cache_params)
+        if cached is not None:
+            return cached
         
         query = text("""
             SELECT 
@@ -203,8 +201,7 @@ class ProdplanService:
             }
             
             # Cache for 60 seconds
-            if self.redis_client:
-                self.redis_client.setex(cache_key, 60, json.dumps(order))
+            self.cache.set("order", cache_params, order, ttl=60)
             
             return order
     
@@ -270,25 +267,23 @@ class ProdplanService:
         Returns:
             Schedule dict with WIP and queue by phase
         """
-        cache_key = f"schedule:current:{fase_id or 'all'}"
+        cache_params = {'fase_id': fase_id or 'all'}
         
         # Check cache (30 second TTL)
-        if self.redis_client:
-            cached = self.redis_client.get(cache_key)
-            if cached:
-                return json.loads(cached)
+        cached = self.cache.get("schedule:current", cache_params)
+        if cached is not None:
+            return cached
         
         # Query WIP from incremental aggregate table (performance-first)
         # Fallback to direct query if aggregate doesn't exist
-        wip_query = text("""
+        # Ages are derived from the stored start-time moments at read time
+        wip_query = text(f"""
             SELECT 
                 fase_id,
-                SUM(wip_count) as wip_count,
-                AVG(sum_age_seconds / NULLIF(wip_count, 0) / 3600.0) as avg_wip_age_hours,
-                MIN(min_age_seconds / 3600.0) as min_wip_age_hours,
-                MAX(max_age_seconds / 3600.0) as max_wip_age_hours
+                {WIP_AGE_COLUMNS_SQL}
             FROM agg_wip_current
             WHERE (:fase_id IS NULL OR fase_id = :fase_id)
+              AND wip_count > 0
             GROUP BY fase_id
         """)
         
@@ -380,8 +375,7 @@ class ProdplanService:
         }
         
         # Cache for 30 seconds
-        if self.redis_client:
-            self.redis_client.setex(cache_key, 30, json.dumps(schedule, default=str))
+        self.cache.set("schedule:current", cache_params, schedule, ttl=30)
         
         return schedule
 
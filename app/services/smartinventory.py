@@ -7,6 +7,8 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 import structlog
 
+from app.analytics.incremental_aggregates import WIP_AGE_COLUMNS_SQL
+
 logger = structlog.get_logger()
 
 
@@ -37,48 +39,53 @@ class SmartInventoryService:
         Returns:
             WIP statistics
         """
-        # Use materialized view for current WIP
-        if produto_id:
-            # WIP by phase and product
-            query = text("""
-                SELECT 
-                    fof.faseof_fase_id as fase_id,
-                    of.of_produto_id as produto_id,
-                    COUNT(*) as wip_count,
-                    AVG(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio)) / 3600.0) as avg_age_hours
-                FROM fases_ordem_fabrico fof
-                JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
-                WHERE fof.faseof_inicio IS NOT NULL 
-                  AND fof.faseof_fim IS NULL
-                  AND (:fase_id IS NULL OR fof.faseof_fase_id = :fase_id)
-                  AND (:produto_id IS NULL OR of.of_produto_id = :produto_id)
-                GROUP BY fof.faseof_fase_id, of.of_produto_id
-            """)
-        else:
-            # WIP by phase only (use MV)
-            query = text("""
-                SELECT 
-                    fase_id,
-                    wip_count,
-                    avg_wip_age_hours
-                FROM mv_wip_by_phase_current
-                WHERE (:fase_id IS NULL OR fase_id = :fase_id)
-            """)
+        # WIP from agg_wip_current (start-time moments maintained from the
+        # change feed); ages are derived at read time. Fallback to a direct
+        # query if the aggregate doesn't exist or is empty.
+        group_cols = "fase_id, produto_id" if produto_id else "fase_id"
+        query = text(f"""
+            SELECT 
+                {group_cols},
+                {WIP_AGE_COLUMNS_SQL}
+            FROM agg_wip_current
+            WHERE (:fase_id IS NULL OR fase_id = :fase_id)
+              AND (:produto_id IS NULL OR produto_id = :produto_id)
+              AND wip_count > 0
+            GROUP BY {group_cols}
+        """)
+        fallback_cols = "fof.faseof_fase_id, of.of_produto_id" if produto_id else "fof.faseof_fase_id"
+        fallback_query = text(f"""
+            SELECT 
+                {fallback_cols},
+                COUNT(*) as wip_count,
+                AVG(EXTRACT(EPOCH FROM (NOW() - fof.faseof_inicio)) / 3600.0) as avg_age_hours
+            FROM fases_ordem_fabrico fof
+            JOIN ordens_fabrico of ON fof.faseof_of_id = of.of_id
+            WHERE fof.faseof_inicio IS NOT NULL 
+              AND fof.faseof_fim IS NULL
+              AND (:fase_id IS NULL OR fof.faseof_fase_id = :fase_id)
+              AND (:produto_id IS NULL OR of.of_produto_id = :produto_id)
+            GROUP BY {fallback_cols}
+        """)
+        params = {"fase_id": fase_id, "produto_id": produto_id}
         
         with self.engine.connect() as conn:
-            result = conn.execute(query, {
-                "fase_id": fase_id,
-                "produto_id": produto_id
-            })
-            rows = result.fetchall()
+            try:
+                rows = conn.execute(query, params).fetchall()
+            except Exception as e:
+                logger.warning("agg_wip_current_not_available", error=str(e))
+                conn.rollback()
+                rows = []
+            if not rows:
+                rows = conn.execute(fallback_query, params).fetchall()
             
             if produto_id:
                 wip_data = [
                     {
                         "fase_id": row[0],
                         "produto_id": row[1],
-                        "wip_count": row[2],
-                        "avg_age_hours": float(row[3]) if row[3] else None
+                        "wip_count": int(row[2]),
+                        "avg_age_hours": float(row[3]) if row[3] is not None else None
                     }
                     for row in rows
                 ]
@@ -86,8 +93,8 @@ class SmartInventoryService:
                 wip_data = [
                     {
                         "fase_id": row[0],
-                        "wip_count": row[1],
-                        "avg_age_hours": float(row[2]) if row[2] else None
+                        "wip_count": int(row[1]),
+                        "avg_age_hours": float(row[2]) if row[2] is not None else None
                     }
                     for row in rows
                 ]
@@ -14,21 +14,18 @@ logger = structlog.get_logger()
 
 
 async def refresh_mvs_incremental(ctx) -> Dict[str, Any]:
-    """Refresh materialized views incrementally."""
+    """Refresh the materialized views whose inputs changed (in parallel)."""
     logger.info("refreshing_mvs")
-    engine = create_engine(DATABASE_URL)
+    from app.analytics.mv_refresh import MaterializedViewRefresher
     
     try:
-        with engine.connect() as conn:
-            # Refresh all MVs concurrently
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_phase_durations_by_model"))
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_order_leadtime_by_model"))
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_quality_by_phase"))
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_wip_by_phase_current"))
-            conn.commit()
+        results = MaterializedViewRefresher(DATABASE_URL).refresh()
+        errors = [mv for mv, r in results.items() if r["status"] == "error"]
+        if errors:
+            raise RuntimeError(f"MV refresh failed: {', '.join(errors)}")
         
         logger.info("mvs_refreshed")
-        return {"status": "ok", "message": "Materialized views refreshed"}
+        return {"status": "ok", "message": "Materialized views refreshed", "results": results}
     except Exception as e:
         logger.error("mv_refresh_error", error=str(e))
         raise
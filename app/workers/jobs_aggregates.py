@@ -9,11 +9,14 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from app.analytics.incremental_aggregates import IncrementalAggregates
+from app.analytics.rollups import KpiRollups
 from backend.config import DATABASE_URL
 import structlog
 
 logger = structlog.get_logger()
 
+AGGREGATE_WINDOW_DAYS = 7
+
 
 async def compute_aggregates_incremental(ctx) -> Dict[str, Any]:
     """
@@ -29,29 +32,24 @@ async def compute_aggregates_incremental(ctx) -> Dict[str, Any]:
     
     aggregates = IncrementalAggregates(DATABASE_URL)
     
-    # Get date range to process
-    # Default: last 7 days or since last watermark
+    # Window: last 7 days, one range pass per aggregate (rows since watermark)
     today = date.today()
+    start_date = today - timedelta(days=AGGREGATE_WINDOW_DAYS - 1)
     
-    results = {}
-    total_rows = 0
+    results = aggregates.compute_range_incremental(start_date, today)
+    total_rows = sum(results.values())
     
-    # Process last 7 days (or since watermark if more recent)
-    for i in range(7):
-        snapshot_date = today - timedelta(days=i)
-        
-        result = aggregates.compute_all_incremental(snapshot_date)
-        total_rows += sum(result.values())
-        
-        results[f"date_{snapshot_date}"] = result
+    # Weekly/monthly tiers: only periods containing the days just rewritten
+    rollups = KpiRollups(engine=aggregates.engine).refresh()
     
     logger.info("aggregates_computed", total_rows=total_rows)
     
     return {
         "status": "ok",
-        "message": f"Computed aggregates for last 7 days",
+        "message": f"Computed aggregates for {start_date}..{today}",
         "total_rows": total_rows,
-        "results": results
+        "results": results,
+        "rollups": rollups
     }
 
 
@@ -8,6 +8,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from backend.config import DATABASE_URL
+from app.ingestion.merge import faseof_derived_backfill_sql
 import structlog
 
 logger = structlog.get_logger()
@@ -65,22 +66,8 @@ async def backfill_faseof_derived_columns(ctx) -> Dict[str, Any]:
     
     try:
         with engine.connect() as conn:
-            update_query = text("""
-                UPDATE fases_ordem_fabrico
-                SET 
-                    faseof_event_time = COALESCE(faseof_fim, faseof_inicio, faseof_data_prevista),
-                    faseof_duration_seconds = CASE 
-                        WHEN faseof_fim IS NOT NULL AND faseof_inicio IS NOT NULL 
-                        THEN EXTRACT(EPOCH FROM (faseof_fim - faseof_inicio))
-                        ELSE NULL
-                    END,
-                    faseof_is_open = (faseof_inicio IS NOT NULL AND faseof_fim IS NULL),
-                    faseof_is_done = (faseof_fim IS NOT NULL)
-                WHERE faseof_event_time IS NULL
-                   OR faseof_duration_seconds IS NULL
-                   OR faseof_is_open IS NULL
-                   OR faseof_is_done IS NULL;
-            """)
+            # Same expressions the merge writes; only rows still missing them
+            update_query = text(faseof_derived_backfill_sql())
             
             result = conn.execute(update_query)
             updated_count = result.rowcount
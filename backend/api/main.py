@@ -201,6 +201,15 @@ def health():
     
     return status
 
+@app.get("/api/health/freshness")
+def freshness():
+    """Data freshness of the materialized views (last refresh, duration, staleness)."""
+    try:
+        from app.analytics.mv_refresh import MaterializedViewRefresher
+        return {"materialized_views": MaterializedViewRefresher(DATABASE_URL).freshness()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/metrics")
 def metrics():
     """Prometheus metrics endpoint."""
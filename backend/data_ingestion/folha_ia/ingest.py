@@ -1,7 +1,8 @@
 """Main ingestion script for Folha_IA.xlsx."""
 import logging
+import sys
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import pandas as pd
 from sqlalchemy.orm import Session
 
@@ -35,22 +36,46 @@ from backend.models import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows per bulk write + commit in bulk mode
+BULK_CHUNK_SIZE = 5000
+
 
 class FolhaIAIngester:
     """Main ingestion class for Folha IA data."""
     
-    def __init__(self, file_path: Optional[str] = None, session: Optional[Session] = None):
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        session: Optional[Session] = None,
+        bulk: bool = False,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ):
         """
         Initialize ingester.
         
         Args:
             file_path: Path to Excel file.
             session: Database session. If None, creates new one.
+            bulk: Bulk mode. Existing keys and lookup ids are prefetched once
+                per table instead of queried per row, and rows are written with
+                bulk insert/update mappings (no ORM objects in the session),
+                committed every chunk_size rows. Counts match the per-row mode.
+            chunk_size: Rows per bulk write and commit (bulk mode only).
         """
         self.file_path = file_path or FOLHA_IA_PATH
         self.session = session or get_session()
         self.sheets: Dict[str, pd.DataFrame] = {}
         self.structure: Dict = {}
+        self.bulk = bulk
+        self.chunk_size = chunk_size
+        # Bulk mode state: {model: {key tuple: id}}, {(model, column): {value: id}}
+        self._key_ids: Dict[type, Dict[Tuple, int]] = {}
+        self._lookups: Dict[Tuple[type, str], Dict[Any, int]] = {}
+        # Pending writes: {model: [insert mappings]}, {model: {key tuple: mapping}}, {model: {id: mapping}}
+        self._inserts: Dict[type, List[Dict[str, Any]]] = {}
+        self._insert_keys: Dict[type, Dict[Tuple, Dict[str, Any]]] = {}
+        self._updates: Dict[type, Dict[int, Dict[str, Any]]] = {}
+        self._pending = 0
     
     def analyze_structure(self) -> Dict:
         """
@@ -69,6 +94,120 @@ class FolhaIAIngester:
         self.sheets = read_excel_sheets(self.file_path)
         logger.info(f"Loaded {len(self.sheets)} sheets: {list(self.sheets.keys())}")
     
+    def _lookup_id(self, model, column: str, value: Any) -> Optional[int]:
+        """
+        Id of the row of model whose column equals value.
+        
+        Args:
+            model: Model class.
+            column: Unique column name.
+            value: Value to look up.
+        
+        Returns:
+            Row id, or None if not found.
+        """
+        if not self.bulk:
+            found = self.session.query(model).filter(getattr(model, column) == value).first()
+            return found.id if found else None
+        
+        ids = self._lookups.get((model, column))
+        if ids is None:
+            ids = dict(self.session.query(getattr(model, column), model.id).all())
+            self._lookups[(model, column)] = ids
+        return ids.get(value)
+    
+    def _upsert(self, model, key: Dict[str, Any], mapped: Dict[str, Any]) -> bool:
+        """
+        Insert mapped as a new row of model, or update the row matching key.
+        
+        Args:
+            model: Model class.
+            key: Business key {column: value}.
+            mapped: Mapped row (attributes the model lacks are ignored on update).
+        
+        Returns:
+            True if an existing row was updated, False if a row was inserted.
+        """
+        if not self.bulk:
+            existing = self.session.query(model).filter(
+                *[getattr(model, column) == value for column, value in key.items()]
+            ).first()
+            if existing:
+                for attr, value in mapped.items():
+                    if hasattr(existing, attr):
+                        setattr(existing, attr, value)
+                return True
+            self.session.add(model(**mapped))
+            return False
+        
+        key_ids = self._key_ids.get(model)
+        if key_ids is None:
+            columns = [getattr(model, column) for column in key]
+            key_ids = {
+                tuple(row[:-1]): row[-1]
+                for row in self.session.query(*columns, model.id).all()
+            }
+            self._key_ids[model] = key_ids
+        
+        values = {attr: value for attr, value in mapped.items() if hasattr(model, attr)}
+        key_tuple = tuple(key.values())
+        row_id = key_ids.get(key_tuple)
+        if row_id is not None:
+            # Repeated keys in a chunk collapse into one mapping (last value wins)
+            self._updates.setdefault(model, {}).setdefault(row_id, {"id": row_id}).update(values)
+            updated = True
+        elif key_tuple in self._insert_keys.get(model, {}):
+            self._insert_keys[model][key_tuple].update(values)
+            updated = True
+        else:
+            self._inserts.setdefault(model, []).append(values)
+            self._insert_keys.setdefault(model, {})[key_tuple] = values
+            updated = False
+        self._queued()
+        return updated
+    
+    def _add(self, model, mapped: Dict[str, Any]):
+        """Insert mapped as a new row of model (no existence check)."""
+        if not self.bulk:
+            self.session.add(model(**mapped))
+            return
+        self._inserts.setdefault(model, []).append(
+            {attr: value for attr, value in mapped.items() if hasattr(model, attr)}
+        )
+        self._queued()
+    
+    def _queued(self):
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self._commit()
+    
+    def _commit(self):
+        """Commit the session; in bulk mode, write pending mappings first."""
+        if self.bulk and self._pending:
+            self._write_pending()
+        self.session.commit()
+    
+    def _write_pending(self):
+        for model, rows in self._inserts.items():
+            keyed = model in self._insert_keys
+            # return_defaults fills each mapping's id, so later rows with the same key update it
+            self.session.bulk_insert_mappings(model, rows, return_defaults=keyed)
+            if keyed:
+                key_ids = self._key_ids[model]
+                for key_tuple, values in self._insert_keys[model].items():
+                    key_ids[key_tuple] = values["id"]
+        for model, rows in self._updates.items():
+            self.session.bulk_update_mappings(model, list(rows.values()))
+        
+        # Cached lookups of a written table are stale
+        written = set(self._inserts) | set(self._updates)
+        for cached in [k for k in self._lookups if k[0] in written]:
+            del self._lookups[cached]
+        self._inserts.clear()
+        self._insert_keys.clear()
+        self._updates.clear()
+        self._pending = 0
+    
     def ingest_products(self) -> Dict[str, int]:
         """
         Ingest products (Modelos) sheet.
@@ -92,24 +231,12 @@ class FolhaIAIngester:
             if not mapped.get("product_code"):
                 continue
             
-            # Check if exists
-            existing = self.session.query(Product).filter(
-                Product.product_code == mapped["product_code"]
-            ).first()
-            
-            if existing:
-                # Update
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            if self._upsert(Product, {"product_code": mapped["product_code"]}, mapped):
                 updated += 1
             else:
-                # Insert
-                product = Product(**mapped)
-                self.session.add(product)
                 inserted += 1
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Products: {inserted} inserted, {updated} updated")
         return {"inserted": inserted, "updated": updated}
     
@@ -136,21 +263,12 @@ class FolhaIAIngester:
             if not mapped.get("phase_code"):
                 continue
             
-            existing = self.session.query(Phase).filter(
-                Phase.phase_code == mapped["phase_code"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            if self._upsert(Phase, {"phase_code": mapped["phase_code"]}, mapped):
                 updated += 1
             else:
-                phase = Phase(**mapped)
-                self.session.add(phase)
                 inserted += 1
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Phases: {inserted} inserted, {updated} updated")
         return {"inserted": inserted, "updated": updated}
     
@@ -177,21 +295,12 @@ class FolhaIAIngester:
             if not mapped.get("worker_code"):
                 continue
             
-            existing = self.session.query(Worker).filter(
-                Worker.worker_code == mapped["worker_code"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            if self._upsert(Worker, {"worker_code": mapped["worker_code"]}, mapped):
                 updated += 1
             else:
-                worker = Worker(**mapped)
-                self.session.add(worker)
                 inserted += 1
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Workers: {inserted} inserted, {updated} updated")
         return {"inserted": inserted, "updated": updated}
     
@@ -220,28 +329,17 @@ class FolhaIAIngester:
             
             # Lookup product_id if product_code is provided
             if "product_code" in mapped:
-                product = self.session.query(Product).filter(
-                    Product.product_code == mapped["product_code"]
-                ).first()
-                if product:
-                    mapped["product_id"] = product.id
+                product_id = self._lookup_id(Product, "product_code", mapped["product_code"])
+                if product_id is not None:
+                    mapped["product_id"] = product_id
                 del mapped["product_code"]
             
-            existing = self.session.query(Order).filter(
-                Order.of_id == mapped["of_id"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            if self._upsert(Order, {"of_id": mapped["of_id"]}, mapped):
                 updated += 1
             else:
-                order = Order(**mapped)
-                self.session.add(order)
                 inserted += 1
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Orders: {inserted} inserted, {updated} updated")
         return {"inserted": inserted, "updated": updated}
     
@@ -272,11 +370,9 @@ class FolhaIAIngester:
             
             # Lookup order.id from of_id (String)
             if "of_id" in mapped and mapped["of_id"]:
-                order = self.session.query(Order).filter(
-                    Order.of_id == mapped["of_id"]
-                ).first()
-                if order:
-                    mapped["of_id"] = order.id
+                order_id = self._lookup_id(Order, "of_id", mapped["of_id"])
+                if order_id is not None:
+                    mapped["of_id"] = order_id
                 else:
                     logger.warning(f"Order not found for of_id: {mapped['of_id']}")
                     skipped += 1
@@ -287,33 +383,22 @@ class FolhaIAIngester:
             
             # Lookup phase.id from phase_code
             if "phase_code" in mapped and mapped["phase_code"]:
-                phase = self.session.query(Phase).filter(
-                    Phase.phase_code == str(mapped["phase_code"])
-                ).first()
-                if phase:
-                    mapped["phase_id"] = phase.id
+                phase_id = self._lookup_id(Phase, "phase_code", str(mapped["phase_code"]))
+                if phase_id is not None:
+                    mapped["phase_id"] = phase_id
                 del mapped["phase_code"]
             
-            existing = self.session.query(OrderPhase).filter(
-                OrderPhase.fase_of_id == mapped["fase_of_id"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            if self._upsert(OrderPhase, {"fase_of_id": mapped["fase_of_id"]}, mapped):
                 updated += 1
             else:
-                order_phase = OrderPhase(**mapped)
-                self.session.add(order_phase)
                 inserted += 1
             
             # Commit in batches for performance
             if (inserted + updated) % 10000 == 0:
-                self.session.commit()
+                self._commit()
                 logger.info(f"Order phases progress: {inserted} inserted, {updated} updated, {skipped} skipped")
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Order phases: {inserted} inserted, {updated} updated, {skipped} skipped")
         return {"inserted": inserted, "updated": updated, "skipped": skipped}
     
@@ -343,48 +428,38 @@ class FolhaIAIngester:
                 continue
             
             # Lookup product.id from product_code
-            product = self.session.query(Product).filter(
-                Product.product_code == str(mapped["product_code"])
-            ).first()
-            if not product:
+            product_id = self._lookup_id(Product, "product_code", str(mapped["product_code"]))
+            if product_id is None:
                 skipped += 1
                 continue
-            mapped["product_id"] = product.id
+            mapped["product_id"] = product_id
             del mapped["product_code"]
             
             # Lookup phase.id from phase_code
-            phase = self.session.query(Phase).filter(
-                Phase.phase_code == str(mapped["phase_code"])
-            ).first()
-            if not phase:
+            phase_id = self._lookup_id(Phase, "phase_code", str(mapped["phase_code"]))
+            if phase_id is None:
                 skipped += 1
                 continue
-            mapped["phase_id"] = phase.id
+            mapped["phase_id"] = phase_id
             del mapped["phase_code"]
             
             # Check if exists (composite key: product_id + phase_id + sequence_order)
-            existing = self.session.query(ProductPhaseStandard).filter(
-                ProductPhaseStandard.product_id == mapped["product_id"],
-                ProductPhaseStandard.phase_id == mapped["phase_id"],
-                ProductPhaseStandard.sequence_order == mapped.get("sequence_order", 0)
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            key = {
+                "product_id": mapped["product_id"],
+                "phase_id": mapped["phase_id"],
+                "sequence_order": mapped.get("sequence_order", 0),
+            }
+            if self._upsert(ProductPhaseStandard, key, mapped):
                 updated += 1
             else:
-                product_phase_std = ProductPhaseStandard(**mapped)
-                self.session.add(product_phase_std)
                 inserted += 1
             
             # Commit in batches
             if (inserted + updated) % 5000 == 0:
-                self.session.commit()
+                self._commit()
                 logger.info(f"Product phase standards progress: {inserted} inserted, {updated} updated")
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Product phase standards: {inserted} inserted, {updated} updated, {skipped} skipped")
         return {"inserted": inserted, "updated": updated, "skipped": skipped}
     
@@ -414,42 +489,32 @@ class FolhaIAIngester:
                 continue
             
             # Lookup worker.id from worker_code
-            worker = self.session.query(Worker).filter(
-                Worker.worker_code == str(mapped["worker_code"])
-            ).first()
-            if not worker:
+            worker_id = self._lookup_id(Worker, "worker_code", str(mapped["worker_code"]))
+            if worker_id is None:
                 skipped += 1
                 continue
-            mapped["worker_id"] = worker.id
+            mapped["worker_id"] = worker_id
             del mapped["worker_code"]
             
             # Lookup phase.id from phase_code
-            phase = self.session.query(Phase).filter(
-                Phase.phase_code == str(mapped["phase_code"])
-            ).first()
-            if not phase:
+            phase_id = self._lookup_id(Phase, "phase_code", str(mapped["phase_code"]))
+            if phase_id is None:
                 skipped += 1
                 continue
-            mapped["phase_id"] = phase.id
+            mapped["phase_id"] = phase_id
             del mapped["phase_code"]
             
             # Check if exists (composite key: worker_id + phase_id)
-            existing = self.session.query(WorkerPhaseSkill).filter(
-                WorkerPhaseSkill.worker_id == mapped["worker_id"],
-                WorkerPhaseSkill.phase_id == mapped["phase_id"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            key = {
+                "worker_id": mapped["worker_id"],
+                "phase_id": mapped["phase_id"],
+            }
+            if self._upsert(WorkerPhaseSkill, key, mapped):
                 updated += 1
             else:
-                worker_phase_skill = WorkerPhaseSkill(**mapped)
-                self.session.add(worker_phase_skill)
                 inserted += 1
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Worker phase skills: {inserted} inserted, {updated} updated, {skipped} skipped")
         return {"inserted": inserted, "updated": updated, "skipped": skipped}
     
@@ -479,47 +544,37 @@ class FolhaIAIngester:
                 continue
             
             # Lookup order_phase.id from fase_of_id
-            order_phase = self.session.query(OrderPhase).filter(
-                OrderPhase.fase_of_id == str(mapped["fase_of_id"])
-            ).first()
-            if not order_phase:
+            order_phase_id = self._lookup_id(OrderPhase, "fase_of_id", str(mapped["fase_of_id"]))
+            if order_phase_id is None:
                 skipped += 1
                 continue
-            mapped["order_phase_id"] = order_phase.id
+            mapped["order_phase_id"] = order_phase_id
             del mapped["fase_of_id"]
             
             # Lookup worker.id from worker_code
-            worker = self.session.query(Worker).filter(
-                Worker.worker_code == str(mapped["worker_code"])
-            ).first()
-            if not worker:
+            worker_id = self._lookup_id(Worker, "worker_code", str(mapped["worker_code"]))
+            if worker_id is None:
                 skipped += 1
                 continue
-            mapped["worker_id"] = worker.id
+            mapped["worker_id"] = worker_id
             del mapped["worker_code"]
             
             # Check if exists (composite key: order_phase_id + worker_id)
-            existing = self.session.query(OrderPhaseWorker).filter(
-                OrderPhaseWorker.order_phase_id == mapped["order_phase_id"],
-                OrderPhaseWorker.worker_id == mapped["worker_id"]
-            ).first()
-            
-            if existing:
-                for key, value in mapped.items():
-                    if hasattr(existing, key):
-                        setattr(existing, key, value)
+            key = {
+                "order_phase_id": mapped["order_phase_id"],
+                "worker_id": mapped["worker_id"],
+            }
+            if self._upsert(OrderPhaseWorker, key, mapped):
                 updated += 1
             else:
-                order_phase_worker = OrderPhaseWorker(**mapped)
-                self.session.add(order_phase_worker)
                 inserted += 1
             
             # Commit in batches
             if (inserted + updated) % 10000 == 0:
-                self.session.commit()
+                self._commit()
                 logger.info(f"Order phase workers progress: {inserted} inserted, {updated} updated, {skipped} skipped")
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Order phase workers: {inserted} inserted, {updated} updated, {skipped} skipped")
         return {"inserted": inserted, "updated": updated, "skipped": skipped}
     
@@ -548,34 +603,29 @@ class FolhaIAIngester:
                 continue
             
             # Lookup order.id from of_id
-            order = self.session.query(Order).filter(
-                Order.of_id == str(mapped["of_id"])
-            ).first()
-            if not order:
+            order_id = self._lookup_id(Order, "of_id", str(mapped["of_id"]))
+            if order_id is None:
                 skipped += 1
                 continue
-            mapped["order_id"] = order.id
+            mapped["order_id"] = order_id
             del mapped["of_id"]
             
             # Lookup order_phase.id from fase_of_avaliacao_id if available
             if "fase_of_avaliacao_id" in mapped and mapped["fase_of_avaliacao_id"]:
-                order_phase = self.session.query(OrderPhase).filter(
-                    OrderPhase.fase_of_id == str(mapped["fase_of_avaliacao_id"])
-                ).first()
-                if order_phase:
-                    mapped["order_phase_id"] = order_phase.id
+                order_phase_id = self._lookup_id(OrderPhase, "fase_of_id", str(mapped["fase_of_avaliacao_id"]))
+                if order_phase_id is not None:
+                    mapped["order_phase_id"] = order_phase_id
                 # Keep fase_of_avaliacao_id and fase_of_culpada_id as strings for reference
             
-            order_error = OrderError(**mapped)
-            self.session.add(order_error)
+            self._add(OrderError, mapped)
             inserted += 1
             
             # Commit in batches
             if inserted % 10000 == 0:
-                self.session.commit()
+                self._commit()
                 logger.info(f"Order errors progress: {inserted} inserted, {skipped} skipped")
         
-        self.session.commit()
+        self._commit()
         logger.info(f"Order errors: {inserted} inserted, {skipped} skipped")
         return {"inserted": inserted, "skipped": skipped}
     
@@ -626,7 +676,7 @@ class FolhaIAIngester:
 
 def main():
     """Main entry point for ingestion."""
-    ingester = FolhaIAIngester()
+    ingester = FolhaIAIngester(bulk="--bulk" in sys.argv)
     
     # First, analyze structure
     structure = ingester.analyze_structure()
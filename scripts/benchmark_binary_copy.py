@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Benchmark: CSV text COPY + merge casts vs binary PGCOPY into typed staging,
+on FasesOrdemFabrico rows. Writes docs/perf/binary_copy_benchmark.json.
+
+Client-side encoding is always measured. The server side (COPY into temp
+tables, then the merge's SELECT casts into a typed table) needs DATABASE_URL;
+without it that section is recorded as NOT_MEASURED.
+
+Usage:
+    python scripts/benchmark_binary_copy.py [--rows 300000] [--excel path]
+"""
+import os
+import io
+import sys
+import csv
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.ingestion.extract import ExcelExtractor, _normalize_row
+from app.ingestion.load import SHEET_TO_STAGING_TYPED
+from app.ingestion.merge import CoreMerger
+from app.ingestion.pgcopy import BinaryCopyEncoder, PGCOPY_HEADER, PGCOPY_TRAILER
+
+DOCS_PERF_DIR = PROJECT_ROOT / "docs" / "perf"
+SHEET = 'FasesOrdemFabrico'
+TYPED = SHEET_TO_STAGING_TYPED[SHEET]
+
+# Core udt per column (fases_ordem_fabrico), as read by CoreMerger from information_schema
+CORE_UDTS = {
+    'faseof_id': 'varchar', 'faseof_of_id': 'varchar', 'faseof_inicio': 'timestamptz',
+    'faseof_fim': 'timestamptz', 'faseof_data_prevista': 'date', 'faseof_coeficiente': 'numeric',
+    'faseof_coeficiente_x': 'numeric', 'faseof_fase_id': 'int4', 'faseof_turno': 'int4',
+    'faseof_retorno': 'int4', 'faseof_peso': 'numeric', 'faseof_sequencia': 'int4',
+}
+PG_TYPES = {'text': 'TEXT', 'int8': 'BIGINT', 'float8': 'DOUBLE PRECISION',
+            'timestamp': 'TIMESTAMP', 'date': 'DATE'}
+
+
+def synthetic_rows(rows: int) -> List[tuple]:
+    """Reader-shaped FasesOrdemFabrico values (same generator as benchmark_xlsx_reader)."""
+    base = datetime(2020, 1, 1, 6, 0)
+    out = []
+    for i in range(rows):
+        inicio = base + timedelta(minutes=37 * i)
+        fim = inicio + timedelta(hours=2) if i % 10 else None
+        out.append((
+            2_000_000 + i, 120_000 + i // 19, inicio, fim, inicio.replace(hour=0, minute=0),
+            1.5, 0, i % 17 + 1, i % 3 + 1, 0, 8.5, i % 19 + 1,
+        ))
+    return out
+
+
+def workbook_rows(excel_path: str) -> List[tuple]:
+    with ExcelExtractor(excel_path, Path("/tmp"), reader='native') as extractor:
+        _, data_rows = extractor._data_rows(SHEET)
+        return list(data_rows)
+
+
+def encode_csv(rows: List[tuple]) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(TYPED['columns'])
+    for row in rows:
+        writer.writerow(_normalize_row(row))
+    return buf.getvalue().encode('utf-8')
+
+
+def encode_binary(rows: List[tuple]) -> bytes:
+    encoder = BinaryCopyEncoder(TYPED['types'])
+    return b''.join([PGCOPY_HEADER, *(encoder.encode_row(row) for row in rows), PGCOPY_TRAILER])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def bench_server(db_url: str, csv_payload: bytes, binary_payload: bytes) -> Dict[str, Any]:
+    """COPY into temp staging tables, then run the merge's SELECT casts into a typed temp table."""
+    import psycopg2
+
+    columns = TYPED['columns']
+    text_cols = ', '.join(f"{c} TEXT" for c in columns)
+    typed_cols = ', '.join(f"{c} {PG_TYPES[t]}" for c, t in zip(columns, TYPED['types']))
+    merger = CoreMerger(db_url, ingestion_run_id=0)  # only used for its cast expressions
+    csv_casts = ', '.join(merger._cast_expr(c, c, CORE_UDTS[c]) for c in columns)
+    typed_casts = ', '.join(CoreMerger._typed_cast_expr(c, c, CORE_UDTS[c]) for c in columns)
+
+    conn = psycopg2.connect(db_url)
+    try:
+        cur = conn.cursor()
+        cur.execute(f"CREATE TEMP TABLE bench_text ({text_cols})")
+        cur.execute(f"CREATE TEMP TABLE bench_typed ({typed_cols})")
+
+        def run(label, table, copy_options, payload, casts):
+            start = time.perf_counter()
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH ({copy_options})", io.BytesIO(payload))
+            copy_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            cur.execute(f"CREATE TEMP TABLE bench_out_{label} AS SELECT {casts} FROM {table} t")
+            cast_seconds = time.perf_counter() - start
+            conn.commit()
+            return {'copy_seconds': round(copy_seconds, 3), 'cast_seconds': round(cast_seconds, 3),
+                    'total_seconds': round(copy_seconds + cast_seconds, 3)}
+
+        text_result = run('text', 'bench_text', "FORMAT csv, HEADER true", csv_payload, csv_casts)
+        binary_result = run('binary', 'bench_typed', "FORMAT binary", binary_payload, typed_casts)
+
+        # Both paths must produce the same typed rows
+        cur.execute("SELECT count(*) FROM (SELECT * FROM bench_out_text EXCEPT ALL SELECT * FROM bench_out_binary) d")
+        mismatches = cur.fetchone()[0]
+        cur.close()
+    finally:
+        conn.close()
+
+    speedup = text_result['total_seconds'] / binary_result['total_seconds'] if binary_result['total_seconds'] > 0 else None
+    return {
+        'status': 'MEASURED',
+        'csv_copy_plus_cast': text_result,
+        'binary_copy_plus_cast': binary_result,
+        'speedup': round(speedup, 2) if speedup else None,
+        'row_mismatches': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV vs binary COPY staging loads")
+    parser.add_argument('--excel', type=str, default=None)
+    parser.add_argument('--rows', type=int, default=300_000)
+    args = parser.parse_args()
+
+    if args.excel:
+        print(f"Reading {SHEET} from {args.excel}...")
+        rows = workbook_rows(args.excel)
+        source = 'workbook'
+    else:
+        print(f"Generating {args.rows:,} synthetic rows...")
+        rows = synthetic_rows(args.rows)
+        source = 'synthetic'
+
+    csv_payload, csv_seconds = timed(encode_csv, rows)
+    binary_payload, binary_seconds = timed(encode_binary, rows)
+    print(f"  CSV encode:    {csv_seconds}s ({len(csv_payload) / 1e6:.1f} MB)")
+    print(f"  Binary encode: {binary_seconds}s ({len(binary_payload) / 1e6:.1f} MB)")
+
+    db_url: Optional[str] = os.environ.get("DATABASE_URL")
+    if db_url:
+        print("Benchmarking COPY + cast on the server...")
+        try:
+            server = bench_server(db_url, csv_payload, binary_payload)
+        except Exception as e:
+            server = {'status': 'NOT_MEASURED', 'reason': f"{type(e).__name__}: {e}"}
+    else:
+        server = {'status': 'NOT_MEASURED', 'reason': 'DATABASE_URL not set'}
+
+    result = {
+        'benchmark': 'binary_copy',
+        'source': source,
+        'sheet': SHEET,
+        'rows': len(rows),
+        'client_encode': {
+            'csv_seconds': csv_seconds,
+            'csv_bytes': len(csv_payload),
+            'binary_seconds': binary_seconds,
+            'binary_bytes': len(binary_payload),
+        },
+        'server': server,
+        'measured_at': datetime.now().isoformat(),
+    }
+
+    DOCS_PERF_DIR.mkdir(parents=True, exist_ok=True)
+    out = DOCS_PERF_DIR / "binary_copy_benchmark.json"
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if server['status'] == 'MEASURED':
+        print(f"\nSpeedup (COPY + cast): {server['speedup']}x  mismatches={server['row_mismatches']}")
+    else:
+        print(f"\nServer side NOT_MEASURED: {server['reason']}")
+    print(f"Report saved: {out}")
+
+    return 1 if server.get('row_mismatches') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: merge + post-merge UPDATE of the derived phase columns (before)
+vs derived columns in the merge INSERT projection (after), on
+FasesOrdemFabrico rows. Writes docs/perf/derived_columns_benchmark.json.
+
+Runs against temp copies of fases_ordem_fabrico (LIKE ... INCLUDING INDEXES),
+so it needs DATABASE_URL with the core schema migrated; without it the
+result is recorded as NOT_MEASURED.
+
+Usage:
+    python scripts/benchmark_derived_columns.py [--rows 300000] [--excel path]
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.ingestion.merge import CoreMerger, FASEOF_DERIVED_COLUMNS, faseof_derived_backfill_sql
+from benchmark_binary_copy import CORE_UDTS, TYPED, SHEET, encode_csv, synthetic_rows, workbook_rows
+
+DOCS_PERF_DIR = PROJECT_ROOT / "docs" / "perf"
+
+
+def bench_server(db_url: str, csv_payload: bytes) -> Dict[str, Any]:
+    """Same staging, two temp core tables: INSERT + UPDATE vs INSERT with derived projection."""
+    import psycopg2
+
+    columns = TYPED['columns']
+    merger = CoreMerger(db_url, ingestion_run_id=0)  # only used for its cast expressions
+    casts = ', '.join(merger._cast_expr(c, c, CORE_UDTS[c]) for c in columns)
+    derived_cols = ', '.join(FASEOF_DERIVED_COLUMNS)
+    derived_exprs = ', '.join(f"q.{c}" for c in columns) + ', ' + ', '.join(FASEOF_DERIVED_COLUMNS.values())
+
+    conn = psycopg2.connect(db_url)
+    try:
+        cur = conn.cursor()
+        cur.execute("SET search_path TO public, core, staging;")
+        cur.execute(f"CREATE TEMP TABLE bench_stg ({', '.join(f'{c} TEXT' for c in columns)})")
+        cur.copy_expert(f"COPY bench_stg ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                        io.BytesIO(csv_payload))
+        for label in ('before', 'after'):
+            cur.execute(f"CREATE TEMP TABLE bench_core_{label} (LIKE fases_ordem_fabrico INCLUDING DEFAULTS INCLUDING INDEXES)")
+        conn.commit()
+
+        def run(statements: List[str]) -> Dict[str, Any]:
+            timings = []
+            for sql in statements:
+                start = time.perf_counter()
+                cur.execute(sql)
+                timings.append(round(time.perf_counter() - start, 3))
+            conn.commit()
+            return {'statement_seconds': timings, 'total_seconds': round(sum(timings), 3)}
+
+        before = run([
+            f"INSERT INTO bench_core_before ({', '.join(columns)}) SELECT {casts} FROM bench_stg t",
+            faseof_derived_backfill_sql().replace("fases_ordem_fabrico", "bench_core_before"),
+        ])
+        after = run([
+            f"INSERT INTO bench_core_after ({', '.join(columns)}, {derived_cols}) "
+            f"SELECT {derived_exprs} FROM (SELECT {casts} FROM bench_stg t) q",
+        ])
+
+        # Both paths must leave the same rows
+        cur.execute("SELECT count(*) FROM (SELECT * FROM bench_core_before EXCEPT ALL SELECT * FROM bench_core_after) d")
+        mismatches = cur.fetchone()[0]
+        cur.close()
+    finally:
+        conn.close()
+
+    speedup = before['total_seconds'] / after['total_seconds'] if after['total_seconds'] > 0 else None
+    return {
+        'status': 'MEASURED',
+        'insert_then_update': before,
+        'insert_with_derived': after,
+        'speedup': round(speedup, 2) if speedup else None,
+        'row_mismatches': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark derived columns at write time vs post-merge UPDATE")
+    parser.add_argument('--excel', type=str, default=None)
+    parser.add_argument('--rows', type=int, default=300_000)
+    args = parser.parse_args()
+
+    if args.excel:
+        print(f"Reading {SHEET} from {args.excel}...")
+        rows = workbook_rows(args.excel)
+        source = 'workbook'
+    else:
+        print(f"Generating {args.rows:,} synthetic rows...")
+        rows = synthetic_rows(args.rows)
+        source = 'synthetic'
+    # faseof_fim is part of the primary key (NOT NULL in core)
+    rows = [row for row in rows if row[3] is not None]
+    csv_payload = encode_csv(rows)
+
+    db_url: Optional[str] = os.environ.get("DATABASE_URL")
+    if db_url:
+        print("Benchmarking merge write paths on the server...")
+        try:
+            server = bench_server(db_url, csv_payload)
+        except Exception as e:
+            server = {'status': 'NOT_MEASURED', 'reason': f"{type(e).__name__}: {e}"}
+    else:
+        server = {'status': 'NOT_MEASURED', 'reason': 'DATABASE_URL not set'}
+
+    result = {
+        'benchmark': 'derived_columns',
+        'source': source,
+        'sheet': SHEET,
+        'rows': len(rows),
+        'server': server,
+        'measured_at': datetime.now().isoformat(),
+    }
+
+    DOCS_PERF_DIR.mkdir(parents=True, exist_ok=True)
+    out = DOCS_PERF_DIR / "derived_columns_benchmark.json"
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if server['status'] == 'MEASURED':
+        print(f"\nSpeedup (merge write): {server['speedup']}x  mismatches={server['row_mismatches']}")
+    else:
+        print(f"\nServer side NOT_MEASURED: {server['reason']}")
+    print(f"Report saved: {out}")
+
+    return 1 if server.get('row_mismatches') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark: native XlsxReader vs openpyxl read_only iter_rows.
+Uses the real workbook when present, otherwise generates a synthetic
+FasesOrdemFabrico-like sheet. Writes docs/perf/xlsx_reader_benchmark.json.
+
+Usage:
+    python scripts/benchmark_xlsx_reader.py [--rows 500000] [--excel path] [--sheet name]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import openpyxl
+
+from app.ingestion.xlsx_reader import XlsxReader
+
+DOCS_PERF_DIR = PROJECT_ROOT / "docs" / "perf"
+
+FASES_HEADER = [
+    'FaseOf_Id', 'FaseOf_OfId', 'FaseOf_Inicio', 'FaseOf_Fim', 'FaseOf_DataPrevista',
+    'FaseOf_Coeficiente', 'FaseOf_CoeficienteX', 'FaseOf_FaseId', 'FaseOf_Turno',
+    'FaseOf_Retorno', 'FaseOf_Peso', 'FaseOf_Sequencia',
+]
+
+
+def generate_workbook(path: Path, rows: int) -> None:
+    """Generate a synthetic FasesOrdemFabrico sheet with openpyxl write_only."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('FasesOrdemFabrico')
+    ws.append(FASES_HEADER)
+    base = datetime(2020, 1, 1, 6, 0)
+    for i in range(rows):
+        inicio = base + timedelta(minutes=37 * i)
+        fim = inicio + timedelta(hours=2) if i % 10 else None
+        ws.append([
+            2_000_000 + i, 120_000 + i // 19, inicio, fim, inicio.replace(hour=0, minute=0),
+            1.5, 0, i % 17 + 1, i % 3 + 1, 0, 8.5, i % 19 + 1,
+        ])
+    wb.save(path)
+
+
+def bench_openpyxl(path: Path, sheet: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=False)
+    rows = 0
+    for _ in wb[sheet].iter_rows(min_row=2, values_only=True):
+        rows += 1
+    wb.close()
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'elapsed_seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed, 0) if elapsed > 0 else 0}
+
+
+def bench_native(path: Path, sheet: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    rows = 0
+    with XlsxReader(str(path)) as reader:
+        for _ in reader.iter_rows(sheet, min_row=2):
+            rows += 1
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'elapsed_seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed, 0) if elapsed > 0 else 0}
+
+
+def check_parity(path: Path, sheet: str, sample: int = 5000) -> bool:
+    """Compare the first `sample` rows of both readers."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=False)
+    expected = []
+    for i, row in enumerate(wb[sheet].iter_rows(values_only=True)):
+        if i > sample:
+            break
+        expected.append(tuple(row))
+    wb.close()
+
+    with XlsxReader(str(path)) as reader:
+        actual = []
+        for i, row in enumerate(reader.iter_rows(sheet)):
+            if i > sample:
+                break
+            actual.append(row)
+    return expected == actual
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark XLSX readers")
+    parser.add_argument('--excel', type=str, default=None)
+    parser.add_argument('--sheet', type=str, default='FasesOrdemFabrico')
+    parser.add_argument('--rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    if args.excel:
+        path = Path(args.excel)
+        source = 'workbook'
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = Path(tmp_dir.name) / "bench.xlsx"
+        print(f"Generating synthetic sheet with {args.rows:,} rows...")
+        generate_workbook(path, args.rows)
+        source = 'synthetic'
+
+    print("Checking parity...")
+    parity = check_parity(path, args.sheet)
+
+    print("Benchmarking openpyxl...")
+    op = bench_openpyxl(path, args.sheet)
+    print(f"  {op['rows']:,} rows in {op['elapsed_seconds']}s ({op['rows_per_sec']:,.0f} rows/s)")
+
+    print("Benchmarking native...")
+    nat = bench_native(path, args.sheet)
+    print(f"  {nat['rows']:,} rows in {nat['elapsed_seconds']}s ({nat['rows_per_sec']:,.0f} rows/s)")
+
+    speedup = op['elapsed_seconds'] / nat['elapsed_seconds'] if nat['elapsed_seconds'] > 0 else None
+
+    result = {
+        'benchmark': 'xlsx_reader',
+        'source': source,
+        'sheet': args.sheet,
+        'openpyxl': op,
+        'native': nat,
+        'speedup': round(speedup, 2) if speedup else None,
+        'parity_first_rows': parity,
+        'measured_at': datetime.now().isoformat(),
+    }
+
+    DOCS_PERF_DIR.mkdir(parents=True, exist_ok=True)
+    out = DOCS_PERF_DIR / "xlsx_reader_benchmark.json"
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\nSpeedup: {result['speedup']}x  parity={parity}")
+    print(f"Report saved: {out}")
+
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+    return 0 if parity else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Tests for the streaming COPY paths of app.ingestion.batch_upsert."""
+from datetime import datetime
+
+from app.ingestion.batch_upsert import (
+    STREAM_SOURCE_TABLE, _copy_field, batch_insert_rejects, stream_upsert,
+)
+
+
+class _Cursor:
+    def __init__(self, counts):
+        self.counts = list(counts)
+        self.sql, self.copies = [], []
+
+    def execute(self, sql):
+        self.sql.append(sql)
+
+    def fetchone(self):
+        return self.counts.pop(0)
+
+    def copy_expert(self, sql, buf):
+        self.copies.append((sql, buf.read()))
+
+    def close(self):
+        pass
+
+
+class _Engine:
+    def __init__(self, counts=()):
+        self.cur = _Cursor(counts)
+        self.commits = 0
+
+    def raw_connection(self):
+        return self
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_copy_field_escapes_text_format():
+    assert _copy_field(None) == '\\N'
+    assert _copy_field('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+    assert _copy_field(True) == 't'
+    assert _copy_field(datetime(2024, 1, 2, 8, 30)) == '2024-01-02T08:30:00'
+    assert _copy_field({'k': 1}) == '{"k": 1}'
+
+
+def test_stream_upsert_chunks_generator_and_sums_counts():
+    engine = _Engine(counts=[(2, 0), (1, 1), (0, 1)])
+    rows = ({'of_id': str(i), 'of_fase_id': i} for i in range(5))
+    assert stream_upsert(engine, 'ordens_fabrico', rows, ['of_id'], chunk_size=2) == {'inserted': 3, 'updated': 2}
+
+    cur = engine.cur
+    assert [data for _, data in cur.copies] == ['0\t0\n1\t1\n', '2\t2\n3\t3\n', '4\t4\n']
+    assert cur.copies[0][0] == f"COPY {STREAM_SOURCE_TABLE} (of_id, of_fase_id) FROM STDIN"
+    assert 'ON COMMIT DROP' in cur.sql[0]
+    assert 'DO UPDATE SET of_fase_id = EXCLUDED.of_fase_id' in cur.sql[1]
+    assert engine.commits == 1
+
+
+def test_empty_streams_do_not_connect():
+    assert stream_upsert(None, 'ordens_fabrico', iter([]), ['of_id']) == {'inserted': 0, 'updated': 0}
+    assert batch_insert_rejects(None, 'ordens_fabrico', iter([]), 7) == 0
+
+
+def test_batch_insert_rejects_streams_copy():
+    engine = _Engine()
+    rejects = (
+        {'sheet_name': 'OrdensFabrico', 'row_number': n, 'reason_code': 'X',
+         'reason_detail': 'bad\tvalue', 'raw_json': '{"a": null}'}
+        for n in (2, 3, 4)
+    )
+    assert batch_insert_rejects(engine, 'ordens_fabrico', rejects, 7, chunk_size=2) == 3
+    sql, data = engine.cur.copies[0]
+    assert sql.startswith('COPY ordens_fabrico_rejects (ingestion_run_id, sheet_name, row_number')
+    assert data.splitlines()[0] == '7\tOrdensFabrico\t2\tX\tbad\\tvalue\t{"a": null}'
+    assert len(engine.cur.copies) == 2
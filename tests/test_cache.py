@@ -0,0 +1,220 @@
+"""Tests for the versioned cache: singleflight, Redis lease and the in-process L1 tier."""
+import asyncio
+import threading
+
+import pytest
+
+from app.ops import cache as cache_module
+from app.ops.cache import ENTRY_OVERHEAD, LocalCache, VersionedCache
+
+
+class _FakeRedis:
+    """Shared in-memory stand-in for a Redis server (SET NX, eval of the release script)."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def info(self, section=None):
+        return {"used_memory": 1024}
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def eval(self, script, numkeys, key, token):
+        with self.lock:
+            if self.data.get(key) == token:
+                del self.data[key]
+                return 1
+            return 0
+
+
+def _cache(monkeypatch, server=None, **kwargs):
+    server = server or _FakeRedis()
+    monkeypatch.setattr(cache_module.redis, "from_url", lambda *a, **k: server)
+    kwargs.setdefault("local_cache", LocalCache())
+    return VersionedCache(**kwargs)
+
+
+def test_concurrent_misses_share_one_computation(monkeypatch):
+    cache = _cache(monkeypatch)
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"value": 42}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("kpis", {"a": 1}, compute)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    # Wait until the four followers joined the leader's flight
+    while cache.stats()["coalesced"] < 4:
+        pass
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == [{"value": 42}] * 5
+    assert cache.stats() == {"hits": 0, "misses": 1, "coalesced": 4, "lease_waits": 0}
+    assert cache_module._inflight == {}
+
+    assert cache.get_or_compute("kpis", {"a": 1}, compute) == {"value": 42}
+    assert cache.stats()["hits"] == 1
+
+
+def test_leader_error_reaches_waiters_and_is_not_cached(monkeypatch):
+    cache = _cache(monkeypatch)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_compute("kpis", {}, failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while cache.stats()["coalesced"] < 1:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert errors == ["boom", "boom"]
+    assert cache.get_or_compute("kpis", {}, lambda: 7) == 7
+
+
+def test_async_callers_await_the_same_future(monkeypatch):
+    cache = _cache(monkeypatch)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [1, 2]
+
+    async def main():
+        return await asyncio.gather(*[cache.get_or_compute_async("kpis", {"b": 2}, compute) for _ in range(3)])
+
+    assert asyncio.run(main()) == [[1, 2]] * 3
+    assert calls == [1]
+    assert cache.stats()["coalesced"] == 2
+
+
+def test_lease_held_elsewhere_waits_for_the_other_process(monkeypatch):
+    server = _FakeRedis()
+    cache = _cache(monkeypatch, server, distributed_lease=True)
+    key = cache._make_key("kpis", {})
+    server.data[f"{key}:lease"] = "other-process"
+
+    def other_process_finishes():
+        server.setex(key, 60, '{"from": "other"}')
+        del server.data[f"{key}:lease"]
+
+    timer = threading.Timer(0.05, other_process_finishes)
+    timer.start()
+    result = cache.get_or_compute("kpis", {}, lambda: pytest.fail("must not recompute"))
+    timer.join()
+
+    assert result == {"from": "other"}
+    assert cache.stats()["lease_waits"] == 1
+
+
+def test_lease_is_taken_and_released_by_the_leader(monkeypatch):
+    server = _FakeRedis()
+    cache = _cache(monkeypatch, server, distributed_lease=True)
+    key = cache._make_key("kpis", {})
+    seen = []
+
+    def compute():
+        seen.append(server.data.get(f"{key}:lease"))
+        return 1
+
+    assert cache.get_or_compute("kpis", {}, compute) == 1
+    assert seen[0] is not None
+    assert f"{key}:lease" not in server.data
+
+
+def test_local_tier_serves_hot_keys_without_redis(monkeypatch):
+    server = _FakeRedis()
+    cache = _cache(monkeypatch, server)
+    cache.set("schedule", {"fase": "all"}, {"wip": 3}, ttl=30)
+    key = cache._make_key("schedule", {"fase": "all"})
+
+    server.data.clear()  # L2 gone: the L1 copy still answers
+    assert cache.get("schedule", {"fase": "all"}) == {"wip": 3}
+
+    # A version bump changes the key, so the L1 entry is no longer reachable
+    cache._cache_version, cache._version_checked_at = 2, float("inf")
+    assert cache._make_key("schedule", {"fase": "all"}) != key
+    assert cache.get("schedule", {"fase": "all"}) is None
+
+
+def test_redis_hit_fills_local_tier(monkeypatch):
+    server = _FakeRedis()
+    cache = _cache(monkeypatch, server)
+    key = cache._make_key("order", {"of_id": "OF1"})
+    server.setex(key, 60, '{"of_id": "OF1"}')
+
+    assert cache.get("order", {"of_id": "OF1"}) == {"of_id": "OF1"}
+    server.data.clear()
+    assert cache.get("order", {"of_id": "OF1"}) == {"of_id": "OF1"}
+
+
+def test_local_cache_evicts_least_recently_used_within_budget():
+    local = LocalCache(max_bytes=3 * (ENTRY_OVERHEAD + 10), max_ttl=60)
+    for key in "abc":
+        assert local.set(key, key, ttl=60, size=10)
+    local.get("a")  # b is now the least recently used
+    local.set("d", "d", ttl=60, size=10)
+
+    assert local.get("b") is None
+    assert [local.get(k) for k in "acd"] == ["a", "c", "d"]
+    assert local.usage()["bytes"] == 3 * (ENTRY_OVERHEAD + 10)
+    assert not local.set("huge", "x", ttl=60, size=10 ** 6)
+
+
+def test_local_cache_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    local = LocalCache(max_bytes=10 ** 6, max_ttl=5)
+    local.set("k", 1, ttl=60, size=1)  # capped at max_ttl
+
+    now[0] += 4.9
+    assert local.get("k") == 1
+    now[0] += 0.2
+    assert local.get("k") is None
+    assert local.usage() == {"entries": 0, "bytes": 0, "max_bytes": 10 ** 6}
@@ -0,0 +1,24 @@
+"""Tests for the change feed rows CoreMerger logs with each upsert."""
+from app.ingestion.merge import CoreMerger
+
+
+def _merger():
+    return CoreMerger("postgresql+psycopg2://u:p@db:1/x", 42)
+
+
+def test_feed_sql_carries_run_key_and_order():
+    sql, params = _merger()._change_feed_sql(
+        "public.core_change_log", "public.fases_ordem_fabrico", ["faseof_id", "faseof_fim"], "written",
+    )
+    assert params == [42, "fases_ordem_fabrico"]
+    assert "ARRAY[w.faseof_id::text, w.faseof_fim::text]" in sql
+    assert "w.faseof_of_id, w.faseof_id" in sql
+    assert "FROM written w" in sql
+
+
+def test_feed_sql_master_tables_have_no_order_refs():
+    sql, params = _merger()._change_feed_sql(
+        "public.core_change_log", "public.modelos", ["produto_id"], "ins",
+    )
+    assert params == [42, "modelos"]
+    assert "ARRAY[w.produto_id::text], NULL, NULL" in sql
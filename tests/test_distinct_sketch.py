@@ -0,0 +1,64 @@
+"""Tests for the HyperLogLog distinct-order sketches."""
+import random
+import sqlite3
+
+import pytest
+
+from app.analytics.distinct_sketch import (
+    HASH_BITS, M, PRECISION, RELATIVE_STD_ERROR, DistinctSketch, bounds, estimate, estimate_sql,
+    quality_orders_rollup_sql,
+)
+
+
+def _sketch(values):
+    sketch = DistinctSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize("n", [1, 50, 3_000, 200_000])
+def test_estimate_is_within_bounds(n):
+    value = _sketch(f"OF{i}" for i in range(n)).estimate()
+    assert abs(value - n) <= 3 * RELATIVE_STD_ERROR * n + 1
+
+
+def test_union_of_overlapping_batches_does_not_double_count():
+    day1 = _sketch(f"OF{i}" for i in range(0, 6_000))
+    day2 = _sketch(f"OF{i}" for i in range(4_000, 10_000))
+    union = DistinctSketch().merge(day1).merge(day2)
+    assert abs(union.estimate() - 10_000) <= 3 * RELATIVE_STD_ERROR * 10_000
+    assert union.merge(day2).registers == union.registers  # re-applying a batch is a no-op
+
+
+def test_rho_matches_sql_bit_string_rule():
+    # rho_sql: POSITION('1' IN REVERSE((h >> p)::bit(64 - p)::text)), or 64 - p + 1 when all zero
+    rng = random.Random(3)
+    for h in [0, 1 << PRECISION, (1 << 63) | 5] + [rng.getrandbits(64) for _ in range(500)]:
+        bits = format(h >> PRECISION, f"0{HASH_BITS - PRECISION}b")
+        expected = bits[::-1].find("1") + 1 or HASH_BITS - PRECISION + 1
+        sketch = DistinctSketch()
+        sketch.add_hash(h)
+        assert sketch.registers == {h & ((1 << PRECISION) - 1): expected}
+
+
+def test_bounds_never_below_non_empty_registers():
+    low, high = bounds(7, 7.01)
+    assert low == 7 and high > 7.01
+
+
+def test_rollup_sql_groups_and_rejects_unknown_dimensions():
+    sql = quality_orders_rollup_sql(["produto_id"], "snapshot_date >= :start_date")
+    assert "GROUP BY produto_id, register" in sql
+    assert "MAX(rho)" in sql
+    assert "GROUP BY register" in quality_orders_rollup_sql()
+    with pytest.raises(ValueError):
+        quality_orders_rollup_sql(["of_id"])
+
+
+@pytest.mark.parametrize("registers, inverse_sum", [(1, 0.5), (300, 150.0), (M - 1, 40.0), (M, 12.5)])
+def test_estimate_sql_matches_estimate(registers, inverse_sum):
+    # sqlite has LN but not the ::float8 cast (only needed for PostgreSQL integer division)
+    sql = estimate_sql(str(registers), repr(inverse_sum)).replace("::float8", " * 1.0")
+    (value,) = sqlite3.connect(":memory:").execute(f"SELECT {sql}").fetchone()
+    assert value == pytest.approx(estimate(registers, inverse_sum))
@@ -0,0 +1,171 @@
+"""Tests for the range-based (sargable) path and the WIP maintenance of IncrementalAggregates."""
+from datetime import date, datetime
+
+from app.analytics.incremental_aggregates import (
+    WIP_DELTA_SQL, WIP_FEED_CONSUMER, IncrementalAggregates, day_range,
+)
+
+
+class _Result:
+    rowcount = 4
+
+    def fetchone(self):
+        return (3, datetime(2024, 3, 7, 18, 0))
+
+
+class _Conn:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.log.append((str(query), params))
+        return _Result()
+
+    def commit(self):
+        pass
+
+
+class _Engine:
+    def __init__(self):
+        self.log = []
+
+    def connect(self):
+        return _Conn(self.log)
+
+
+def _aggregates():
+    aggregates = IncrementalAggregates("postgresql+psycopg2://u:p@db:1/x")
+    aggregates.engine = _Engine()
+    return aggregates
+
+
+def test_day_range_is_half_open():
+    assert day_range(date(2024, 3, 1), date(2024, 3, 7)) == (datetime(2024, 3, 1), datetime(2024, 3, 8))
+
+
+def test_range_runs_one_sargable_statement_per_aggregate():
+    aggregates = _aggregates()
+    aggregates.compute_agg_wip_current = lambda: 4  # change-feed driven, covered below
+    results = aggregates.compute_range_incremental(date(2024, 3, 1), date(2024, 3, 7), run_id=9)
+    assert results == {"phase_stats": 3, "order_stats": 3, "quality_stats": 3, "wip_current": 4}
+
+    statements = aggregates.engine.log
+    assert len(statements) == 4  # one per range aggregate + the derived quality column
+    for sql, params in statements[:3]:
+        assert "DATE(" not in sql
+        assert "GROUP BY 1, 2" in sql
+        assert "INSERT INTO analytics_watermarks" in sql
+        assert params["range_start"] == datetime(2024, 3, 1)
+        assert params["range_end"] == datetime(2024, 3, 8)
+        assert params["run_id"] == 9
+    sql, params = statements[0]
+    assert "(fof.faseof_event_time)::date" in sql
+    assert "fof.faseof_event_time >= :range_start" in sql
+    assert params["mv_name"] == "fases_ordem_fabrico.faseof_event_time"
+    # sketches are written by the same statement as their aggregate
+    assert "INSERT INTO agg_phase_duration_sketch_daily" in sql
+    assert "INSERT INTO agg_order_leadtime_sketch_daily" in statements[1][0]
+    assert "INSERT INTO agg_quality_orders_hll_daily" in statements[2][0]
+
+
+def test_affected_orders_count_is_set_from_the_hll_not_merged():
+    aggregates = _aggregates()
+    aggregates.compute_agg_wip_current = lambda: 4
+    aggregates.compute_range_incremental(date(2024, 3, 1), date(2024, 3, 7))
+    upsert_sql = aggregates.engine.log[2][0]
+    derived_sql, params = aggregates.engine.log[3]
+
+    # COUNT(DISTINCT) of a batch is not mergeable: the upsert leaves it alone
+    assert "affected_orders_count" not in upsert_sql
+    assert derived_sql.lstrip().startswith("UPDATE agg_quality_daily")
+    assert "FROM agg_quality_orders_hll_daily" in derived_sql
+    assert "snapshot_date >= CAST(:range_start AS date)" in derived_sql
+    assert params == {"range_start": datetime(2024, 3, 1), "range_end": datetime(2024, 3, 8)}
+
+    aggregates = _aggregates()
+    aggregates.compute_agg_quality_daily(date(2024, 3, 5))
+    assert [sql.split()[0:3] for sql, _ in aggregates.engine.log] == [
+        ["INSERT", "INTO", "agg_quality_daily"],
+        ["INSERT", "INTO", "agg_quality_orders_hll_daily"],
+        ["UPDATE", "agg_quality_daily", "q"],
+    ]
+
+
+def test_daily_methods_use_timestamp_range():
+    aggregates = _aggregates()
+    aggregates.compute_agg_order_stats_daily(date(2024, 3, 5))
+    sql, params = aggregates.engine.log[0]
+    assert "DATE(" not in sql
+    assert "of.of_data_acabamento < :day_end" in sql
+    assert params["day_end"] == datetime(2024, 3, 6)
+
+
+class _FakeFeed:
+    def __init__(self, last, pending):
+        self.last, self.pending, self.marked = last, pending, []
+
+    def last_consumed(self, consumer):
+        assert consumer == WIP_FEED_CONSUMER
+        return self.last
+
+    def pending_runs(self, consumer):
+        return self.pending
+
+    def mark_consumed(self, consumer, run_id):
+        self.marked.append((consumer, run_id))
+
+
+class _TouchedResult(_Result):
+    def fetchall(self):
+        return [(3, 10), (4, 11)]
+
+    def scalar(self):
+        return 4
+
+
+class _WipConn(_Conn):
+    def execute(self, query, params=None):
+        super().execute(query, params)
+        return _TouchedResult()
+
+
+class _WipEngine(_Engine):
+    def connect(self):
+        return _WipConn(self.log)
+
+
+def _wip(monkeypatch, feed):
+    monkeypatch.setattr("app.analytics.incremental_aggregates.ChangeFeed", lambda engine: feed)
+    aggregates = _aggregates()
+    aggregates.engine = _WipEngine()
+    return aggregates
+
+
+def test_wip_applies_pending_runs_as_deltas(monkeypatch):
+    feed = _FakeFeed(last=5, pending=[6, 8])
+    aggregates = _wip(monkeypatch, feed)
+    assert aggregates.compute_agg_wip_current() == 2
+
+    (delta_sql, delta_params), (extremes_sql, extremes_params), (cleanup_sql, _) = aggregates.engine.log
+    assert delta_sql == WIP_DELTA_SQL and delta_params == {"run_ids": [6, 8]}
+    assert "NOW() -" not in delta_sql.upper()  # stored moments must not depend on the clock
+    assert extremes_params == {"fase_ids": [3, 4], "produto_ids": [10, 11]}
+    assert "wip_count <= 0" in cleanup_sql
+    assert feed.marked == [(WIP_FEED_CONSUMER, 8)]
+
+
+def test_wip_without_cursor_rebuilds(monkeypatch):
+    feed = _FakeFeed(last=None, pending=[])
+    aggregates = _wip(monkeypatch, feed)
+    assert aggregates.compute_agg_wip_current() == 4
+
+    statements = [sql for sql, _ in aggregates.engine.log]
+    assert "TRUNCATE agg_wip_members" in statements[1]
+    assert "sum_start_epoch_sq" in statements[-1]
+    assert feed.marked == [(WIP_FEED_CONSUMER, 4)]
@@ -1,5 +1,6 @@
 """Tests for data ingestion."""
 import pytest
+import pandas as pd
 from datetime import datetime
 from backend.models import Product, Phase, Worker, Order
 from backend.data_ingestion.folha_ia.data_cleaner import (
@@ -8,6 +9,7 @@ from backend.data_ingestion.folha_ia.data_cleaner import (
     clean_string,
     calculate_duration_minutes,
 )
+from backend.data_ingestion.folha_ia.ingest import FolhaIAIngester
 
 
 class TestDataCleaner:
@@ -103,3 +105,45 @@ class TestModels:
 
 
 
+
+
+class TestBulkIngestion:
+    """Tests for the bulk mode of FolhaIAIngester."""
+    
+    @staticmethod
+    def _sheets(names):
+        return {
+            "Modelos": pd.DataFrame({"Produto_Id": ["1", "2", "3"], "Produto_Nome": names}),
+            "OrdensFabrico": pd.DataFrame({
+                "Of_Id": ["OF1", "OF2", "OF3", "OF4"],
+                "Of_DataCriacao": ["2024-01-15"] * 4,
+            }),
+            "FasesOrdemFabrico": pd.DataFrame({
+                "FaseOf_Id": ["F1", "F2", "F3", "F4", "F5"],
+                "FaseOf_OfId": ["OF1", "OF1", "OF2", "OF9", "OF4"],  # OF9 does not exist
+                "FaseOf_Inicio": ["2024-01-15 08:00:00"] * 5,
+            }),
+        }
+    
+    def _ingest(self, session, bulk, names):
+        ingester = FolhaIAIngester(file_path="unused", session=session, bulk=bulk, chunk_size=2)
+        ingester.sheets = self._sheets(names)
+        return [ingester.ingest_products(), ingester.ingest_orders(), ingester.ingest_order_phases()]
+    
+    def test_bulk_counts_match_row_mode(self, test_db):
+        """Bulk inserts, then per-row and bulk re-runs update the same rows."""
+        first = self._ingest(test_db, True, ["A", "B", "C"])
+        assert first == [
+            {"inserted": 3, "updated": 0},
+            {"inserted": 4, "updated": 0},
+            {"inserted": 4, "updated": 0, "skipped": 1},
+        ]
+        
+        expected = [
+            {"inserted": 0, "updated": 3},
+            {"inserted": 0, "updated": 4},
+            {"inserted": 0, "updated": 4, "skipped": 1},
+        ]
+        assert self._ingest(test_db, False, ["A", "B", "X"]) == expected
+        assert self._ingest(test_db, True, ["A", "B", "Y"]) == expected
+        assert test_db.query(Product).filter(Product.product_code == "3").one().name == "Y"
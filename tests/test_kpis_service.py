@@ -0,0 +1,86 @@
+"""Tests for the KPI service served from the aggregate tiers."""
+import re
+import statistics
+from datetime import date, datetime
+
+from app.analytics.quantile_sketch import bucket_of, bucket_value
+from app.services.kpis import KpiService, moments
+
+
+class _Conn:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.log.append(str(query))
+        return self
+
+    def fetchall(self):
+        return []
+
+
+class _Engine:
+    def __init__(self):
+        self.log = []
+
+    def connect(self):
+        return _Conn(self.log)
+
+
+def _service():
+    service = KpiService("postgresql+psycopg2://u:p@db:1/x")
+    service.engine = _Engine()
+    return service
+
+
+def test_moments_match_population_stats():
+    values = [3.0, 7.5, 7.5, 12.0, 40.0]
+    mean, std = moments(len(values), sum(values), sum(v * v for v in values))
+    assert abs(mean - statistics.mean(values)) < 1e-9
+    assert abs(std - statistics.pstdev(values)) < 1e-9
+    assert moments(0, 0, 0) == (None, None)
+
+
+def test_window_is_inclusive_of_to_day():
+    assert KpiService.window(datetime(2024, 3, 1, 15), datetime(2024, 3, 31, 8)) == (date(2024, 3, 1), date(2024, 4, 1))
+
+
+def test_requests_read_only_aggregate_tiers():
+    service = _service()
+    service.get_overview(datetime(2024, 1, 17), datetime(2024, 4, 10))
+    service.get_by_phase(datetime(2024, 1, 17), datetime(2024, 4, 10), fase_id=3)
+    service.get_by_product(datetime(2024, 1, 17), datetime(2024, 4, 10), produto_id=9)
+    tables = {t for sql in service.engine.log for t in re.findall(r"FROM (\w+)", sql)}
+    tables.discard("tiers")
+    assert tables and all(t.startswith("agg_") for t in tables)
+    assert any(t.endswith("_rollup") for t in tables)
+
+
+def test_by_product_combines_moments_sketch_and_hll():
+    service = _service()
+    canned = {
+        "order_stats": [(9, 2, 14400.0, 3600.0 ** 2 + 10800.0 ** 2, 1, 1)],  # lead times 1 h, 3 h
+        "order_leadtime_sketch": [(9, bucket_of(3600.0), 1), (9, bucket_of(10800.0), 1)],
+        "phase_stats": [],
+        "phase_duration_sketch": [],
+        "quality_stats": [(9, 4, 10)],
+        "quality_orders_hll": [(9, 17, 1), (9, 400, 2)],
+    }
+    service._rows = lambda name, start, end, group_by, *args: canned[name]
+
+    product = service.get_by_product(produto_id=9)["by_product"][0]
+    assert product["produto_id"] == 9
+    orders = product["orders"]
+    assert orders["order_count"] == 2 and orders["avg_leadtime_hours"] == 2.0 and orders["std_leadtime_hours"] == 1.0
+    assert orders["on_time_rate"] == 0.5
+    assert orders["p50_leadtime_hours"] == round(bucket_value(bucket_of(3600.0)) / 3600.0, 3)
+    assert product["phases"]["phase_count"] == 0
+    quality = product["quality"]
+    assert quality["error_count"] == 4 and quality["avg_gravidade"] == 2.5
+    assert quality["affected_orders"] == 2 and quality["affected_orders_low"] == 2
@@ -0,0 +1,71 @@
+"""Tests for FK-ordered parallel scheduling in CoreMerger.merge_all."""
+import threading
+import time
+
+import pytest
+
+from app.ingestion.merge import CoreMerger, MergeConfig
+
+
+class RecordingMerger(CoreMerger):
+    """CoreMerger whose merge_sheet only records timing (no database)."""
+
+    def __init__(self, max_parallel, fail=None):
+        super().__init__("postgresql+psycopg2://u:p@db:1/x", 1, max_parallel=max_parallel)
+        self.fail = fail or set()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def merge_sheet(self, cfg):
+        with self._lock:
+            self.events.append(("start", cfg.sheet_name, time.perf_counter()))
+        time.sleep(0.05)
+        if cfg.sheet_name in self.fail:
+            raise RuntimeError(f"boom {cfg.sheet_name}")
+        with self._lock:
+            self.events.append(("end", cfg.sheet_name, time.perf_counter()))
+        return {"sheet_name": cfg.sheet_name, "processed": 1, "rejected": 0}
+
+    def times(self, kind):
+        return {name: t for k, name, t in self.events if k == kind}
+
+
+def _cfg(name):
+    return MergeConfig(name, f"staging.{name}", name, ["id"], {"id": "id"})
+
+
+DEPS = {
+    "Fases": [],
+    "Modelos": [],
+    "Funcionarios": [],
+    "OrdensFabrico": ["Fases", "Modelos"],
+    "FasesOrdemFabrico": ["OrdensFabrico", "Fases"],
+    "FuncionariosFaseOrdemFabrico": ["Funcionarios"],
+}
+
+
+def test_parents_finish_before_children_start():
+    merger = RecordingMerger(max_parallel=3)
+    results = merger._merge_dag([_cfg(name) for name in DEPS], DEPS)
+
+    assert set(results) == set(DEPS)
+    starts, ends = merger.times("start"), merger.times("end")
+    for child, parents in DEPS.items():
+        for parent in parents:
+            assert ends[parent] <= starts[child]
+    # Independent masters overlap
+    assert starts["Modelos"] < ends["Fases"] and starts["Funcionarios"] < ends["Fases"]
+
+
+def test_failure_stops_dependants():
+    merger = RecordingMerger(max_parallel=3, fail={"OrdensFabrico"})
+    with pytest.raises(RuntimeError, match="OrdensFabrico"):
+        merger._merge_dag([_cfg(name) for name in DEPS], DEPS)
+    assert "FasesOrdemFabrico" not in merger.times("start")
+
+
+def test_cycle_falls_back_to_config_order():
+    merger = RecordingMerger(max_parallel=2)
+    deps = {"A": ["B"], "B": ["A"]}
+    results = merger._merge_dag([_cfg("A"), _cfg("B")], deps)
+    assert set(results) == {"A", "B"}
@@ -0,0 +1,101 @@
+"""Tests for the change-aware, parallel materialized view refresh."""
+import threading
+
+from app.analytics.mv_refresh import MATERIALIZED_VIEWS, MaterializedViewRefresher
+
+
+class _Result:
+    def __init__(self, value=None, rows=()):
+        self.value, self.rows = value, list(rows)
+
+    def scalar(self):
+        return self.value
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class _Conn:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        sql, params = str(query), params or {}
+        db = self.db
+        if "REFRESH MATERIALIZED VIEW" in sql:
+            db.barrier.wait()  # both refreshes must be in flight at once
+            db.refreshed.append(sql.split()[-1])
+            return _Result()
+        if "MAX(run_id)" in sql:
+            return _Result(db.latest_run)
+        if "pg_stat_user_tables" in sql:
+            return _Result(db.markers[params["table_name"]])
+        if "FROM mv_refresh_state" in sql:
+            return _Result(rows=[(mv, *state) for mv, state in db.states.items() if mv in params["views"]])
+        if "SELECT EXISTS" in sql:
+            return _Result(any(run > params["last_run_id"] and table in params["sources"] for run, table in db.log))
+        db.writes.append((sql, params))
+        return _Result()
+
+    def commit(self):
+        pass
+
+
+class _Engine:
+    def __init__(self):
+        self.latest_run = 12
+        self.log = [(12, "erros_ordem_fabrico")]
+        self.markers = {"fases_ordem_fabrico": 100, "ordens_fabrico": 50, "modelos": 7, "erros_ordem_fabrico": 9}
+        # last_run_id, source_marker, age (s)
+        self.states = {
+            "mv_phase_durations_by_model": (11, 157, 60.0),   # unchanged
+            "mv_order_leadtime_by_model": (11, 150, 60.0),    # marker moved: non-feed writer
+            "mv_quality_by_phase": (11, 9, 60.0),             # run 12 touched erros
+            "mv_wip_by_phase_current": (11, 100, 60.0),       # unchanged, not old enough
+        }
+        self.barrier = threading.Barrier(2, timeout=5)
+        self.refreshed, self.writes = [], []
+
+    def connect(self):
+        return _Conn(self)
+
+
+def test_plan_skips_views_whose_inputs_did_not_change():
+    plan = MaterializedViewRefresher(engine=_Engine()).plan()
+    assert {mv: p["reason"] for mv, p in plan.items()} == {
+        "mv_phase_durations_by_model": "unchanged",
+        "mv_order_leadtime_by_model": "source_changed",
+        "mv_quality_by_phase": "ingestion_runs",
+        "mv_wip_by_phase_current": "unchanged",
+    }
+    assert plan["mv_order_leadtime_by_model"]["marker"] == 157 and plan["mv_quality_by_phase"]["run_id"] == 12
+
+
+def test_plan_refreshes_new_and_time_dependent_views():
+    engine = _Engine()
+    del engine.states["mv_quality_by_phase"]
+    engine.states["mv_wip_by_phase_current"] = (12, 100, MATERIALIZED_VIEWS["mv_wip_by_phase_current"][1] + 1.0)
+    plan = MaterializedViewRefresher(engine=engine).plan()
+    assert plan["mv_quality_by_phase"]["reason"] == "never_refreshed"
+    assert plan["mv_wip_by_phase_current"]["reason"] == "max_age"
+    assert all(p["refresh"] for p in MaterializedViewRefresher(engine=engine).plan(force=True).values())
+
+
+def test_refresh_runs_changed_views_in_parallel_and_records_state():
+    engine = _Engine()
+    results = MaterializedViewRefresher(engine=engine).refresh()
+    assert sorted(engine.refreshed) == ["mv_order_leadtime_by_model", "mv_quality_by_phase"]
+    assert results["mv_phase_durations_by_model"]["status"] == "skipped"
+    assert results["mv_quality_by_phase"]["status"] == "refreshed"
+
+    recorded = {params["mv_name"]: (sql, params) for sql, params in engine.writes}
+    sql, params = recorded["mv_quality_by_phase"]
+    assert "INSERT INTO mv_refresh_state" in sql and params["run_id"] == 12 and params["marker"] == 9
+    sql, params = recorded["mv_wip_by_phase_current"]
+    assert "last_status = 'skipped'" in sql and params["run_id"] == 12
@@ -0,0 +1,144 @@
+"""Tests for TurboIngestionOrchestrator run bookkeeping and options."""
+from structlog.testing import capture_logs
+
+from app.ingestion import orchestrator_turbo
+from app.ingestion.orchestrator_turbo import TurboIngestionOrchestrator
+
+
+class _Result:
+    def __init__(self, row=None):
+        self.row = row
+
+    def fetchone(self):
+        return self.row
+
+    def scalar(self):
+        return self.row[0]
+
+
+class _Session:
+    """Fake session over ingestion_runs: one completed run for the workbook."""
+
+    runs = []
+    statements = []
+
+    def __init__(self, engine):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        sql = str(query)
+        self.statements.append((sql, params))
+        if "SELECT run_id, status" in sql:
+            matches = [r for r in self.runs if r[2] == params["checksum"]]
+            return _Result(matches[-1][:2] if matches else None)
+        if "INSERT INTO ingestion_runs" in sql:
+            run_id = max((r[0] for r in self.runs), default=0) + 1
+            self.runs.append((run_id, "running", params["checksum"]))
+            return _Result((run_id,))
+        if "ingestion_sheet_checksums" in sql:
+            return _Result()
+        raise AssertionError(sql)
+
+    def commit(self):
+        pass
+
+
+def _orchestrator(monkeypatch, tmp_path):
+    _Session.runs = [(7, "completed", "abc")]
+    _Session.statements = []
+    monkeypatch.setattr(orchestrator_turbo, "Session", _Session)
+    return TurboIngestionOrchestrator(
+        excel_path=str(tmp_path / "Folha_IA.xlsx"),
+        db_url="postgresql+psycopg2://u:p@db:1/x",
+        processed_dir=tmp_path,
+    )
+
+
+def test_completed_run_is_reused_for_the_same_workbook(monkeypatch, tmp_path):
+    assert _orchestrator(monkeypatch, tmp_path).create_ingestion_run("abc") == 7
+    assert len(_Session.runs) == 1
+
+
+def test_forced_run_gets_a_new_run_id(monkeypatch, tmp_path):
+    run_id = _orchestrator(monkeypatch, tmp_path).create_ingestion_run("abc", force=True)
+    assert run_id == 8
+    assert _Session.runs[-1] == (8, "running", "abc")
+
+
+def test_stream_mode_warns_about_ignored_parallel_flags(tmp_path):
+    with capture_logs() as logs:
+        TurboIngestionOrchestrator(
+            excel_path=str(tmp_path / "Folha_IA.xlsx"),
+            db_url="postgresql+psycopg2://u:p@db:1/x",
+            processed_dir=tmp_path,
+            binary_copy=True,
+            load_parallel=4,
+        )
+    assert [log["event"] for log in logs] == ["stream_load_ignores_parallel_flags"]
+    assert logs[0]["load_parallel"] == 4
+
+
+# FK parents as CoreMerger.sheet_dependencies reports them
+DEPENDENCIES = {
+    "Modelos": [],
+    "OrdensFabrico": ["Modelos"],
+    "FasesOrdemFabrico": ["OrdensFabrico"],
+    "OrdemFabricoErros": ["OrdensFabrico"],
+}
+
+
+def _previous(sheets):
+    return {
+        name: {"part_sha256": f"part-{name}", "shared_strings_sha256": "ss", "content_sha256": f"content-{name}"}
+        for name in sheets
+    }
+
+
+def test_parent_only_change_remerges_its_children(monkeypatch, tmp_path):
+    orchestrator = _orchestrator(monkeypatch, tmp_path)
+    previous = _previous(DEPENDENCIES)
+    # Only OrdensFabrico changed, e.g. it now has the orders a previous run's errors pointed at
+    parts = {"sheets": {name: f"part-{name}" for name in DEPENDENCIES}, "shared_strings": "ss"}
+    parts["sheets"]["OrdensFabrico"] = "part-new"
+
+    plan = orchestrator.plan_sheets(parts, previous, DEPENDENCIES)
+    assert plan == {
+        "Modelos": "unchanged",
+        "OrdensFabrico": "extract",
+        "FasesOrdemFabrico": "extract",
+        "OrdemFabricoErros": "extract",
+    }
+
+    extracted = {name: {"checksum": f"content-{name}"} for name, action in plan.items() if action == "extract"}
+    extracted["OrdensFabrico"]["checksum"] = "content-new"
+    changed = orchestrator.select_changed_sheets(extracted, previous, DEPENDENCIES)
+    # Children with unchanged content are merged again so their missing rows are filled in
+    assert set(changed) == {"OrdensFabrico", "FasesOrdemFabrico", "OrdemFabricoErros"}
+
+    # Parent extracted but its content unchanged: nothing to re-merge
+    extracted["OrdensFabrico"]["checksum"] = "content-OrdensFabrico"
+    assert orchestrator.select_changed_sheets(extracted, previous, DEPENDENCIES) == {}
+
+
+def test_sheet_with_rejects_or_drops_loses_its_checksum(monkeypatch, tmp_path):
+    orchestrator = _orchestrator(monkeypatch, tmp_path)
+    parts = {"sheets": {"OrdensFabrico": "p1", "OrdemFabricoErros": "p2"}, "shared_strings": "ss"}
+    extraction = {"sheets": {"OrdensFabrico": {"checksum": "c1"}, "OrdemFabricoErros": {"checksum": "c2"}}}
+    merge_results = {"results": {
+        "OrdensFabrico": {"staging_count": 5, "processed": 5, "rejected": 0},
+        # Errors of orders not in ordens_fabrico are dropped by the merge
+        "OrdemFabricoErros": {"staging_count": 4, "processed": 3, "rejected": 0},
+    }}
+
+    orchestrator.save_sheet_checksums(9, parts, extraction, merge_results)
+    (delete_sql, delete_params), (insert_sql, rows) = _Session.statements
+    assert delete_sql.startswith("DELETE FROM ingestion_sheet_checksums")
+    assert delete_params == {"sheets": ["OrdemFabricoErros"]}
+    assert [row["sheet_name"] for row in rows] == ["OrdensFabrico"]
+    assert TurboIngestionOrchestrator.merge_incomplete({"staging_count": 2, "processed": 1, "rejected": 1})
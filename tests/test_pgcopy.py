@@ -0,0 +1,141 @@
+"""Tests for the PGCOPY binary encoder and the typed extraction stream."""
+import json
+import struct
+from datetime import datetime, date
+
+import openpyxl
+import pytest
+
+from app.ingestion.extract import ExcelExtractor
+from app.ingestion.merge import CoreMerger, MergeConfig
+from app.ingestion.pgcopy import BinaryCopyEncoder, PGCOPY_HEADER, PGCOPY_TRAILER
+
+
+def _fields(encoded: bytes):
+    """Split one encoded tuple into raw field payloads (None for NULL)."""
+    count = struct.unpack('!h', encoded[:2])[0]
+    pos, out = 2, []
+    for _ in range(count):
+        length = struct.unpack('!i', encoded[pos:pos + 4])[0]
+        pos += 4
+        if length == -1:
+            out.append(None)
+        else:
+            out.append(encoded[pos:pos + length])
+            pos += length
+    assert pos == len(encoded)
+    return out
+
+
+class TestBinaryCopyEncoder:
+    """Tests for BinaryCopyEncoder."""
+
+    def test_scalar_encodings(self):
+        encoder = BinaryCopyEncoder(['text', 'int8', 'float8', 'timestamp', 'date'])
+        fields = _fields(encoder.encode_row((' 2073059 ', 12, 1.5, datetime(2000, 1, 1, 0, 0, 1), datetime(2000, 1, 3, 8))))
+        assert fields[0] == b'2073059'
+        assert struct.unpack('!q', fields[1])[0] == 12
+        assert struct.unpack('!d', fields[2])[0] == 1.5
+        assert struct.unpack('!q', fields[3])[0] == 1_000_000
+        assert struct.unpack('!i', fields[4])[0] == 2
+
+    def test_null_semantics_match_text_casts(self):
+        encoder = BinaryCopyEncoder(['text', 'text', 'int8', 'int8', 'int8', 'float8'])
+        fields = _fields(encoder.encode_row(('  ', 'null', 2.5, -3, True, None)))
+        assert fields == [None, None, None, None, None, None]
+
+        # Digit strings are integers, as '^[0-9]+$' in the CSV path
+        assert struct.unpack('!q', _fields(BinaryCopyEncoder(['int8']).encode_row((' 42',)))[0])[0] == 42
+
+    def test_dates_before_epoch(self):
+        encoder = BinaryCopyEncoder(['timestamp', 'date'])
+        fields = _fields(encoder.encode_row((datetime(1999, 12, 31, 23, 59, 59), date(1999, 12, 31))))
+        assert struct.unpack('!q', fields[0])[0] == -1_000_000
+        assert struct.unpack('!i', fields[1])[0] == -1
+
+    def test_row_width(self):
+        encoder = BinaryCopyEncoder(['text', 'int8'])
+        assert _fields(encoder.encode_row(('x',)))[1] is None
+        assert len(_fields(encoder.encode_row(('x', 1, None)))) == 2
+        with pytest.raises(ValueError):
+            encoder.encode_row(('x', 1, 'extra'))
+        with pytest.raises(ValueError):
+            BinaryCopyEncoder(['text', 'uuid'])
+
+    def test_invalid_cells_become_null_and_are_recorded(self):
+        encoder = BinaryCopyEncoder(['text', 'timestamp', 'float8', 'date'])
+        encoder.encode_row(('ok', datetime(2024, 1, 2), 1.0, date(2024, 1, 2)))
+        fields = _fields(encoder.encode_row(('x', '01/02/2024', 'N/A', 'soon')))
+
+        assert fields == [b'x', None, None, None]
+        assert encoder.invalid_cells == [(1, 1, '01/02/2024'), (1, 2, 'N/A'), (1, 3, 'soon')]
+
+
+def test_stream_sheet_binary_matches_csv_checksum(tmp_path):
+    path = tmp_path / "book.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'FuncionariosFaseOrdemFabrico'
+    ws.append(['FuncionarioFaseOf_FaseOfId', 'FuncionarioFaseOf_FuncionarioId', 'FuncionarioFaseOf_Chefe'])
+    for i in range(7):
+        ws.append([2_000_000 + i, 10 + i, i % 2])
+    wb.save(path)
+
+    with ExcelExtractor(str(path), tmp_path / "out") as extractor:
+        list(extractor.stream_sheet_csv('FuncionariosFaseOrdemFabrico'))
+        csv_stats = dict(extractor.sheet_stats['FuncionariosFaseOrdemFabrico'])
+        payload = b''.join(extractor.stream_sheet_binary(
+            'FuncionariosFaseOrdemFabrico', ['text', 'int8', 'int8'], chunk_rows=3
+        ))
+        binary_stats = extractor.sheet_stats['FuncionariosFaseOrdemFabrico']
+
+    assert payload.startswith(PGCOPY_HEADER) and payload.endswith(PGCOPY_TRAILER)
+    assert binary_stats['row_count'] == csv_stats['row_count'] == 7
+    assert binary_stats['checksum'] == csv_stats['checksum']
+    assert binary_stats['invalid_cells'] == []
+
+
+def test_stream_sheet_binary_reports_invalid_cells(tmp_path):
+    path = tmp_path / "book.xlsx"
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'OrdensFabrico'
+    ws.append(['Of_Id', 'Of_DataCriacao'])
+    ws.append(['OF1', datetime(2024, 1, 2, 8)])
+    ws.append(['OF2', 'N/A'])
+    wb.save(path)
+
+    with ExcelExtractor(str(path), tmp_path / "out") as extractor:
+        payload = b''.join(extractor.stream_sheet_binary('OrdensFabrico', ['text', 'timestamp']))
+        stats = extractor.sheet_stats['OrdensFabrico']
+
+    assert payload.endswith(PGCOPY_TRAILER)
+    assert stats['row_count'] == 2
+    assert stats['invalid_cells'] == [
+        {'row': 2, 'column': 'Of_DataCriacao', 'type': 'timestamp', 'value': 'N/A'}
+    ]
+
+
+
+class _Cursor:
+    def __init__(self):
+        self.calls = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+        self.rowcount = len(json.loads(params[2]))
+
+
+def test_merge_records_invalid_cells_as_rejects():
+    cells = ({'row': 2, 'column': 'Of_DataCriacao', 'type': 'timestamp', 'value': 'N/A'},)
+    cfg = MergeConfig("OrdensFabrico", "staging.ordens_fabrico_typed", "ordens_fabrico", ["of_id"], {},
+                      typed=True, invalid_cells=cells)
+    cur = _Cursor()
+    merger = CoreMerger("postgresql+psycopg2://u:p@db:1/x", 42)
+
+    assert merger._insert_invalid_cell_rejects(cur, "public.ordens_fabrico_rejects", cfg) == 1
+    sql, params = cur.calls[0]
+    assert "INSERT INTO public.ordens_fabrico_rejects" in sql and "'INVALID_VALUE'" in sql
+    assert params[:2] == [42, "OrdensFabrico"] and json.loads(params[2]) == list(cells)
+    assert merger._insert_invalid_cell_rejects(cur, "x", MergeConfig("Fases", "s", "c", [], {})) == 0
@@ -0,0 +1,59 @@
+"""Tests for the mergeable log-bucket quantile sketches."""
+import random
+
+import pytest
+
+from app.analytics.incremental_aggregates import IncrementalAggregates
+from app.analytics.quantile_sketch import (
+    RELATIVE_ACCURACY, QuantileSketch, bucket_of, bucket_value, window_quantiles_sql,
+)
+
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_bucket_value_is_within_accuracy():
+    for value in (1.0, 1.5, 59.0, 3600.0, 86_400.0 * 30):
+        assert abs(bucket_value(bucket_of(value)) - value) <= RELATIVE_ACCURACY * value * (1 + 1e-9)
+
+
+@pytest.mark.parametrize("q", [0.0, 0.5, 0.9, 0.95, 1.0])
+def test_merged_days_match_exact_quantiles(q):
+    rng = random.Random(7)
+    days = [[rng.lognormvariate(8, 1.2) for _ in range(rng.randint(1, 400))] for _ in range(30)]
+    merged = QuantileSketch()
+    for values in days:
+        day = QuantileSketch()
+        for value in values:
+            day.add(value)
+        merged.merge(day)
+
+    every_value = [v for values in days for v in values]
+    assert merged.count == len(every_value)
+    exact = _exact(every_value, q)
+    assert abs(merged.quantile(q) - exact) <= RELATIVE_ACCURACY * exact * (1 + 1e-9)
+
+
+def test_from_rows_adds_counts_and_empty_sketch_has_no_quantile():
+    assert QuantileSketch.from_rows([(5, 2), (3, 1), (5, 4)]).counts == {5: 6, 3: 1}
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_window_sql_merges_by_group_and_bucket():
+    sql = window_quantiles_sql("phase_duration", (0.5, 0.9), "snapshot_date >= :start_date")
+    assert "FROM agg_phase_duration_sketch_daily" in sql
+    assert "GROUP BY produto_id, fase_id, bucket" in sql
+    assert "cum_n > 0.9 * (total_n - 1)" in sql
+    assert "AS p50_seconds" in sql and "AS p90_seconds" in sql
+
+
+def test_sketches_use_the_daily_aggregate_filters():
+    for sketch, stats in (("_phase_duration_sketch_sql", "_phase_stats_sql"),
+                          ("_order_leadtime_sketch_sql", "_order_stats_sql")):
+        sketch_sql = getattr(IncrementalAggregates, sketch)(":snapshot_date", "TRUE")
+        stats_sql = getattr(IncrementalAggregates, stats)(":snapshot_date", "TRUE")
+        sketch_where = sketch_sql.split("WHERE", 1)[1].split("GROUP BY")[0]
+        assert sketch_where == stats_sql.split("WHERE", 1)[1].split("GROUP BY")[0]
+        assert "n = " in sketch_sql.split("DO UPDATE SET")[1]
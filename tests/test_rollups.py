@@ -0,0 +1,119 @@
+"""Tests for the weekly/monthly rollup tiers and the window planner."""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.analytics.rollups import (
+    ROLLUPS, WATERMARK_MARGIN, KpiRollups, next_period, period_start, plan_window, window_sql,
+)
+
+
+def _days(segments):
+    covered = []
+    for tier, seg_from, seg_to in segments:
+        if tier != "day":
+            assert period_start(seg_from, tier) == seg_from and period_start(seg_to, tier) == seg_to
+        covered.extend(seg_from + timedelta(days=i) for i in range((seg_to - seg_from).days))
+    return covered
+
+
+def test_plan_uses_months_then_weeks_then_days():
+    # Wed 2024-01-17 .. Thu 2024-04-11 (exclusive)
+    assert plan_window(date(2024, 1, 17), date(2024, 4, 11)) == [
+        ("day", date(2024, 1, 17), date(2024, 1, 22)),
+        ("week", date(2024, 1, 22), date(2024, 1, 29)),
+        ("day", date(2024, 1, 29), date(2024, 2, 1)),  # next week straddles Feb 1
+        ("month", date(2024, 2, 1), date(2024, 4, 1)),
+        ("week", date(2024, 4, 1), date(2024, 4, 8)),
+        ("day", date(2024, 4, 8), date(2024, 4, 11)),
+    ]
+
+
+@pytest.mark.parametrize("offset, length", [(0, 1), (3, 6), (0, 7), (5, 40), (11, 400), (30, 95)])
+def test_plan_covers_window_exactly_once(offset, length):
+    start = date(2023, 12, 1) + timedelta(days=offset)
+    end = start + timedelta(days=length)
+    days = _days(plan_window(start, end))
+    assert days == [start + timedelta(days=i) for i in range(length)]
+
+
+def test_next_period_handles_month_lengths():
+    assert next_period(date(2024, 1, 1), "month") == date(2024, 2, 1)
+    assert next_period(date(2024, 2, 1), "month") == date(2024, 3, 1)
+    assert next_period(date(2024, 12, 1), "month") == date(2025, 1, 1)
+    assert period_start(date(2024, 3, 7), "week") == date(2024, 3, 4)
+
+
+def test_window_sql_merges_tiers_with_measure_functions():
+    sql, params = window_sql("phase_stats", date(2024, 1, 17), date(2024, 4, 11), group_by=["fase_id"])
+    assert sql.count("UNION ALL") == len(params) // 2 - 1
+    assert "period = 'month'" in sql and "period = 'week'" in sql
+    assert "MIN(min_duration_seconds)" in sql and "GROUP BY fase_id" in sql
+    with pytest.raises(ValueError):
+        window_sql("order_stats", date(2024, 1, 1), date(2024, 2, 1), group_by=["fase_id"])
+
+
+class _Result:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def fetchall(self):
+        return self.rows
+
+
+class _Conn:
+    def __init__(self, log, days):
+        self.log, self.days = log, days
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.log.append((str(query), params))
+        if "GROUP BY snapshot_date" in str(query):
+            return _Result(self.days)
+        return _Result()
+
+    def commit(self):
+        pass
+
+
+class _Engine:
+    def __init__(self, days):
+        self.log, self.days = [], days
+
+    def connect(self):
+        return _Conn(self.log, self.days)
+
+
+def test_refresh_rerolls_only_touched_periods():
+    t1, t2 = datetime(2024, 3, 1, 8, 0), datetime(2024, 3, 1, 9, 0)
+    touched = [(date(2024, 2, 29), t1), (date(2024, 3, 1), t2)]  # Thu, Fri: one week, two months
+    engine = _Engine(touched)
+    results = KpiRollups(engine=engine).refresh(run_id=3)
+    assert results["phase"] == {"days": 2, "week": 1, "month": 2}
+
+    inserts = [(sql, params) for sql, params in engine.log if sql.lstrip().startswith("INSERT INTO agg_")]
+    assert len(inserts) == len(ROLLUPS) * 2  # every rollup, week + month
+    week = [p for sql, p in inserts if p["period"] == "week"][0]
+    assert week["starts"] == [date(2024, 2, 26)]
+    month = [p for sql, p in inserts if p["period"] == "month"][0]
+    assert month["starts"] == [date(2024, 2, 1), date(2024, 3, 1)]
+    assert month["range_end"] == date(2024, 4, 1)
+    watermarks = [p for sql, p in engine.log if "analytics_watermarks (mv_name" in sql]
+    assert {p["mv_name"] for p in watermarks} == {"rollup.phase", "rollup.order", "rollup.quality"}
+    # Kept behind the newest updated_at: upserts still committing are re-read next time
+    assert all(p["last_ts"] == t2 - WATERMARK_MARGIN and p["run_id"] == 3 for p in watermarks)
+
+
+def test_refresh_serializes_each_family_with_an_advisory_lock():
+    engine = _Engine([])
+    KpiRollups(engine=engine).refresh()
+    locks = [p["mv_name"] for sql, p in engine.log if "pg_advisory_xact_lock" in sql]
+    assert locks == ["rollup.phase", "rollup.order", "rollup.quality"]
+    # The lock is taken before the daily tier is read
+    first_read = next(i for i, (sql, _) in enumerate(engine.log) if "GROUP BY snapshot_date" in sql)
+    assert "pg_advisory_xact_lock" in engine.log[first_read - 1][0]
@@ -0,0 +1,73 @@
+"""Tests for the fingerprint-keyed schema metadata cache."""
+import pytest
+
+from app.ingestion import schema_cache
+from app.ingestion.schema_cache import SchemaMetadataCache
+
+
+class FakeCursor:
+    """Answers the fingerprint queries with a configurable catalog state."""
+
+    def __init__(self, revision="009_core_row_hash", catalog=("rels", "attrs", "idx")):
+        self.revision = revision
+        self.catalog = catalog
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if "to_regclass" in sql:
+            self._result = ("alembic_version",)
+        elif "alembic_version" in sql:
+            self._result = (self.revision,)
+        else:
+            self._result = self.catalog
+
+    def fetchone(self):
+        return self._result
+
+
+@pytest.fixture(autouse=True)
+def _clear_memory():
+    schema_cache._MEMORY.clear()
+    yield
+    schema_cache._MEMORY.clear()
+
+
+def test_entries_reused_across_instances_and_runs(tmp_path):
+    path = tmp_path / "schema_metadata_cache.json"
+    cache = SchemaMetadataCache(path)
+    cache.refresh(FakeCursor())
+    assert cache.get("columns", "public.modelos") == (False, None)
+    cache.put("columns", "public.modelos", {"produto_id": {"udt": "int4", "nullable": False}})
+    cache.save()
+
+    # Same process: in-memory hit
+    other = SchemaMetadataCache()
+    other.refresh(FakeCursor())
+    assert other.get("columns", "public.modelos")[0]
+
+    # New process: loaded from the JSON file
+    schema_cache._MEMORY.clear()
+    reloaded = SchemaMetadataCache(path)
+    reloaded.refresh(FakeCursor())
+    found, value = reloaded.get("columns", "public.modelos")
+    assert found and value["produto_id"]["udt"] == "int4"
+    assert reloaded.stats()["hits"] == 1
+
+
+def test_migration_invalidates(tmp_path):
+    path = tmp_path / "schema_metadata_cache.json"
+    cache = SchemaMetadataCache(path)
+    cache.refresh(FakeCursor())
+    cache.put("tables", "modelos|public,core", "public.modelos")
+    cache.save()
+
+    schema_cache._MEMORY.clear()
+    after_migration = SchemaMetadataCache(path)
+    after_migration.refresh(FakeCursor(revision="010_next"))
+    assert after_migration.get("tables", "modelos|public,core") == (False, None)
+
+    # Catalog change without a new revision (manual DDL) also invalidates
+    changed = SchemaMetadataCache(path)
+    changed.refresh(FakeCursor(catalog=("rels", "attrs2", "idx")))
+    assert changed.fingerprint != cache.fingerprint
+    assert changed.get("tables", "modelos|public,core") == (False, None)
@@ -0,0 +1,67 @@
+"""Tests for SmartInventoryService WIP reads."""
+from app.services.smartinventory import SmartInventoryService
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _Conn:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        sql = str(query)
+        self.engine.queries.append(sql)
+        if "FROM agg_wip_current" in sql:
+            return _Result(self.engine.agg_rows)
+        return _Result(self.engine.raw_rows)
+
+    def rollback(self):
+        pass
+
+
+class _Engine:
+    def __init__(self, agg_rows, raw_rows=()):
+        self.agg_rows, self.raw_rows = list(agg_rows), list(raw_rows)
+        self.queries = []
+
+    def connect(self):
+        return _Conn(self)
+
+
+def _service(engine):
+    service = SmartInventoryService.__new__(SmartInventoryService)
+    service.engine = engine
+    return service
+
+
+def test_wip_is_served_from_the_moments():
+    engine = _Engine([(10, 3, 5.0, 1.0, 9.0, 2.0)])
+    wip = _service(engine).get_wip()
+
+    assert wip["wip_by_phase"] == [{"fase_id": 10, "wip_count": 3, "avg_age_hours": 5.0}]
+    assert wip["total_wip"] == 3
+    assert len(engine.queries) == 1
+    assert "sum_start_epoch" in engine.queries[0]
+
+
+def test_wip_by_product_falls_back_to_raw_rows_when_aggregate_empty():
+    engine = _Engine([], [(10, 7, 2, 4.5)])
+    wip = _service(engine).get_wip(produto_id=7)
+
+    assert wip["wip_by_phase_and_product"] == [
+        {"fase_id": 10, "produto_id": 7, "wip_count": 2, "avg_age_hours": 4.5}
+    ]
+    assert "GROUP BY fase_id, produto_id" in engine.queries[0]
+    assert "FROM fases_ordem_fabrico" in engine.queries[1]
@@ -0,0 +1,151 @@
+"""Tests for the native streaming XLSX reader."""
+import zipfile
+from datetime import datetime, time, timedelta
+
+import openpyxl
+import pytest
+
+from app.ingestion.xlsx_reader import XlsxReader, _column_index
+
+
+# cellXfs: 0 = General, 1 = built-in date (14), 2 = custom elapsed time (164)
+STYLES = (
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="[h]:mm:ss"/></numFmts>'
+    '<fonts count="1"><font/></fonts><fills count="1"><fill><patternFill patternType="none"/></fill></fills><borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0"/><xf numFmtId="14" applyNumberFormat="1"/>'
+    '<xf numFmtId="164" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+)
+
+
+def _write_xlsx(path, sheet_rows_xml, shared_strings=(), date1904=False):
+    """Write a minimal .xlsx with a single sheet named 'FasesOrdemFabrico' (openpyxl can load it too)."""
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_ns = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    ct = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+    rel_type = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    wbpr = '<workbookPr date1904="1"/>' if date1904 else ''
+    sst = ''.join(f'<si><t>{s}</t></si>' for s in shared_strings)
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('[Content_Types].xml',
+                   '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   f'<Override PartName="/xl/workbook.xml" ContentType="{ct}.sheet.main+xml"/>'
+                   f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{ct}.worksheet+xml"/>'
+                   f'<Override PartName="/xl/sharedStrings.xml" ContentType="{ct}.sharedStrings+xml"/>'
+                   f'<Override PartName="/xl/styles.xml" ContentType="{ct}.styles+xml"/>'
+                   '</Types>')
+        z.writestr('_rels/.rels',
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   f'<Relationship Id="rId1" Type="{rel_type}/officeDocument" Target="xl/workbook.xml"/>'
+                   '</Relationships>')
+        z.writestr('xl/workbook.xml',
+                   f'<workbook {ns} {rel_ns}>{wbpr}<sheets>'
+                   f'<sheet name="FasesOrdemFabrico" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        z.writestr('xl/_rels/workbook.xml.rels',
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   f'<Relationship Id="rId1" Type="{rel_type}/worksheet" Target="worksheets/sheet1.xml"/>'
+                   f'<Relationship Id="rId2" Type="{rel_type}/sharedStrings" Target="sharedStrings.xml"/>'
+                   f'<Relationship Id="rId3" Type="{rel_type}/styles" Target="styles.xml"/>'
+                   '</Relationships>')
+        z.writestr('xl/sharedStrings.xml', f'<sst {ns}>{sst}</sst>')
+        z.writestr('xl/styles.xml', f'<styleSheet {ns}>{STYLES}</styleSheet>')
+        z.writestr('xl/worksheets/sheet1.xml',
+                   f'<worksheet {ns}><dimension ref="A1:C4"/><sheetData>{sheet_rows_xml}</sheetData></worksheet>')
+
+
+def _openpyxl_rows(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=False)
+    try:
+        return [tuple(row) for row in wb["FasesOrdemFabrico"].iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+
+def _native_rows(path):
+    with XlsxReader(str(path)) as reader:
+        return list(reader.iter_rows("FasesOrdemFabrico"))
+
+
+class TestXlsxReader:
+    """Tests for XlsxReader."""
+
+    def test_column_index(self):
+        assert _column_index("A1") == 0
+        assert _column_index("Z9") == 25
+        assert _column_index("AB12") == 27
+
+    def test_iter_rows_values(self, tmp_path):
+        path = tmp_path / "book.xlsx"
+        rows = (
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c></row>'
+            '<row r="2"><c r="A2"><v>2073059</v></c><c r="B2" s="1"><v>44173.5</v></c><c r="C2"><v>1.5</v></c></row>'
+            '<row r="4"><c r="A4" t="inlineStr"><is><t>x</t></is></c><c r="C4" t="b"><v>1</v></c></row>'
+        )
+        _write_xlsx(path, rows, shared_strings=("FaseOf_Id", "FaseOf_Inicio", "FaseOf_Peso"))
+
+        with XlsxReader(str(path)) as reader:
+            assert reader.sheetnames == ["FasesOrdemFabrico"]
+            assert reader.max_row("FasesOrdemFabrico") == 4
+
+            header = list(next(reader.iter_rows("FasesOrdemFabrico", max_row=1)))
+            assert header == ["FaseOf_Id", "FaseOf_Inicio", "FaseOf_Peso"]
+
+            data = list(reader.iter_rows("FasesOrdemFabrico", min_row=2))
+
+        assert data == [
+            (2073059, datetime(2020, 12, 8, 12, 0), 1.5),
+            (None, None, None),
+            ("x", None, True),
+        ]
+
+    def test_date1904_epoch(self, tmp_path):
+        path = tmp_path / "book1904.xlsx"
+        _write_xlsx(path, '<row r="1"><c r="A1" s="1"><v>1</v></c></row>', date1904=True)
+
+        assert _native_rows(path) == [(datetime(1904, 1, 2), None, None)]
+        assert _native_rows(path) == _openpyxl_rows(path)
+
+    def test_empty_value_is_none(self, tmp_path):
+        path = tmp_path / "empty.xlsx"
+        _write_xlsx(path, '<row r="1"><c r="A1"><v></v></c><c r="B1" t="s"><v/></c><c r="C1"><v>3</v></c></row>')
+
+        assert _native_rows(path) == [(None, None, 3)]
+        assert _native_rows(path) == _openpyxl_rows(path)
+
+    def test_formulas_match_openpyxl(self, tmp_path):
+        path = tmp_path / "formulas.xlsx"
+        rows = (
+            '<row r="1"><c r="A1"><f>B1*2</f><v>8</v></c><c r="B1"><v>4</v></c>'
+            '<c r="C1" t="str"><f>"x"&amp;B1</f><v>x4</v></c></row>'
+            '<row r="2"><c r="A2"><f t="shared" ref="A2:A3" si="0">B2+1</f><v>2</v></c></row>'
+            '<row r="3"><c r="A3"><f t="shared" si="0"/><v>3</v></c></row>'
+        )
+        _write_xlsx(path, rows)
+
+        native = _native_rows(path)
+        assert native[0] == ("=B1*2", 4, '="x"&B1')
+        assert [row[0] for row in native[1:3]] == ["=B2+1", "=B3+1"]
+        assert native == _openpyxl_rows(path)
+
+    def test_numbers_become_dates_only_with_a_date_style(self, tmp_path):
+        path = tmp_path / "styles.xlsx"
+        # Header names of known date columns no longer matter: only the cell style does
+        rows = (
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c></row>'
+            '<row r="2"><c r="A2"><v>44173</v></c><c r="B2" s="1"><v>44173.5</v></c>'
+            '<c r="C2" s="2"><v>1.25</v></c></row>'
+            '<row r="3"><c r="A3" s="1"><v>0.5</v></c></row>'
+        )
+        _write_xlsx(path, rows, shared_strings=("FaseOf_Inicio", "FaseOf_Fim"))
+
+        native = _native_rows(path)
+        assert native[1] == (44173, datetime(2020, 12, 8, 12, 0), timedelta(days=1, hours=6))
+        assert native[2][0] == time(12, 0)
+        assert native == _openpyxl_rows(path)
+
+    def test_missing_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            XlsxReader(str(tmp_path / "missing.xlsx"))